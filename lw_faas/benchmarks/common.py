@@ -0,0 +1,64 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway Django database and
+local runtime hosts. Run benchmarks from the lw_faas/ project directory.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNTIME_HOST = os.path.join(PROJECT_DIR, 'runtime', 'runtime_host.py')
+
+
+def setup_django():
+    """Configure Django against a fresh temporary SQLite database and migrate it."""
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lw_faas.settings')
+
+    import django
+    from django.conf import settings
+
+    db_dir = tempfile.mkdtemp(prefix='lw_faas_bench_')
+    settings.DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(db_dir, 'bench.sqlite3'),
+        'OPTIONS': {'timeout': 30},
+    }
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def write_handler(source):
+    """Write handler source to a temporary file and return its path."""
+    fd, path = tempfile.mkstemp(prefix='bench_handler_', suffix='.py')
+    with os.fdopen(fd, 'w') as f:
+        f.write(source)
+    return path
+
+
+def start_runtime_host(code_path, port, **env):
+    """Start runtime_host.py on `port` and wait until it accepts requests."""
+    proc_env = dict(os.environ, USER_FUNCTION_PATH=code_path, RUNTIME_HOST_PORT=str(port))
+    proc_env.update({key: str(value) for key, value in env.items()})
+    proc = subprocess.Popen([sys.executable, RUNTIME_HOST], env=proc_env, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            # Any HTTP answer (even 404) means the server is up
+            urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}/ready", method='POST'), timeout=1)
+            return proc
+        except urllib.error.HTTPError:
+            return proc
+        except OSError:
+            time.sleep(0.02)
+    proc.terminate()
+    raise RuntimeError(f"Runtime host on port {port} did not start")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent in-flight invocations per gateway process.
+
+Compares the synchronous InvokeView, where every in-flight call holds one of a
+fixed number of worker threads, with AsyncInvokeView, where calls are awaited
+on one event loop. A runtime host runs an `async def` handler that sleeps and
+reports how many calls were in flight when it finished; the peak of those
+values is the gateway's effective concurrency.
+
+Usage (from lw_faas/):
+    python benchmarks/gateway_concurrency.py --requests 200 --threads 8 --sleep 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import setup_django, start_runtime_host, write_handler
+
+HANDLER_SOURCE = '''
+import asyncio
+
+inflight = 0
+
+async def handle(body, context):
+    global inflight
+    inflight += 1
+    try:
+        await asyncio.sleep(body.get('sleep', 0.5))
+        return {"inflight": inflight}
+    finally:
+        inflight -= 1
+'''
+
+
+def create_fixtures(port):
+    from django.contrib.auth.models import User
+    from orchestrator.models import Function, Deployment, WorkerNode, FunctionInstance
+
+    user = User.objects.create_user('bench', password='bench')
+    function = Function.objects.create(name='bench-sleep', code=HANDLER_SOURCE)
+    deployment = Deployment.objects.create(
+        function=function, version=1, code_snapshot=function.code,
+        requirements_snapshot='', entry_point_snapshot='handle', is_active=True,
+    )
+    worker = WorkerNode.objects.create(hostname='bench-worker', ip_address='127.0.0.1',
+                                       max_memory_mb=1024, available_memory_mb=1024)
+    FunctionInstance.objects.create(deployment=deployment, worker=worker, port=port,
+                                    status='RUNNING', max_concurrency=10000)
+    return user
+
+
+def run_sync(user, requests, threads, sleep):
+    from django.db import connection
+    from django.test import Client
+
+    def invoke(_):
+        client = Client()
+        client.force_login(user)
+        try:
+            resp = client.post('/api/gateway/invoke/bench-sleep/', {'sleep': sleep}, content_type='application/json')
+            return resp.json().get('inflight', 0) if resp.status_code == 200 else 0
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        peaks = list(pool.map(invoke, range(requests)))
+    return max(peaks), time.perf_counter() - started, sum(1 for p in peaks if p)
+
+
+async def run_async(user, requests, sleep):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    await client.aforce_login(user)
+
+    async def invoke():
+        resp = await client.post('/api/gateway/ainvoke/bench-sleep/', {'sleep': sleep}, content_type='application/json')
+        return resp.json().get('inflight', 0) if resp.status_code == 200 else 0
+
+    started = time.perf_counter()
+    peaks = await asyncio.gather(*(invoke() for _ in range(requests)))
+    return max(peaks), time.perf_counter() - started, sum(1 for p in peaks if p)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Concurrent invocations to send')
+    parser.add_argument('--threads', type=int, default=8, help='Worker threads available to the sync view')
+    parser.add_argument('--sleep', type=float, default=0.5, help='Seconds each invocation waits in the handler')
+    parser.add_argument('--port', type=int, default=18999)
+    args = parser.parse_args()
+
+    setup_django()
+    host = start_runtime_host(write_handler(HANDLER_SOURCE), args.port, RUNTIME_MAX_CONCURRENCY=args.requests * 2)
+    try:
+        user = create_fixtures(args.port)
+        sync_peak, sync_elapsed, sync_ok = run_sync(user, args.requests, args.threads, args.sleep)
+        async_peak, async_elapsed, async_ok = asyncio.run(run_async(user, args.requests, args.sleep))
+    finally:
+        host.terminate()
+        host.wait()
+
+    print(f"{args.requests} invocations, handler sleep {args.sleep}s")
+    print(f"{'endpoint':<24}{'peak in-flight':>16}{'succeeded':>12}{'wall time (s)':>16}")
+    print(f"{'sync (' + str(args.threads) + ' threads)':<24}{sync_peak:>16}{sync_ok:>12}{sync_elapsed:>16.2f}")
+    print(f"{'async (1 event loop)':<24}{async_peak:>16}{async_ok:>12}{async_elapsed:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
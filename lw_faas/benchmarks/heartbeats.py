@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmark: control-plane database load from worker heartbeats.
+
+Simulates a fleet of worker agents, each with a few running instances, sending
+heartbeats through the real heartbeat view for a number of rounds (one round
+is one heartbeat interval, simulated rather than waited for). Compares the
+previous behaviour, which saved the WorkerNode on every heartbeat, with the
+in-memory registry in orchestrator/liveness.py, which flushes `last_heartbeat`
+once per WORKER_HEARTBEAT_FLUSH_SECONDS. Counts the SQL statements issued,
+split into writes and reads.
+
+Then stops a few workers' heartbeats and runs the failure detector, checking
+that exactly those workers go OFFLINE with their instances in ERROR.
+
+Usage (from lw_faas/):
+    python benchmarks/heartbeats.py --workers 1000 --rounds 24 --interval 5 --flush 10
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import setup_django
+
+INSTANCES_PER_WORKER = 3
+WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class StatementCounter:
+    """connection.execute_wrapper() hook counting statements by kind."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        verb = sql.lstrip().split(None, 1)[0].upper()
+        self.counts['write' if verb in WRITE_VERBS else 'read'] += 1
+        return execute(sql, params, many, context)
+
+
+def create_fleet(workers):
+    from orchestrator.models import CodeBlob, Deployment, Function, FunctionInstance, WorkerNode
+
+    code = "def handle(body, context):\n    return {}\n"
+    function = Function.objects.create(name='heartbeat-bench', code=code, memory_mb=128)
+    deployment = Deployment.objects.create(function=function, version=1, code_blob=CodeBlob.store(code),
+                                           requirements_blob=CodeBlob.store(''), entry_point_snapshot='handle',
+                                           is_active=True)
+    nodes = WorkerNode.objects.bulk_create([
+        WorkerNode(hostname=f"hb-{i:05d}", ip_address='10.0.0.1', max_memory_mb=8192,
+                   available_memory_mb=8192 - 128 * INSTANCES_PER_WORKER, agent_port=7070)
+        for i in range(workers)
+    ], batch_size=500)
+    instances = FunctionInstance.objects.bulk_create([
+        FunctionInstance(deployment=deployment, worker=node, port=20000 + n, memory_mb=128, rss_mb=40.0,
+                         status='RUNNING')
+        for node in nodes for n in range(INSTANCES_PER_WORKER)
+    ], batch_size=500)
+    by_worker = {}
+    for instance in instances:
+        by_worker.setdefault(instance.worker_id, []).append(str(instance.pk))
+    return [(node, by_worker[node.pk]) for node in nodes]
+
+
+def payload(node, instance_ids, round_no):
+    # Resident memory drifts by less than the 1MB reconcile_worker() writes for
+    return {
+        'hostname': node.hostname, 'ip_address': '10.0.0.1', 'agent_port': 7070, 'max_memory_mb': 8192,
+        'instances': [{'instance_id': i, 'state': 'running', 'rss_mb': 40.0 + (round_no % 3) * 0.2}
+                      for i in instance_ids],
+    }
+
+
+def legacy_heartbeat(data):
+    """What the heartbeat view did per heartbeat before the registry: load the worker and save it."""
+    from orchestrator.models import WorkerNode
+    from orchestrator.provisioning import reconcile_worker
+    from django.utils import timezone
+
+    worker, created = WorkerNode.objects.get_or_create(hostname=data['hostname'], defaults={
+        'ip_address': data['ip_address'], 'max_memory_mb': data['max_memory_mb'],
+        'available_memory_mb': data['max_memory_mb'], 'agent_port': data['agent_port'],
+    })
+    if not created:
+        worker.ip_address = data['ip_address']
+        worker.agent_port = data['agent_port']
+        worker.status = 'ONLINE'
+        worker.last_heartbeat = timezone.now()
+        worker.save(update_fields=['ip_address', 'agent_port', 'status', 'last_heartbeat'])
+    reconcile_worker(worker, data['instances'])
+
+
+def run(fleet, rounds, interval, flush, mode):
+    from django.db import connection
+    from rest_framework.test import APIRequestFactory
+    from orchestrator.liveness import worker_registry
+    from runtime.views import WorkerHeartbeatView
+
+    view = WorkerHeartbeatView.as_view()
+    factory = APIRequestFactory()
+    counter = StatementCounter()
+    flush_every = max(1, round(flush / interval))  # Rounds between registry flushes
+    latencies = []
+    with connection.execute_wrapper(counter):
+        for round_no in range(rounds):
+            for node, instance_ids in fleet:
+                data = payload(node, instance_ids, round_no)
+                started = time.perf_counter()
+                if mode == 'legacy':
+                    legacy_heartbeat(data)
+                else:
+                    response = view(factory.post('/api/runtime/heartbeat/', data, format='json'))
+                    assert response.status_code == 200, response.data
+                latencies.append(time.perf_counter() - started)
+            if mode == 'registry' and (round_no + 1) % flush_every == 0:
+                worker_registry.flush()
+    return counter.counts, latencies
+
+
+def detect(fleet, silent):
+    from orchestrator.liveness import worker_registry
+    from orchestrator.models import FunctionInstance, WorkerNode
+
+    silent_ids = {node.pk for node, _ in fleet[:silent]}
+    worker_registry.timeout = 1.0
+    deadline = time.monotonic() + worker_registry.timeout * 1.5
+    round_no = 0
+    while time.monotonic() < deadline:
+        for node, instance_ids in fleet[silent:]:
+            worker_registry.heartbeat(node.hostname, ip_address='10.0.0.1', agent_port=7070, max_memory_mb=8192)
+        round_no += 1
+    worker_registry.flush()
+    started = time.perf_counter()
+    failed = {w.pk for w in worker_registry.detect_failures()}
+    elapsed = time.perf_counter() - started
+    offline = set(WorkerNode.objects.filter(status='OFFLINE').values_list('pk', flat=True))
+    errored = FunctionInstance.objects.filter(status='ERROR', memory_mb=0).count()
+    restored = WorkerNode.objects.filter(pk__in=silent_ids, available_memory_mb=8192).count()
+    return failed == silent_ids == offline, errored, restored, elapsed, round_no
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=1000, help='Simulated worker agents')
+    parser.add_argument('--rounds', type=int, default=24, help='Heartbeat intervals to simulate')
+    parser.add_argument('--interval', type=float, default=5.0, help='Agent heartbeat interval in seconds')
+    parser.add_argument('--flush', type=float, default=10.0, help='Registry flush interval in seconds')
+    parser.add_argument('--silent', type=int, default=10, help='Workers that stop heartbeating for the detector check')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    settings.WORKER_LIVENESS_CHECK_SECONDS = 3600  # The benchmark flushes and detects itself
+    fleet = create_fleet(args.workers)
+
+    simulated = args.rounds * args.interval
+    heartbeats = args.workers * args.rounds
+    print(f"{args.workers} workers x {INSTANCES_PER_WORKER} instances, {args.rounds} heartbeats each "
+          f"({simulated:.0f}s simulated at {args.interval:g}s), registry flush every {args.flush:g}s\n")
+    print(f"{'mode':>10}{'writes':>9}{'writes/s':>10}{'reads':>9}{'stmts/hb':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for mode in ('legacy', 'registry'):
+        counts, latencies = run(fleet, args.rounds, args.interval, args.flush, mode)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"{mode:>10}{counts['write']:>9}{counts['write'] / simulated:>10.1f}{counts['read']:>9}"
+              f"{(counts['write'] + counts['read']) / heartbeats:>10.2f}{p50:>9.2f}{p99:>9.2f}")
+
+    ok, errored, restored, elapsed, rounds = detect(fleet, args.silent)
+    print(f"\nFailure detector: {args.silent} silent workers, {rounds} rounds from the rest; "
+          f"{'marked exactly the silent workers OFFLINE' if ok else 'WRONG workers marked OFFLINE'}, "
+          f"{errored} instances ERROR, memory returned on {restored}, sweep took {elapsed * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
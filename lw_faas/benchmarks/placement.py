@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark: instance placement policies on a simulated fleet.
+
+Registers thousands of synthetic workers of mixed sizes and places instances of
+functions with mixed memory limits and shared requirements through
+orchestrator.scheduler.place(), from several threads at once, for each policy.
+After each placement the worker reports the environment and code as cached,
+and with probability --churn a random running instance is stopped, leaving
+holes across the fleet as scale-down would.
+
+Reports placement throughput and latency, how many workers hold instances, how
+many could still take a large instance, how often the dependency environment
+was already on the chosen worker, and checks that no worker was promised more
+memory than it has.
+
+Usage (from lw_faas/):
+    python benchmarks/placement.py --workers 2000 --instances 3000 --threads 8 --churn 0.4
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import setup_django
+
+WORKER_SIZES_MB = [4096, 8192, 16384]
+FUNCTION_SIZES_MB = [128, 128, 256, 256, 512, 1024, 2048]
+LARGE_INSTANCE_MB = 4096
+
+
+def create_fleet(workers, functions, seed):
+    from orchestrator.models import CodeBlob, Deployment, Function, WorkerNode
+    from runtime.envstore import requirements_hash
+
+    rng = random.Random(seed)
+    WorkerNode.objects.bulk_create([
+        WorkerNode(hostname=f"sim-{i:05d}", ip_address='10.0.0.1', max_memory_mb=size, available_memory_mb=size)
+        for i, size in enumerate(rng.choice(WORKER_SIZES_MB) for _ in range(workers))
+    ], batch_size=500)
+    # A few requirement sets shared by many functions, as in a real fleet
+    requirement_sets = [f"package-{i}==1.0" for i in range(max(1, functions // 10))]
+    deployments = []
+    for i in range(functions):
+        requirements = rng.choice(requirement_sets)
+        code = f"def handle(body, context):\n    return {i}\n"
+        function = Function.objects.create(name=f"sim-fn-{i}", code=code, requirements=requirements,
+                                           memory_mb=rng.choice(FUNCTION_SIZES_MB))
+        deployments.append(Deployment.objects.create(
+            function=function, version=1, code_blob=CodeBlob.store(code),
+            requirements_blob=CodeBlob.store(requirements), requirements_hash=requirements_hash(requirements),
+            entry_point_snapshot='handle', is_active=True,
+        ))
+    return deployments
+
+
+def reset_fleet():
+    from django.db.models import F
+    from orchestrator.models import FunctionInstance, WorkerCacheEntry, WorkerNode
+
+    FunctionInstance.objects.all().delete()
+    WorkerCacheEntry.objects.all().delete()
+    WorkerNode.objects.update(available_memory_mb=F('max_memory_mb'))
+
+
+def run_policy(policy, deployments, instances, threads, churn, seed):
+    from django.db import connection
+    from orchestrator.models import FunctionInstance, WorkerCacheEntry
+    from orchestrator.scheduler import NoWorkerAvailable, place, release_memory
+
+    rng = random.Random(seed)
+    # Popular functions get most of the instances
+    weights = [1.0 / (rank + 1) for rank in range(len(deployments))]
+    requests = [(deployment, rng.random() < churn) for deployment in rng.choices(deployments, weights=weights, k=instances)]
+    ports = itertools.count(20000)
+    lock = threading.Lock()
+    running = []
+    latencies, failures, warm_env = [], [], []
+
+    def place_one(request):
+        deployment, stop_one = request
+        try:
+            started = time.perf_counter()
+            try:
+                placement = place(deployment, policy=policy)
+            except NoWorkerAvailable:
+                failures.append(deployment)
+                return
+            latencies.append(time.perf_counter() - started)
+            warm_env.append(WorkerCacheEntry.objects.filter(
+                worker=placement.worker, kind='env', digest=deployment.requirements_hash
+            ).exists())
+            with lock:
+                port = next(ports)
+            instance = FunctionInstance.objects.create(deployment=deployment, worker=placement.worker, port=port,
+                                                       memory_mb=placement.memory_mb, status='RUNNING')
+            # What the worker's next heartbeat would report
+            WorkerCacheEntry.objects.bulk_create([
+                WorkerCacheEntry(worker=placement.worker, kind='env', digest=deployment.requirements_hash),
+                WorkerCacheEntry(worker=placement.worker, kind='code', digest=deployment.code_blob_id),
+            ], ignore_conflicts=True)
+            with lock:
+                running.append(instance)
+                victim = running.pop(rng.randrange(len(running))) if stop_one and len(running) > 1 else None
+            if victim is not None:
+                victim.delete()
+                release_memory(victim.worker_id, victim.memory_mb)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(place_one, requests))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies, failures, warm_env
+
+
+def fleet_report():
+    from django.db.models import Count, Sum
+    from orchestrator.models import WorkerNode
+
+    workers = list(WorkerNode.objects.annotate(
+        reserved=Sum('functioninstance__memory_mb'), instances=Count('functioninstance')
+    ).values('max_memory_mb', 'available_memory_mb', 'reserved', 'instances'))
+    oversubscribed = sum(1 for w in workers if (w['reserved'] or 0) > w['max_memory_mb'])
+    ledger_mismatch = sum(1 for w in workers if w['max_memory_mb'] - (w['reserved'] or 0) != w['available_memory_mb'])
+    used = sum(1 for w in workers if w['instances'])
+    large_fits = sum(1 for w in workers if w['available_memory_mb'] >= LARGE_INSTANCE_MB)
+    return used, large_fits, oversubscribed, ledger_mismatch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2000, help='Synthetic worker nodes')
+    parser.add_argument('--functions', type=int, default=200, help='Distinct functions (one deployment each)')
+    parser.add_argument('--instances', type=int, default=3000, help='Instances to place per policy')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent placements')
+    parser.add_argument('--churn', type=float, default=0.4, help='Chance that a placement also stops a running instance')
+    parser.add_argument('--policies', nargs='+', default=['best_fit', 'spread', 'affinity'])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    deployments = create_fleet(args.workers, args.functions, args.seed)
+
+    print(f"{args.workers} workers, {args.functions} functions, {args.instances} placements, "
+          f"{args.threads} threads, churn {args.churn}\n")
+    print(f"{'policy':>10}{'placed/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}"
+          f"{'workers busy':>14}{f'fit {LARGE_INSTANCE_MB}MB':>11}{'env warm':>10}{'oversub':>9}")
+    for policy in args.policies:
+        reset_fleet()
+        elapsed, latencies, failures, warm_env = run_policy(
+            policy, deployments, args.instances, args.threads, args.churn, args.seed
+        )
+        used, large_fits, oversubscribed, ledger_mismatch = fleet_report()
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+        warm = sum(warm_env) / len(warm_env) if warm_env else 0
+        print(f"{policy:>10}{len(latencies) / elapsed:>10.0f}{p50:>9.2f}{p99:>9.2f}{len(failures):>8}"
+              f"{used:>14}{large_fits:>11}{warm:>10.0%}{oversubscribed:>9}")
+        if ledger_mismatch:
+            print(f"  WARNING: {ledger_mismatch} workers' available_memory_mb disagrees with their instances")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pre-warm forecasts on synthetic traffic.
+
+Writes several days of invocation logs for functions with different traffic
+shapes, then replays the last day bucket by bucket: before each bucket the
+forecaster from orchestrator/prewarm.py predicts it from the log up to that
+moment, as the planner would PREWARM_LEAD_SECONDS ahead. Compares the time-of-
+day profile alone, the EWMA alone and the blend the planner uses.
+
+Reports forecast error (WAPE: total absolute error over total calls; bias:
+over- or under-forecasting) and, against a reactive scale-to-zero baseline
+where a bucket with calls after an empty one starts with a cold start, the
+share of those cold starts avoided by having an instance planned, and how
+many planned instance-buckets saw no call at all.
+
+Shapes: diurnal (sine over the day), office (busy 09:00-18:00), cron (bursts at
+02:00 and 14:00 only), sparse (a call now and then) and surge (diurnal, twice
+as busy on the replayed day).
+
+Usage (from lw_faas/):
+    python benchmarks/prewarm.py --days 8 --per-shape 4
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import setup_django
+
+SHAPES = ('diurnal', 'office', 'cron', 'sparse', 'surge')
+METHODS = (('profile', 1.0), ('ewma', 0.0), ('blend', None))  # None: PREWARM_PROFILE_WEIGHT
+
+
+def rate(shape, minute_of_day, last_day):
+    """Expected calls in a 15-minute bucket starting at `minute_of_day`."""
+    hour = minute_of_day / 60
+    diurnal = 6 * (1 + 0.8 * math.sin(2 * math.pi * (hour - 9) / 24))
+    if shape == 'diurnal':
+        return diurnal
+    if shape == 'office':
+        return 12.0 if 9 <= hour < 18 else 0.05
+    if shape == 'cron':
+        return 25.0 if minute_of_day in (2 * 60, 14 * 60) else 0.0
+    if shape == 'sparse':
+        return 0.3
+    return diurnal * (2 if last_day else 1)  # surge
+
+
+def poisson(rng, lam):
+    if lam > 30:
+        return max(0, round(rng.gauss(lam, math.sqrt(lam))))
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def write_history(days, per_shape, seed):
+    from django.utils import timezone
+    from orchestrator.models import CodeBlob, Deployment, Function, InvocationRequest
+
+    rng = random.Random(seed)
+    end = timezone.localtime(timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    code = "def handle(body, context):\n    return {}\n"
+    functions, actual = [], defaultdict(dict)
+    rows = []
+    for shape in SHAPES:
+        for n in range(per_shape):
+            function = Function.objects.create(name=f"{shape}-{n}", code=code)
+            deployment = Deployment.objects.create(function=function, version=1, code_blob=CodeBlob.store(code),
+                                                   requirements_blob=CodeBlob.store(''),
+                                                   entry_point_snapshot='handle', is_active=True)
+            functions.append((function, shape))
+            for b in range(days * 96):
+                bucket_start = start + timedelta(minutes=15 * b)
+                last_day = b >= (days - 1) * 96
+                calls = poisson(rng, rate(shape, (b % 96) * 15, last_day))
+                if last_day:
+                    actual[function.pk][bucket_start] = calls
+                for _ in range(calls):
+                    t = bucket_start + timedelta(seconds=rng.uniform(0, 900))
+                    rows.append(InvocationRequest(function=function, deployment=deployment, request_id='bench',
+                                                  start_time=t, end_time=t + timedelta(milliseconds=80),
+                                                  is_cold_start=False, status='SUCCESS'))
+    InvocationRequest.objects.bulk_create(rows, batch_size=2000)
+    return functions, actual, end - timedelta(days=1), len(rows)
+
+
+def replay(functions, actual, day_start, weight, lead_seconds):
+    from django.conf import settings
+    from orchestrator.prewarm import Forecaster
+
+    forecaster = Forecaster(
+        bucket_minutes=15, history_days=settings.PREWARM_HISTORY_DAYS, ewma_alpha=settings.PREWARM_EWMA_ALPHA,
+        ewma_buckets=settings.PREWARM_EWMA_BUCKETS,
+        profile_weight=settings.PREWARM_PROFILE_WEIGHT if weight is None else weight,
+    )
+    results = {function.pk: [] for function, _ in functions}  # (predicted, actual) per bucket
+    for b in range(96):
+        window_start = day_start + timedelta(minutes=15 * b)
+        predictions = forecaster.forecast(window_start, now=window_start - timedelta(seconds=lead_seconds))
+        for function, _ in functions:
+            results[function.pk].append((predictions.get(function.pk, 0.0), actual[function.pk][window_start]))
+    return results
+
+
+def score(series, min_invocations):
+    predicted = sum(p for p, _ in series)
+    calls = sum(a for _, a in series)
+    abs_error = sum(abs(p - a) for p, a in series)
+    cold = avoided = wasted = 0
+    for i, (p, a) in enumerate(series):
+        planned = p >= min_invocations
+        if a and (i == 0 or series[i - 1][1] == 0):
+            cold += 1
+            avoided += planned
+        wasted += planned and not a
+    return predicted, calls, abs_error, cold, avoided, wasted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=8, help='Days of history, the last one replayed')
+    parser.add_argument('--per-shape', type=int, default=4, help='Functions per traffic shape')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    functions, actual, day_start, total = write_history(args.days, args.per_shape, args.seed)
+    print(f"{len(functions)} functions, {total} logged invocations over {args.days} days; replaying the last day "
+          f"in 15-minute buckets, forecasting {settings.PREWARM_LEAD_SECONDS:g}s ahead; an instance is planned "
+          f"for >= {settings.PREWARM_MIN_INVOCATIONS:g} predicted calls\n")
+    print(f"{'method':>8}{'shape':>9}{'WAPE':>7}{'bias':>7}{'cold (reactive)':>17}{'avoided':>9}{'wasted':>8}")
+    for method, weight in METHODS:
+        results = replay(functions, actual, day_start, weight, settings.PREWARM_LEAD_SECONDS)
+        by_shape = defaultdict(lambda: [0] * 6)
+        for function, shape in functions:
+            for i, value in enumerate(score(results[function.pk], settings.PREWARM_MIN_INVOCATIONS)):
+                by_shape[shape][i] += value
+                by_shape['all'][i] += value
+        for shape in SHAPES + ('all',):
+            predicted, calls, abs_error, cold, avoided, wasted = by_shape[shape]
+            wape = f"{abs_error / calls:.0%}" if calls else '-'
+            bias = f"{(predicted - calls) / calls:+.0%}" if calls else '-'
+            avoided_rate = f"{avoided / cold:.0%}" if cold else '-'
+            print(f"{method:>8}{shape:>9}{wape:>7}{bias:>7}{cold:>17}{avoided_rate:>9}{wasted:>8}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
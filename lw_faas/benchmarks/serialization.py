@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-invocation serialization cost, JSON vs raw pass-through.
+
+Times the encode/decode work one invocation does in the gateway and runtime
+host, without the network. The JSON path parses the request with DRF, dumps it
+for the log and proxy, has the runtime host parse it and dump the result, then
+parses the response and renders it again with DRF. The raw paths forward the
+bytes unchanged; with a 'bytes' handler nothing is parsed at all, with the
+default 'json' handler only the runtime host parses and dumps.
+
+Usage (from lw_faas/):
+    python benchmarks/serialization.py --sizes 200 1000000 8000000 --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_payload(size):
+    """A JSON document of roughly `size` bytes made of small records."""
+    record = {"id": 0, "name": "item", "tags": ["a", "b"], "score": 0.5}
+    count = max(1, size // len(json.dumps(record)))
+    return json.dumps({"items": [dict(record, id=i) for i in range(count)]}).encode('utf-8')
+
+
+def json_path(body):
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from runtime.runtime_host import decode_body
+
+    # Gateway: parse, then one dump shared by the log row and the proxied request
+    data = JSONParser().parse(io.BytesIO(body))
+    request_body = json.dumps(data)
+    # Runtime host: parse for the handler, dump its (echoed) result
+    result = decode_body(request_body.encode('utf-8'), 'json')
+    response_body = json.dumps(result).encode('utf-8')
+    # Gateway: resp.json() and resp.text for the log, then DRF renders the response
+    response_data = json.loads(response_body)
+    logged = response_body.decode('utf-8')
+    return JSONRenderer().render(response_data), logged
+
+
+def raw_bytes_path(body):
+    from gateway.services import loggable_body
+    from runtime.runtime_host import decode_body
+
+    # Gateway logs the text; the handler gets and returns bytes; the gateway relays them
+    logged_request = loggable_body(body, 'application/json')
+    result = decode_body(body, 'bytes')
+    return result, logged_request, loggable_body(result, 'application/json')
+
+
+def raw_json_handler_path(body):
+    from gateway.services import loggable_body
+    from runtime.runtime_host import decode_body
+
+    logged_request = loggable_body(body, 'application/json')
+    result = decode_body(body, 'json')
+    response_body = json.dumps(result).encode('utf-8')
+    return response_body, logged_request, loggable_body(response_body, 'application/json')
+
+
+def best_of(func, body, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(body)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 1000000, 8000000],
+                        help='Approximate payload sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (the best is reported)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lw_faas.settings')
+    import django
+    django.setup()
+
+    paths = [('json', json_path), ('raw, bytes handler', raw_bytes_path), ('raw, json handler', raw_json_handler_path)]
+    print(f"{'payload':>12}" + ''.join(f"{name:>22}" for name, _ in paths))
+    for size in args.sizes:
+        body = make_payload(size)
+        # Small payloads are too quick to time individually; report per-invocation averages
+        loops = max(1, 100000 // len(body))
+        cells = []
+        for _, func in paths:
+            elapsed = best_of(lambda b: [func(b) for _ in range(loops)], body, args.repeat) / loops
+            cells.append(f"{elapsed * 1e6:>19.1f} us")
+        print(f"{len(body):>10} B" + ''.join(f"{cell:>22}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FunctionInvocation
+from .models import FunctionInvocation, QueuedInvocation
 
 
 @admin.register(FunctionInvocation)
@@ -7,3 +7,9 @@ class FunctionInvocationAdmin(admin.ModelAdmin):
     list_display = ('id', 'function_name', 'timestamp', 'status')
     list_filter = ('status', 'function_name')
     search_fields = ('function_name',)
+
+
+@admin.register(QueuedInvocation)
+class QueuedInvocationAdmin(admin.ModelAdmin):
+    list_display = ('invocation', 'available_at', 'claimed_by', 'claimed_at', 'attempts')
+    list_filter = ('claimed_by',)
@@ -0,0 +1,201 @@
+"""
+Admission control for warm instances.
+
+Every invocation reserves one of an instance's `max_concurrency` slots (tracked
+by the in-flight counters in gateway/balancer.py). When every warm instance of
+a deployment is full, the request waits in a bounded per-deployment queue for
+up to GATEWAY_QUEUE_MAX_WAIT_SECONDS instead of piling onto a busy instance or
+immediately triggering a cold start. A full queue is rejected with 429; callers
+that time out may cold start or answer 503, both with Retry-After.
+"""
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import APIException, Throttled
+
+from orchestrator.liveness import worker_registry
+
+from .balancer import choose_instance, inflight
+from .logwriter import invocation_writer
+from .metrics import metrics
+from .routing import routing_table
+
+
+class QueueFull(Throttled):
+    default_detail = 'Too many invocations are waiting for this function.'
+
+
+class NoCapacity(APIException):
+    status_code = 503
+    default_detail = 'No function instance is available.'
+    default_code = 'no_capacity'
+
+    def __init__(self, detail=None, wait=None):
+        super().__init__(detail)
+        self.wait = wait  # Rendered as Retry-After by DRF
+
+
+class _WaitQueue:
+    __slots__ = ('cond', 'waiting', 'async_waiters')
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.waiting = 0
+        self.async_waiters = collections.deque()  # (event loop, asyncio.Event) of aacquire() callers
+
+
+class AdmissionController:
+
+    def __init__(self, max_queue_depth=100, max_wait_seconds=2.0, retry_after_seconds=1, poll_seconds=0.05):
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_seconds = max_wait_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.poll_seconds = poll_seconds  # Waiters also re-check periodically for newly registered instances
+        self._queues = {}  # deployment id -> _WaitQueue
+        self._lock = threading.Lock()
+
+    def _queue(self, deployment_id):
+        q = self._queues.get(deployment_id)
+        if q is None:
+            with self._lock:
+                q = self._queues.setdefault(deployment_id, _WaitQueue())
+        return q
+
+    def _take_slot(self, route):
+        # Caller holds the deployment's condition, so check-and-reserve is atomic
+        # Skip workers that went silent, before the failure detector takes them out of the route
+        free = [i for i in route.instances
+                if inflight.get(i.pk) < i.max_concurrency and worker_registry.is_routable(i.worker_id)]
+        instance = choose_instance(route, free)
+        if instance is not None:
+            self._reserve(instance)
+        return instance
+
+    def _enqueue(self, q):
+        if q.waiting >= self.max_queue_depth:
+            metrics.incr('queue.rejected')
+            raise QueueFull(wait=self.retry_after_seconds)
+        q.waiting += 1
+
+    def _finish_wait(self, q, started, instance):
+        with q.cond:
+            q.waiting -= 1
+        metrics.observe('queue.wait_seconds', time.monotonic() - started)
+        if instance is None:
+            metrics.incr('queue.timeouts')
+
+    def acquire(self, route):
+        """
+        Reserve a slot on a warm instance of the route's deployment and return the instance.
+        Waits in the deployment's queue while all instances are full. Returns None when
+        there are no warm instances or the wait timed out; raises QueueFull if the queue is full.
+        """
+        if not route.instances:
+            return None
+        q = self._queue(route.deployment.pk)
+        with q.cond:
+            instance = self._take_slot(route)
+            if instance is not None:
+                return instance
+            self._enqueue(q)
+
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        instance = None
+        try:
+            with q.cond:
+                while instance is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    q.cond.wait(min(remaining, self.poll_seconds))
+                    route = routing_table.get_cached(route.function.name) or route
+                    instance = self._take_slot(route)
+        finally:
+            self._finish_wait(q, started, instance)
+        return instance
+
+    async def aacquire(self, route):
+        """Async variant of acquire() that waits without holding a thread."""
+        if not route.instances:
+            return None
+        q = self._queue(route.deployment.pk)
+        with q.cond:
+            instance = self._take_slot(route)
+            if instance is not None:
+                return instance
+            self._enqueue(q)
+
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        loop = asyncio.get_running_loop()
+        instance = None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                event = asyncio.Event()
+                with q.cond:
+                    # Checked and registered under the lock release() takes, so no wakeup is missed
+                    instance = self._take_slot(route)
+                    if instance is not None or remaining <= 0:
+                        break
+                    q.async_waiters.append((loop, event))
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.poll_seconds))
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with q.cond:
+                        with contextlib.suppress(ValueError):
+                            q.async_waiters.remove((loop, event))
+                route = routing_table.get_cached(route.function.name) or route
+        finally:
+            self._finish_wait(q, started, instance)
+        return instance
+
+    def _reserve(self, instance):
+        inflight.acquire(instance.pk)
+        # Recorded when a call starts as well as when it ends, so the reaper
+        # doesn't take an instance for unused while a long call runs on it
+        invocation_writer.touch(instance.pk)
+
+    def reserve(self, instance):
+        """Count a call on an instance obtained outside the queue (e.g. a fresh cold start)."""
+        self._reserve(instance)
+
+    def try_reserve(self, instance):
+        """Reserve a slot on one particular instance if it has a free one."""
+        q = self._queue(instance.deployment_id)
+        with q.cond:
+            if inflight.get(instance.pk) >= instance.max_concurrency:
+                return False
+            self._reserve(instance)
+        return True
+
+    def release(self, instance):
+        """Free the instance's slot and wake one waiter of each kind for its deployment."""
+        inflight.release(instance.pk)
+        invocation_writer.touch(instance.pk)
+        q = self._queues.get(instance.deployment_id)
+        if q is not None:
+            with q.cond:
+                q.cond.notify()
+                if q.async_waiters:
+                    loop, event = q.async_waiters.popleft()
+                    with contextlib.suppress(RuntimeError):  # Its loop has closed
+                        loop.call_soon_threadsafe(event.set)
+
+    def queue_depths(self):
+        return {str(deployment_id): q.waiting for deployment_id, q in list(self._queues.items()) if q.waiting}
+
+
+admission = AdmissionController(
+    max_queue_depth=settings.GATEWAY_QUEUE_MAX_DEPTH,
+    max_wait_seconds=settings.GATEWAY_QUEUE_MAX_WAIT_SECONDS,
+    retry_after_seconds=settings.GATEWAY_RETRY_AFTER_SECONDS,
+)
+metrics.register_gauge('queue.depth', admission.queue_depths)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GatewayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gateway'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the routing table's receivers)
@@ -0,0 +1,96 @@
+"""
+Load balancing across the warm instances of a deployment.
+
+The gateway counts its own in-flight calls per instance (`inflight`) and each
+Function selects one of the strategies in BALANCERS via `load_balancing`.
+Counts are per gateway process, which is what each process can act on without
+coordination.
+"""
+import itertools
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class InflightTracker:
+    """Number of gateway -> instance calls currently in flight, per instance id."""
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, instance_id):
+        return self._counts.get(instance_id, 0)
+
+    def acquire(self, instance_id):
+        with self._lock:
+            self._counts[instance_id] += 1
+
+    def release(self, instance_id):
+        with self._lock:
+            self._counts[instance_id] -= 1
+            if self._counts[instance_id] <= 0:
+                del self._counts[instance_id]
+
+    @contextmanager
+    def track(self, instance_id):
+        self.acquire(instance_id)
+        try:
+            yield
+        finally:
+            self.release(instance_id)
+
+
+inflight = InflightTracker()
+
+
+def _load(instance):
+    # Compare instances of different sizes by how full they are
+    count = inflight.get(instance.pk)
+    return count / max(instance.max_concurrency, 1), count
+
+
+def most_recent(deployment_id, instances):
+    """The original behaviour: always the most recently used instance."""
+    return instances[0]
+
+
+def least_outstanding(deployment_id, instances):
+    """The instance with the fewest in-flight calls relative to its concurrency limit."""
+    return min(instances, key=_load)
+
+
+def power_of_two_choices(deployment_id, instances):
+    """The less loaded of two randomly sampled instances."""
+    if len(instances) <= 2:
+        return least_outstanding(deployment_id, instances)
+    return min(random.sample(instances, 2), key=_load)
+
+
+_round_robin_counters = defaultdict(itertools.count)
+
+
+def round_robin(deployment_id, instances):
+    """Each instance in turn. The instance list is ordered, so the rotation is stable."""
+    return instances[next(_round_robin_counters[deployment_id]) % len(instances)]
+
+
+BALANCERS = {
+    'least_outstanding': least_outstanding,
+    'power_of_two': power_of_two_choices,
+    'round_robin': round_robin,
+    'most_recent': most_recent,
+}
+
+
+def choose_instance(route, instances=None):
+    """
+    Pick an instance for the route using its function's strategy, or None if there are none.
+    `instances` narrows the candidates (e.g. to those with a free slot).
+    """
+    instances = route.instances if instances is None else instances
+    if not instances:
+        return None
+    strategy = BALANCERS.get(route.function.load_balancing, least_outstanding)
+    return strategy(route.deployment.pk, instances)
@@ -0,0 +1,126 @@
+"""
+Result cache for functions that opt in with `Function.cache_results`.
+
+Entries are keyed by function, deployment and a hash of the canonical JSON
+payload, and expire after the function's `cache_ttl_seconds`. Only successful
+responses are stored; streamed output of a cacheable function is read whole
+so it can be (see InvokeView). The backend is chosen by GATEWAY_RESULT_CACHE_BACKEND:
+LocalResultCache keeps a size-bounded LRU in each gateway process and
+DjangoResultCache shares results through one of Django's cache backends.
+
+Keys also carry a per-function generation read from Django's default cache.
+Activating a deployment (deploy or rollback, see gateway/signals.py) bumps it,
+which invalidates the function's results in every gateway process.
+"""
+import abc
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.module_loading import import_string
+
+
+def payload_hash(data):
+    """Hash of the payload that doesn't depend on key order or whitespace."""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _generation_key(function_id):
+    return f"gateway:results:function:{function_id}"
+
+
+class ResultCache(abc.ABC):
+    """Key handling and invalidation shared by the backends."""
+
+    def key(self, route, digest):
+        """Cache key for a payload of the route's deployment; `digest` is its payload_hash()."""
+        generation = cache.get(_generation_key(route.function.pk), 0)
+        return f"{route.function.pk}:{generation}:{route.deployment.pk}:{digest}"
+
+    def invalidate_function(self, function_id):
+        """Drop every cached result of one function, in all gateway processes."""
+        key = _generation_key(function_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the cached (status_code, response_body), or None."""
+
+    @abc.abstractmethod
+    def set(self, key, status_code, response_body, ttl_seconds):
+        """Store a response for `ttl_seconds`."""
+
+
+class LocalResultCache(ResultCache):
+    """In-process LRU bounded by entry count and total response size in (UTF-8) bytes."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, status_code, response_body, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, status_code, response_body, ttl_seconds):
+        size = len(response_body.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl_seconds, status_code, response_body, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self.size_bytes -= self._entries.pop(key)[3]
+
+    def invalidate_function(self, function_id):
+        super().invalidate_function(function_id)
+        prefix = f"{function_id}:"
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoResultCache(ResultCache):
+    """Results shared by all gateway processes through a Django cache alias."""
+
+    def __init__(self, alias='default', **kwargs):
+        self.alias = alias
+
+    def get(self, key):
+        entry = caches[self.alias].get(f"gateway:result:{key}")
+        return tuple(entry) if entry is not None else None
+
+    def set(self, key, status_code, response_body, ttl_seconds):
+        caches[self.alias].set(f"gateway:result:{key}", (status_code, response_body), timeout=ttl_seconds)
+
+
+result_cache = import_string(settings.GATEWAY_RESULT_CACHE_BACKEND)(
+    max_entries=settings.GATEWAY_RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=settings.GATEWAY_RESULT_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,159 @@
+"""
+Queue for asynchronous (fire-and-forget) invocations.
+
+InvokeView persists the InvocationRequest as QUEUED, enqueues it and answers
+202 straight away; `manage.py run_invocation_consumer` claims queued
+invocations in batches, runs them and records the result on the same row, where
+InvocationRequestViewSet serves it. The backend is chosen by
+GATEWAY_ASYNC_QUEUE_BACKEND. DatabaseInvocationQueue needs nothing beyond the
+project database; a broker-backed class with the same methods (enqueue, claim,
+complete, release, depth) can replace it.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+
+from orchestrator.models import Deployment, Function, InvocationRequest
+from .models import QueuedInvocation
+from .routing import routing_table
+from .services import proxy_invocation
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseInvocationQueue:
+    """
+    Queue kept in the QueuedInvocation table.
+
+    Claims are made with a per-batch token, so concurrent consumers never run
+    the same invocation; a claim older than `visibility_seconds` (a consumer
+    that died mid-batch) is handed out again. An invocation claimed
+    `max_attempts` times without finishing is recorded as a FAILURE instead.
+    """
+
+    def __init__(self, visibility_seconds=900, max_attempts=10):
+        self.visibility_seconds = visibility_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, invocation_log):
+        """Durably store an unsaved InvocationRequest as QUEUED."""
+        invocation_log.status = 'QUEUED'
+        with transaction.atomic():
+            invocation_log.save(force_insert=True)
+            QueuedInvocation.objects.create(invocation=invocation_log)
+
+    def claim(self, batch_size):
+        """Claim up to `batch_size` invocations, oldest first, and mark them RUNNING."""
+        if batch_size <= 0:
+            return []
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        claimable = (
+            Q(claimed_by__isnull=True) |
+            Q(claimed_at__lt=now - timedelta(seconds=self.visibility_seconds))
+        )
+        with transaction.atomic():
+            # Claimed as often as allowed and never finished (e.g. it crashes its consumer)
+            self._give_up(QueuedInvocation.objects.filter(claimable, attempts__gte=self.max_attempts),
+                          f"Not finished after {self.max_attempts} attempts")
+            candidates = QueuedInvocation.objects.filter(
+                claimable, available_at__lte=now, attempts__lt=self.max_attempts
+            ).order_by('available_at')
+            if connection.features.has_select_for_update_skip_locked:
+                # Lock a batch that other consumers skip instead of waiting on
+                ids = list(candidates.select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+            else:
+                # A single UPDATE, so SQLite takes its write lock up front
+                ids = candidates.values('pk')[:batch_size]
+            # Re-check the claim condition, so a racing consumer's claim is never overwritten
+            QueuedInvocation.objects.filter(claimable, pk__in=ids).update(
+                claimed_by=token, claimed_at=now, attempts=F('attempts') + 1
+            )
+            claimed = list(QueuedInvocation.objects.filter(claimed_by=token).values_list('pk', flat=True))
+            if not claimed:
+                return []
+            InvocationRequest.objects.filter(pk__in=claimed).update(status='RUNNING')
+        return list(
+            InvocationRequest.objects.select_related('function', 'deployment')
+            .filter(pk__in=claimed).order_by('start_time')
+        )
+
+    def complete(self, invocation_log):
+        """Record the finished invocation and remove it from the queue."""
+        with transaction.atomic():
+            invocation_log.save()
+            QueuedInvocation.objects.filter(pk=invocation_log.pk).delete()
+
+    def release(self, invocation_log, delay_seconds=0, reason=''):
+        """
+        Give a claimed invocation back to the queue, to be retried after
+        `delay_seconds`, or record it as a FAILURE (with `reason`) if it has
+        had its `max_attempts`.
+        """
+        with transaction.atomic():
+            exhausted = QueuedInvocation.objects.filter(pk=invocation_log.pk, attempts__gte=self.max_attempts)
+            if self._give_up(exhausted, f"Gave up after {self.max_attempts} attempts: {reason or 'released'}"):
+                return
+            QueuedInvocation.objects.filter(pk=invocation_log.pk).update(
+                claimed_by=None, claimed_at=None,
+                available_at=timezone.now() + timedelta(seconds=delay_seconds),
+            )
+            InvocationRequest.objects.filter(pk=invocation_log.pk).update(status='QUEUED')
+
+    def depth(self):
+        return QueuedInvocation.objects.count()
+
+    def _give_up(self, entries, message):
+        """Record the invocations of the `entries` queryset as FAILURE and drop them. Returns how many."""
+        # An UPDATE first, so SQLite takes its write lock before anything is read
+        failed = InvocationRequest.objects.filter(pk__in=entries.values('pk')).update(
+            status='FAILURE', error_message=message, end_time=timezone.now()
+        )
+        if failed:
+            logger.warning("Giving up on %d queued invocation(s): %s", failed, message)
+            entries.delete()
+        return failed
+
+
+invocation_queue = import_string(settings.GATEWAY_ASYNC_QUEUE_BACKEND)(
+    visibility_seconds=settings.GATEWAY_ASYNC_VISIBILITY_SECONDS,
+    max_attempts=settings.GATEWAY_ASYNC_MAX_ATTEMPTS,
+)
+
+
+def run_queued_invocation(invocation_log, queue=None):
+    """
+    Run one claimed invocation against the function's current deployment and
+    record its result. Returns False if it was put back because no instance
+    had capacity.
+    """
+    queue = queue or invocation_queue
+    try:
+        try:
+            route = routing_table.resolve(invocation_log.function.name)
+        except (Function.DoesNotExist, Deployment.DoesNotExist):
+            invocation_log.status = 'FAILURE'
+            invocation_log.error_message = "Function not found or no active deployment."
+        else:
+            invocation_log.deployment = route.deployment
+            try:
+                proxy_invocation(route, invocation_log)
+            except APIException as e:
+                # Every instance is busy or none can be started: retry later
+                queue.release(invocation_log, delay_seconds=getattr(e, 'wait', None) or 1, reason=str(e.detail))
+                return False
+        invocation_log.end_time = timezone.now()
+        queue.complete(invocation_log)
+        return True
+    except Exception:
+        logger.exception("Async invocation %s failed in the consumer", invocation_log.pk)
+        raise
+    finally:
+        close_old_connections()
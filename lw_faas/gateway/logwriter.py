@@ -0,0 +1,174 @@
+"""
+Buffered, batched writer for InvocationRequest rows.
+
+Invocation views build their log row in memory and hand it to
+`invocation_writer.submit()` once the invocation finishes. A background thread
+writes queued rows with one `bulk_create` per batch, flushing when a batch
+fills up or the flush interval passes, so logging adds no database round trip
+to the request path. The queue is bounded. When it is full, rows are either
+dropped and counted ('drop'), or the caller waits up to a timeout for space
+('block'). Whatever is still queued is flushed when the process exits.
+
+The same thread records when instances were last used: `touch()` notes an
+instance in memory (when a call on it starts and when it ends) and each flush
+sets `last_accessed` for all instances
+touched since the previous one in a single UPDATE (bringing IDLE ones back to
+RUNNING), which is what the reaper (orchestrator/reaper.py) goes by.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from orchestrator.models import FunctionInstance, InvocationRequest
+
+logger = logging.getLogger(__name__)
+
+TOUCH_CHUNK = 500  # Instance ids per UPDATE, below SQLite's parameter limit
+
+
+class InvocationLogWriter:
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_pending=10000,
+                 overflow='drop', block_timeout=0.5):
+        if overflow not in ('drop', 'block'):
+            raise ValueError("overflow must be 'drop' or 'block'")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._touched = set()  # Instance ids used since the last flush
+        self._touch_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='invocation-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def submit(self, invocation_log, block=True):
+        """
+        Queue an unsaved InvocationRequest for writing. Returns False if it was dropped.
+        `block=False` never waits, even under the 'block' policy (for async callers).
+        """
+        self._ensure_started()
+        try:
+            if self.overflow == 'block' and block:
+                self._queue.put(invocation_log, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(invocation_log)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Invocation log queue full; %d rows dropped so far", self.dropped)
+            return False
+        return True
+
+    def submit_many(self, invocation_logs, block=True):
+        return sum(1 for log in invocation_logs if self.submit(log, block=block))
+
+    def touch(self, instance_id):
+        """Note that an instance just served a call; `last_accessed` is written with the next flush."""
+        self._ensure_started()
+        with self._touch_lock:
+            self._touched.add(instance_id)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write_touched()
+                continue
+            self._write(self._drain(first))
+            self._write_touched()
+
+    def flush(self, timeout=10.0):
+        """
+        Write everything queued so far, synchronously. Rows the background
+        thread has already taken are waited for, up to `timeout` seconds.
+        """
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+        self._write_touched()
+
+    def _write_touched(self):
+        with self._touch_lock:
+            if not self._touched:
+                return
+            touched, self._touched = list(self._touched), set()
+        now = timezone.now()
+        try:
+            for start in range(0, len(touched), TOUCH_CHUNK):
+                chunk = touched[start:start + TOUCH_CHUNK]
+                FunctionInstance.objects.filter(pk__in=chunk).update(last_accessed=now)
+                # Routing includes IDLE instances, so this needs no invalidation
+                FunctionInstance.objects.filter(pk__in=chunk, status='IDLE').update(status='RUNNING')
+        except Exception:
+            logger.exception("Recording last use of %d instances failed", len(touched))
+        finally:
+            close_old_connections()
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                InvocationRequest.objects.bulk_create(batch)
+                self.written += len(batch)
+            except Exception:
+                # One bad row (e.g. an instance deleted meanwhile) shouldn't lose the batch
+                logger.exception("Bulk invocation log write failed; retrying %d rows individually", len(batch))
+                for invocation_log in batch:
+                    try:
+                        invocation_log.save(force_insert=True)
+                        self.written += 1
+                    except Exception:
+                        self.dropped += 1
+                        logger.exception("Dropping invocation log %s", invocation_log.id)
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+
+
+invocation_writer = InvocationLogWriter(
+    batch_size=settings.GATEWAY_LOG_BATCH_SIZE,
+    flush_interval=settings.GATEWAY_LOG_FLUSH_SECONDS,
+    max_pending=settings.GATEWAY_LOG_MAX_PENDING,
+    overflow=settings.GATEWAY_LOG_OVERFLOW,
+)
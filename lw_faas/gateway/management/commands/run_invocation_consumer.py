@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gateway.dispatch import invocation_queue, run_queued_invocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued async invocations. Claims them from the invocation queue in "
+        "batches sized to the free execution slots, so a deep queue is drained "
+        "in full batches and an empty one is polled cheaply."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.GATEWAY_ASYNC_BATCH_SIZE,
+                            help='Most invocations claimed in one round trip')
+        parser.add_argument('--concurrency', type=int, default=settings.GATEWAY_ASYNC_CONCURRENCY,
+                            help='Invocations run in parallel')
+        parser.add_argument('--poll-interval', type=float, default=settings.GATEWAY_ASYNC_POLL_SECONDS,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        processed = 0
+        running = set()
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='invocation-consumer')
+        try:
+            while True:
+                done = {f for f in running if f.done()}
+                running -= done
+                processed += sum(1 for f in done if not f.exception() and f.result())
+
+                wanted = min(concurrency - len(running), batch_size)
+                batch = invocation_queue.claim(wanted) if wanted > 0 else []
+                for invocation_log in batch:
+                    running.add(executor.submit(run_queued_invocation, invocation_log))
+                if batch and len(batch) == wanted:
+                    continue  # The queue has more; claim again as soon as slots free up
+
+                if running:
+                    wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True)
+            processed += sum(1 for f in running if not f.exception() and f.result())
+        self.stdout.write(self.style.SUCCESS(f"Ran {processed} queued invocation(s)."))
@@ -0,0 +1,61 @@
+"""
+In-process gateway metrics: counters, value summaries and gauges.
+Served as JSON by MetricsView (GET /api/gateway/metrics/).
+"""
+import threading
+from collections import defaultdict
+
+
+class Summary:
+    """Count/sum/max of observed values."""
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+
+
+class Metrics:
+
+    def __init__(self):
+        self._counters = defaultdict(int)
+        self._summaries = defaultdict(Summary)
+        self._gauges = {}  # name -> zero-argument callable
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name, value):
+        with self._lock:
+            self._summaries[name].observe(value)
+
+    def register_gauge(self, name, func):
+        """Report `func()` under `name` every time metrics are read."""
+        self._gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'counters': dict(self._counters),
+                'summaries': {name: summary.snapshot() for name, summary in self._summaries.items()},
+            }
+        data['gauges'] = {name: func() for name, func in self._gauges.items()}
+        return data
+
+
+metrics = Metrics()
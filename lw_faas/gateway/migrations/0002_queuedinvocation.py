@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gateway', '0001_initial'),
+        ('orchestrator', '0007_invocationrequest_queued_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedInvocation',
+            fields=[
+                ('invocation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='queue_entry', serialize=False, to='orchestrator.invocationrequest')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_by', models.CharField(blank=True, max_length=64, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('available_at',),
+                'indexes': [models.Index(fields=['claimed_by', 'available_at'], name='gateway_que_claimed_4e2c73_idx')],
+            },
+        ),
+    ]
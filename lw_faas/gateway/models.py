@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class FunctionInvocation(models.Model):
     function_name = models.CharField(max_length=255)
@@ -13,3 +14,25 @@ class FunctionInvocation(models.Model):
     class Meta:
         ordering = ('-timestamp',)
 
+
+
+class QueuedInvocation(models.Model):
+    """
+    An async invocation waiting for (or claimed by) a consumer.
+    Used by DatabaseInvocationQueue; the row is deleted once the invocation has run.
+    """
+    invocation = models.OneToOneField('orchestrator.InvocationRequest', on_delete=models.CASCADE,
+                                      primary_key=True, related_name='queue_entry')
+    available_at = models.DateTimeField(default=timezone.now)  # Not handed out before this (retry backoff)
+    claimed_by = models.CharField(max_length=64, null=True, blank=True)  # Claim token of the consumer batch
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.invocation_id} available at {self.available_at}"
+
+    class Meta:
+        ordering = ('available_at',)
+        indexes = [
+            models.Index(fields=['claimed_by', 'available_at']),
+        ]
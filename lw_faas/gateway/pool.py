@@ -0,0 +1,130 @@
+"""
+Process-wide pool of keep-alive HTTP sessions for gateway -> instance calls.
+
+One `requests.Session` is kept per instance URL so warm invocations reuse an
+open TCP connection instead of paying connection setup on every call. The
+pool is bounded (least recently used instances are dropped first), sessions
+idle for too long are closed, and an instance's session is evicted as soon as
+the instance is marked ERROR.
+
+`async_instance_client` is the equivalent for async views: one
+`httpx.AsyncClient` per event loop, with the same limits.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class InstanceConnectionPool:
+    """LRU map of instance base URL -> keep-alive session."""
+
+    def __init__(self, max_instances=256, connections_per_instance=10, idle_seconds=60.0):
+        self.max_instances = max_instances
+        self.connections_per_instance = connections_per_instance
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()  # base_url -> (session, last_used)
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.connections_per_instance,
+            max_retries=0,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, base_url):
+        """Return the session for `base_url`, creating it if needed."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            # Drop sessions that have not been used within the idle window.
+            # Entries are kept in LRU order, so stop at the first fresh one.
+            while self._sessions:
+                url, (session, last_used) = next(iter(self._sessions.items()))
+                if now - last_used < self.idle_seconds:
+                    break
+                del self._sessions[url]
+                stale.append(session)
+
+            entry = self._sessions.pop(base_url, None)
+            session = entry[0] if entry else self._new_session()
+            self._sessions[base_url] = (session, now)
+
+            while len(self._sessions) > self.max_instances:
+                _, (old_session, _) = self._sessions.popitem(last=False)
+                stale.append(old_session)
+
+        for old_session in stale:
+            old_session.close()
+        return session
+
+    def post(self, base_url, path='/', **kwargs):
+        """POST to `base_url + path` over the pooled session for that instance."""
+        return self.get_session(base_url).post(f"{base_url}{path}", **kwargs)
+
+    def evict(self, base_url):
+        """Close and forget the session for an instance (e.g. when it is marked ERROR)."""
+        with self._lock:
+            entry = self._sessions.pop(base_url, None)
+        if entry:
+            entry[0].close()
+
+    def clear(self):
+        with self._lock:
+            sessions = [session for session, _ in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class AsyncInstanceClient:
+    """Keep-alive httpx client for async views, one per running event loop."""
+
+    def __init__(self, max_instances=256, connections_per_instance=10, idle_seconds=60.0):
+        self.limits = httpx.Limits(
+            max_connections=max_instances * connections_per_instance,
+            max_keepalive_connections=max_instances * connections_per_instance,
+            keepalive_expiry=idle_seconds,
+        )
+        # Clients are bound to the loop they were created on; when Django runs an
+        # async view under WSGI each request gets its own short-lived loop.
+        self._clients = weakref.WeakKeyDictionary()
+
+    def get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits)
+            self._clients[loop] = client
+        return client
+
+    async def post(self, base_url, path='/', **kwargs):
+        """POST to `base_url + path` over the loop's pooled client."""
+        return await self.get_client().post(f"{base_url}{path}", **kwargs)
+
+
+instance_pool = InstanceConnectionPool(
+    max_instances=settings.GATEWAY_POOL_MAX_INSTANCES,
+    connections_per_instance=settings.GATEWAY_POOL_CONNECTIONS_PER_INSTANCE,
+    idle_seconds=settings.GATEWAY_POOL_IDLE_SECONDS,
+)
+
+async_instance_client = AsyncInstanceClient(
+    max_instances=settings.GATEWAY_POOL_MAX_INSTANCES,
+    connections_per_instance=settings.GATEWAY_POOL_CONNECTIONS_PER_INSTANCE,
+    idle_seconds=settings.GATEWAY_POOL_IDLE_SECONDS,
+)
@@ -0,0 +1,114 @@
+"""
+Per-process routing table: function name -> active deployment -> live instances.
+
+The warm invocation path resolves a function entirely from memory. Entries are
+invalidated by model signals (see gateway/signals.py) whenever a function,
+deployment, instance or worker changes state. Each entry also carries a
+version stamp read from Django's cache framework, so with a shared cache
+backend an invalidation in one process reaches every gateway process. A TTL
+bounds staleness for changes made without signals (e.g. QuerySet.update()).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from orchestrator.models import Function, FunctionInstance
+from .pool import instance_pool
+
+EPOCH_KEY = 'gateway:routing:epoch'  # Bumped when every route must be reloaded
+
+
+def _function_version_key(function_id):
+    return f"gateway:routing:function:{function_id}"
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+class Route:
+    """Resolution of one function name. Treat the model objects as read-only."""
+    __slots__ = ('function', 'deployment', 'instances', 'version', 'loaded_at')
+
+    def __init__(self, function, deployment, instances, version):
+        self.function = function
+        self.deployment = deployment
+        self.instances = instances  # RUNNING/IDLE instances on ONLINE workers, most recently used first
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+
+class RoutingTable:
+
+    def __init__(self, ttl_seconds=30.0):
+        self.ttl_seconds = ttl_seconds
+        self._routes = {}  # function name -> Route
+        self._lock = threading.Lock()
+
+    def _current_version(self, function_id):
+        key = _function_version_key(function_id)
+        versions = cache.get_many([EPOCH_KEY, key])
+        return versions.get(EPOCH_KEY, 0), versions.get(key, 0)
+
+    def get_cached(self, function_name):
+        """Return the cached route if it is still current, without touching the database."""
+        route = self._routes.get(function_name)
+        if route is None:
+            return None
+        if time.monotonic() - route.loaded_at >= self.ttl_seconds:
+            return None
+        if self._current_version(route.function.pk) != route.version:
+            return None
+        return route
+
+    def resolve(self, function_name):
+        """
+        Return the Route for `function_name`, loading it from the database on a miss.
+        Raises Function.DoesNotExist / Deployment.DoesNotExist like the ORM lookups it replaces.
+        """
+        route = self.get_cached(function_name)
+        if route is not None:
+            return route
+
+        function = Function.objects.get(name=function_name, is_active=True)
+        # Read the version before loading the rest, so an invalidation that
+        # races with this load forces another reload instead of being lost.
+        version = self._current_version(function.pk)
+        deployment = function.deployments.get(is_active=True)
+        instances = list(FunctionInstance.objects.select_related('worker', 'deployment').filter(
+            deployment=deployment,
+            status__in=['RUNNING', 'IDLE'],
+            worker__status='ONLINE'
+        ).order_by('-last_accessed'))
+
+        route = Route(function, deployment, instances, version)
+        with self._lock:
+            self._routes[function_name] = route
+        return route
+
+    def invalidate_function(self, function_id):
+        """Drop routes for one function here and, through the version stamp, everywhere."""
+        _bump(_function_version_key(function_id))
+        with self._lock:
+            for name in [n for n, r in self._routes.items() if r.function.pk == function_id]:
+                del self._routes[name]
+
+    def invalidate_all(self):
+        _bump(EPOCH_KEY)
+        with self._lock:
+            self._routes.clear()
+
+
+routing_table = RoutingTable(ttl_seconds=settings.GATEWAY_ROUTING_TTL_SECONDS)
+
+
+def mark_instance_error(instance):
+    """Take an instance that failed to respond out of rotation."""
+    FunctionInstance.objects.filter(pk=instance.pk).update(status='ERROR')
+    routing_table.invalidate_function(instance.deployment.function_id)
+    instance_pool.evict(instance.get_url())
@@ -0,0 +1,323 @@
+"""
+Invocation steps shared by the gateway invoke views and the async invocation consumer
+(gateway/management/commands/run_invocation_consumer.py).
+"""
+import json
+import time
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+
+from orchestrator.provisioning import InstanceLimitReached, ProvisioningError, start_instance
+from orchestrator.scheduler import NoWorkerAvailable
+from .admission import NoCapacity, admission
+from .metrics import metrics
+from .pool import async_instance_client, instance_pool
+from .routing import mark_instance_error
+from .singleflight import singleflight
+
+# Set by the runtime host on output streamed from a generator handler
+STREAM_HEADER = 'X-Function-Stream'
+
+
+def trigger_cold_start(deployment):
+    """
+    Place a new instance on a worker and have its agent start it
+    (orchestrator/provisioning.py). Returns the RUNNING instance.
+    """
+    return start_instance(deployment)
+
+
+def _cold_start(deployment):
+    """Start an instance and reserve its first slot for the caller."""
+    started = time.monotonic()
+    try:
+        instance = trigger_cold_start(deployment)
+    except NoWorkerAvailable:
+        metrics.incr('cold_start.no_capacity')
+        raise NoCapacity(wait=admission.retry_after_seconds)
+    except InstanceLimitReached:
+        metrics.incr('cold_start.at_max_instances')
+        raise NoCapacity(wait=admission.retry_after_seconds)
+    except ProvisioningError:
+        metrics.incr('cold_start.failed')
+        raise NoCapacity(wait=admission.retry_after_seconds)
+    metrics.observe('cold_start.seconds', time.monotonic() - started)
+    admission.reserve(instance)
+    return instance
+
+
+def cold_start_or_unavailable(deployment):
+    """
+    Launches an instance and reserves a slot on it, or raises a 503 with
+    Retry-After when that isn't possible. Concurrent cold starts of one
+    deployment share a launch; callers that find its slots taken launch another.
+    """
+    while True:
+        instance, shared = singleflight.do(f"cold-start:{deployment.pk}", lambda: _cold_start(deployment))
+        if not shared or admission.try_reserve(instance):
+            return instance
+
+
+def acquire_instance(route):
+    """
+    Reserves a slot on a RUNNING or IDLE instance, picked by the function's
+    balancing strategy, queueing briefly if all are busy, or launches a new
+    instance. Returns (instance, is_cold_start).
+    """
+    instance = admission.acquire(route)
+    if instance:
+        return instance, False
+    return cold_start_or_unavailable(route.deployment), True
+
+
+def proxy_invocation(route, invocation_log, stream=False, body=None, content_type='application/json', raw=False):
+    """
+    Run `invocation_log.request_body` (or `body`, sent as `content_type`) on an
+    instance of the route's deployment.
+
+    Fills in the log's instance, status and response fields and returns
+    (response_status, response_data). Raises QueueFull / NoCapacity before
+    anything is sent if no instance can take the call.
+
+    With `stream=True`, output a generator handler streams back is returned as a
+    ResponseStream instead of being read here; the instance slot is held and the
+    log's status set once it has been iterated to the end. With `raw=True` the
+    response body is returned unparsed as a RawResponse.
+    """
+    # Reserve a slot on a warm instance or launch a new instance (orchestrator logic)
+    instance, invocation_log.is_cold_start = acquire_instance(route)
+    invocation_log.instance = instance
+
+    # Proxy the request to the worker node over a pooled keep-alive connection
+    instance_url = instance.get_url() # Points to runtime_host's server
+    release = True
+    try:
+        # Forward headers, body, etc.
+        headers = {'Content-Type': content_type}
+        # You might forward auth headers or inject a specific one for the runtime
+        try:
+            resp = instance_pool.post(
+                instance_url,
+                data=invocation_log.request_body if body is None else body,
+                headers=headers,
+                timeout=route.function.timeout_seconds + 5, # Add buffer
+                stream=True
+            )
+            if stream and resp.headers.get(STREAM_HEADER):
+                release = False
+                return resp.status_code, ResponseStream(resp, instance, invocation_log)
+            response_data = _read_result(resp, raw)
+        finally:
+            if release:
+                admission.release(instance)
+    except Exception as e:
+        return _record_failure(e, instance, [invocation_log])
+
+    _record_success(invocation_log, resp, response_data, raw)
+    return resp.status_code, response_data
+
+
+async def aproxy_invocation(route, invocation_log, body=None, content_type='application/json', raw=False):
+    """
+    proxy_invocation() for async views: waiting for a slot and for the instance
+    holds no thread. Streamed output is read whole.
+    """
+    instance = await admission.aacquire(route)
+    invocation_log.is_cold_start = instance is None
+    if instance is None:
+        instance = await sync_to_async(cold_start_or_unavailable)(route.deployment)
+    invocation_log.instance = instance
+
+    try:
+        try:
+            resp = await async_instance_client.post(
+                instance.get_url(),
+                content=invocation_log.request_body if body is None else body,
+                headers={'Content-Type': content_type},
+                timeout=route.function.timeout_seconds + 5
+            )
+        finally:
+            admission.release(instance)
+        response_data = _read_result(resp, raw)
+    except Exception as e:
+        return await sync_to_async(_record_failure)(e, instance, [invocation_log])
+
+    _record_success(invocation_log, resp, response_data, raw)
+    return resp.status_code, response_data
+
+
+def _read_result(resp, raw):
+    if raw:
+        return RawResponse(resp.content, resp.headers.get('Content-Type', 'application/octet-stream'))
+    return read_response(resp)
+
+
+def _record_success(invocation_log, resp, response_data, raw):
+    """Fill in the log from a runtime host response (requests or httpx)."""
+    invocation_log.response_status_code = resp.status_code
+    if raw:
+        invocation_log.response_body = loggable_body(resp.content, response_data.content_type)
+    elif resp.headers.get(STREAM_HEADER):
+        # Streamed output read whole: store it as the one JSON document it is returned as
+        invocation_log.response_body = json.dumps(response_data)
+    else:
+        invocation_log.response_body = resp.text
+    invocation_log.status = 'SUCCESS' if resp.status_code < 400 else 'FAILURE'
+
+
+class RawResponse:
+    """A runtime host response body passed on without being parsed."""
+    __slots__ = ('content', 'content_type')
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+
+
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/xml')
+
+
+def loggable_body(content, content_type):
+    """Text to store in an invocation log for a raw body: the text itself, or a size note for binary data."""
+    if content_type and content_type.startswith(TEXT_CONTENT_TYPES):
+        return content.decode('utf-8', errors='replace')
+    return f"<{len(content)} bytes of {content_type or 'unknown type'}>"
+
+
+def read_response(resp):
+    """
+    Parse a runtime host response (requests or httpx). Streamed NDJSON output
+    that isn't being relayed becomes a list, other streamed output a string.
+    """
+    if resp.headers.get(STREAM_HEADER):
+        if resp.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+            return [json.loads(line) for line in resp.content.splitlines() if line]
+        return resp.text
+    return resp.json()
+
+
+class ResponseStream:
+    """
+    Chunks of a streamed runtime host response, read as they arrive.
+
+    Finishing the iteration or calling close() (StreamingHttpResponse does when
+    the client goes away) closes the response, releases the instance slot and
+    calls `on_close`. The log's status stays FAILURE unless the stream completes.
+    """
+
+    def __init__(self, resp, instance, invocation_log):
+        self.resp = resp
+        self.instance = instance
+        self.invocation_log = invocation_log
+        self.content_type = resp.headers.get('Content-Type', 'application/octet-stream')
+        self.status_code = resp.status_code
+        self.size = 0
+        self.on_close = None
+        self.closed = False
+        invocation_log.response_status_code = resp.status_code
+        invocation_log.status = 'FAILURE'
+
+    def __iter__(self):
+        try:
+            for chunk in self.resp.iter_content(chunk_size=None):
+                self.size += len(chunk)
+                yield chunk
+            self.invocation_log.status = 'SUCCESS' if self.resp.ok else 'FAILURE'
+        except requests.exceptions.RequestException as e:
+            # The runtime host leaves the body unterminated when the handler fails midway
+            self.invocation_log.error_message = f"Stream interrupted: {e}"
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.resp.close()
+        admission.release(self.instance)
+        if self.on_close:
+            self.on_close()
+
+
+def batch_timeout(function, item_count):
+    """
+    Seconds to wait for a batch. Sync handlers run the items one after another,
+    so it grows with the batch, up to GATEWAY_BATCH_MAX_TIMEOUT_SECONDS.
+    """
+    call_timeout = function.timeout_seconds + 5
+    return max(call_timeout, min(function.timeout_seconds * item_count + 5, settings.GATEWAY_BATCH_MAX_TIMEOUT_SECONDS))
+
+
+def proxy_batch(route, invocation_logs, items):
+    """
+    Run every payload in `items` on one instance with a single request to the
+    runtime host's /batch route. `invocation_logs[i]` is the log row for
+    `items[i]` and gets that item's result.
+
+    Returns (response_status, results): 200 and one {"status_code", "body"} per
+    item, or an error status and body if the batch as a whole failed.
+    """
+    instance, is_cold_start = acquire_instance(route)
+    for invocation_log in invocation_logs:
+        invocation_log.instance = instance
+        invocation_log.is_cold_start = is_cold_start
+
+    body = json.dumps({'items': items, 'request_ids': [log.request_id for log in invocation_logs]})
+    try:
+        try:
+            resp = instance_pool.post(
+                instance.get_url(),
+                path='/batch',
+                data=body,
+                headers={'Content-Type': 'application/json'},
+                timeout=batch_timeout(route.function, len(items))
+            )
+        finally:
+            admission.release(instance)
+        response_data = resp.json()
+        results = response_data['results'] if resp.ok else None
+    except Exception as e:
+        return _record_failure(e, instance, invocation_logs)
+
+    if results is None:
+        # The runtime host rejected the batch (e.g. busy): every item failed the same way
+        for invocation_log in invocation_logs:
+            invocation_log.response_status_code = resp.status_code
+            invocation_log.response_body = resp.text
+            invocation_log.status = 'FAILURE'
+        return resp.status_code, response_data
+
+    for invocation_log, result in zip(invocation_logs, results):
+        invocation_log.response_status_code = result['status_code']
+        invocation_log.response_body = json.dumps(result['body'])
+        invocation_log.status = 'SUCCESS' if result['status_code'] < 400 else 'FAILURE'
+    return status.HTTP_200_OK, results
+
+
+def _record_failure(exc, instance, invocation_logs):
+    """Map a failed gateway -> instance call (requests or httpx) to a response and mark the logs."""
+    if isinstance(exc, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        # Handle timeout
+        response_status = status.HTTP_504_GATEWAY_TIMEOUT
+        response_data = {"error": "Function execution timed out"}
+        log_status, error_message = 'TIMEOUT', ''
+    elif isinstance(exc, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        # Handle instance failure
+        response_status = status.HTTP_503_SERVICE_UNAVAILABLE
+        response_data = {"error": "Function instance unavailable"}
+        mark_instance_error(instance)
+        log_status, error_message = 'FAILURE', "Connection to worker failed"
+    else:
+        # Handle any other error
+        response_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+        response_data = {"error": "Internal gateway error"}
+        log_status, error_message = 'FAILURE', str(exc)
+
+    for invocation_log in invocation_logs:
+        invocation_log.status = log_status
+        invocation_log.error_message = error_message
+    return response_status, response_data
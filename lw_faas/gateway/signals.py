@@ -0,0 +1,69 @@
+"""
+Keep the gateway's in-memory routing table and result cache consistent with
+orchestrator state.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from orchestrator.models import Deployment, Function, FunctionInstance, WorkerNode
+from .cache import result_cache
+from .routing import routing_table
+
+
+@receiver([post_save, post_delete], sender=Function)
+def function_changed(sender, instance, **kwargs):
+    routing_table.invalidate_function(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Deployment)
+def deployment_changed(sender, instance, **kwargs):
+    # Covers FunctionViewSet.deploy and DeploymentViewSet.rollback, which both
+    # save the newly active deployment. The switch is a transaction
+    # (orchestrator/rollout.py); a route reloaded before it commits would
+    # otherwise be cached with the old deployment.
+    function_id, is_active = instance.function_id, instance.is_active
+
+    def invalidate():
+        routing_table.invalidate_function(function_id)
+        if is_active:
+            result_cache.invalidate_function(function_id)
+    transaction.on_commit(invalidate)
+
+
+ROUTED_INSTANCE_FIELDS = ('deployment_id', 'worker_id', 'status', 'port', 'max_concurrency')
+
+
+def _routed_fields(instance):
+    # Through __dict__, so deferred fields aren't loaded just for this
+    return tuple(instance.__dict__.get(field) for field in ROUTED_INSTANCE_FIELDS)
+
+
+@receiver(post_init, sender=FunctionInstance)
+def remember_instance_route(sender, instance, **kwargs):
+    instance._routed_fields = _routed_fields(instance)
+
+
+@receiver([post_save, post_delete], sender=FunctionInstance)
+def instance_changed(sender, instance, created=False, **kwargs):
+    # Covers InstanceReadyView registration and instances being marked ERROR.
+    # Agent heartbeats save instances constantly (rss_mb); only what routes hold matters.
+    routed = _routed_fields(instance)
+    if kwargs.get('signal') is post_save and not created and routed == instance._routed_fields:
+        return
+    instance._routed_fields = routed
+    function_id = instance.deployment.function_id
+    transaction.on_commit(lambda: routing_table.invalidate_function(function_id))
+
+
+@receiver(post_init, sender=WorkerNode)
+def remember_worker_status(sender, instance, **kwargs):
+    instance._routing_status = instance.status
+
+
+@receiver([post_save, post_delete], sender=WorkerNode)
+def worker_changed(sender, instance, **kwargs):
+    # Heartbeats save workers constantly; only a status change affects routing.
+    if kwargs.get('signal') is post_delete or instance.status != instance._routing_status:
+        routing_table.invalidate_all()
+    instance._routing_status = instance.status
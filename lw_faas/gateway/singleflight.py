@@ -0,0 +1,68 @@
+"""
+Request coalescing for functions that opt in with `Function.coalesce_requests`.
+
+While a call for a key is in flight, identical calls wait for it and share its
+result instead of sending their own copy downstream. The key is the deployment
+and payload hash, so coalescing only merges invocations that would run the
+same code on the same input. Coalescing is per gateway process.
+"""
+import threading
+
+from .metrics import metrics
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Run `func()` unless a call for `key` is already in flight, in which case
+        wait for that one. Returns (result, shared); exceptions are shared too.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.incr('singleflight.coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                metrics.observe('singleflight.fan_out', call.waiters)
+        return call.result, False
+
+    def __len__(self):
+        return len(self._calls)
+
+
+singleflight = SingleFlight()
+metrics.register_gauge('singleflight.in_flight', lambda: len(singleflight))
@@ -1,3 +1,618 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orchestrator import agent_client
+from orchestrator.models import Deployment, Function, FunctionInstance, InvocationRequest, WorkerNode
+from orchestrator.reaper import reap
+from orchestrator.tests import make_deployment, run_concurrently
+from runtime.tests import SLEEPY_HANDLER, free_port, start_runtime_host
+from .admission import AdmissionController, admission
+from .balancer import choose_instance, inflight
+from .cache import LocalResultCache, ResultCache
+from .dispatch import DatabaseInvocationQueue
+from .logwriter import InvocationLogWriter, invocation_writer
+from .models import QueuedInvocation
+from .pool import InstanceConnectionPool, instance_pool
+from .routing import mark_instance_error, routing_table
+from .services import batch_timeout
+from .singleflight import SingleFlight
+
+COUNTING_HANDLER = """
+import itertools
+
+calls = itertools.count(1)
+
+def handle(body, context):
+    return {'call': next(calls), 'body': body}
+"""
+
+RAW_HANDLER = """
+def handle(body, context):
+    return body[::-1]
+
+handle.input_format = 'bytes'
+handle.content_type = 'application/x-reversed'
+"""
+
+SLOW_COUNTING_HANDLER = """
+import itertools
+import time
+
+calls = itertools.count(1)
+
+def handle(body, context):
+    call = next(calls)
+    time.sleep(0.5)
+    return {'call': call}
+"""
+
+CHECKED_HANDLER = """
+def handle(body, context):
+    if body.get('fail'):
+        raise ValueError('asked to fail')
+    return body
+"""
+
+GENERATOR_HANDLER = """
+def handle(body, context):
+    for n in range(3):
+        yield {'n': n}
+"""
+
+
+class GatewayTestCase(TransactionTestCase):
+    """Functions deployed through the API and served by real runtime hosts on this machine."""
+
+    def setUp(self):
+        routing_table.invalidate_all()  # Routes cached by earlier tests name rows that are gone
+        self.addCleanup(invocation_writer.flush)  # Logs written before the tables are flushed
+        self.client = APIClient()
+        self.user = User.objects.create_user('tester', is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.worker = WorkerNode.objects.create(hostname='local', ip_address='127.0.0.1',
+                                                max_memory_mb=4096, available_memory_mb=4096)
+
+    def deploy(self, name, code, **fields):
+        function = Function.objects.create(name=name, code=code, **fields)
+        response = self.client.post(f'/api/orchestrator/functions/{function.pk}/deploy/', {}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return function, Deployment.objects.get(pk=response.json()['id'])
+
+    def serve(self, deployment, **env):
+        _, port = start_runtime_host(self, deployment.function.code, **env)
+        return FunctionInstance.objects.create(deployment=deployment, worker=self.worker, port=port, status='RUNNING',
+                                               max_concurrency=1)
+
+    def invoke(self, name, body, view='invoke'):
+        return self.client.post(f'/api/gateway/{view}/{name}/', body, format='json')
+
+    def logs(self, function):
+        invocation_writer.flush()
+        return InvocationRequest.objects.filter(function=function).order_by('start_time')
+
+
+class StreamedResultCacheTests(GatewayTestCase):
+    def test_cached_generator_output_is_served_again(self):
+        for coalesce in (True, False):
+            name = f'streamed-{coalesce}'
+            function, deployment = self.deploy(name, GENERATOR_HANDLER, cache_results=True, coalesce_requests=coalesce)
+            self.serve(deployment)
+            expected = [{'n': 0}, {'n': 1}, {'n': 2}]
+            for _ in range(3):
+                response = self.invoke(name, {'x': 1})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected)
+            self.assertEqual([log.is_cache_hit for log in self.logs(function)], [False, True, True], name)
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_entries_expire_after_their_ttl(self):
+        cache = LocalResultCache()
+        cache.set('a', 200, '1', ttl_seconds=10)
+        self.assertEqual(cache.get('a'), (200, '1'))
+        with mock.patch('gateway.cache.time.monotonic', return_value=time.monotonic() + 11):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual((len(cache), cache.size_bytes), (0, 0))
+
+    def test_least_recently_used_entries_are_dropped(self):
+        cache = LocalResultCache(max_entries=2)
+        cache.set('a', 200, '1', 60)
+        cache.set('b', 200, '2', 60)
+        cache.get('a')  # b is now the least recently used
+        cache.set('c', 200, '3', 60)
+        self.assertEqual([cache.get(key) for key in 'abc'], [(200, '1'), None, (200, '3')])
+
+    def test_size_is_counted_in_encoded_bytes(self):
+        cache = LocalResultCache(max_bytes=10)
+        cache.set('a', 200, '\u20ac\u20ac', 60)  # Two characters, six bytes
+        self.assertEqual(cache.size_bytes, 6)
+        cache.set('b', 200, '\u20ac\u20ac', 60)  # Over budget: the oldest goes
+        self.assertEqual((cache.get('a'), cache.size_bytes), (None, 6))
+        cache.set('c', 200, '\u20ac' * 4, 60)  # Larger than the whole budget: not stored
+        self.assertEqual((cache.get('c'), cache.get('b')), (None, (200, '\u20ac\u20ac')))
+
+    def test_backends_must_implement_get_and_set(self):
+        with self.assertRaises(TypeError):
+            ResultCache()
+
+
+class ResultCacheInvalidationTests(GatewayTestCase):
+    def test_activating_a_deployment_drops_cached_results(self):
+        function, first = self.deploy('cached', COUNTING_HANDLER, cache_results=True)
+        self.serve(first)
+        for _ in range(2):
+            self.assertEqual(self.invoke('cached', {'x': 1}).json()['call'], 1)
+        second = self.client.post(f'/api/orchestrator/functions/{function.pk}/deploy/', {}, format='json').json()['id']
+        self.assertNotEqual(second, first.pk)
+        self.client.post(f'/api/orchestrator/deployments/{first.pk}/rollback/', {}, format='json')
+        self.assertEqual(self.invoke('cached', {'x': 1}).json()['call'], 2)
+
+
+class InvocationQueueTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.function, self.deployment = self.deploy('queued', 'def handle(body, context):\n    return body\n')
+        self.queue = DatabaseInvocationQueue(visibility_seconds=60, max_attempts=3)
+
+    def enqueue(self, count):
+        for _ in range(count):
+            self.queue.enqueue(InvocationRequest(function=self.function, deployment=self.deployment,
+                                                 request_id=str(uuid.uuid4()), request_body='{}',
+                                                 start_time=timezone.now(), is_cold_start=False))
+
+    def expire_claims(self):
+        QueuedInvocation.objects.update(claimed_at=timezone.now() - timedelta(seconds=120))
+
+    def test_concurrent_consumers_never_claim_the_same_invocation(self):
+        self.enqueue(60)
+        claims, errors = [], []
+
+        def consume():
+            try:
+                while True:
+                    batch = self.queue.claim(4)
+                    if not batch:
+                        return
+                    claims.extend(i.pk for i in batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                close_old_connections()
+        consumers = [threading.Thread(target=consume) for _ in range(4)]
+        for consumer in consumers:
+            consumer.start()
+        for consumer in consumers:
+            consumer.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claims), 60)
+        self.assertEqual(len(set(claims)), 60)
+
+    def test_expired_claim_is_handed_out_again(self):
+        self.enqueue(1)
+        first = self.queue.claim(10)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(self.queue.claim(10), [])  # Still claimed
+        self.expire_claims()
+        again = self.queue.claim(10)
+        self.assertEqual([i.pk for i in again], [first[0].pk])
+        self.assertEqual(QueuedInvocation.objects.get().attempts, 2)
+
+    def test_invocation_that_never_finishes_fails_after_max_attempts(self):
+        self.enqueue(1)
+        for _ in range(3):
+            self.assertEqual(len(self.queue.claim(10)), 1)
+            self.expire_claims()  # The consumer died
+        self.assertEqual(self.queue.claim(10), [])
+        invocation = InvocationRequest.objects.get()
+        self.assertEqual(invocation.status, 'FAILURE')
+        self.assertIn('3 attempts', invocation.error_message)
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_released_invocation_fails_after_max_attempts(self):
+        self.enqueue(1)
+        for _ in range(2):
+            self.queue.release(self.queue.claim(10)[0], reason='no capacity')
+            self.assertEqual(InvocationRequest.objects.get().status, 'QUEUED')
+        self.queue.release(self.queue.claim(10)[0], reason='no capacity')
+        invocation = InvocationRequest.objects.get()
+        self.assertEqual(invocation.status, 'FAILURE')
+        self.assertEqual(invocation.error_message, 'Gave up after 3 attempts: no capacity')
+        self.assertEqual(self.queue.depth(), 0)
+
+
+class AdmissionTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.function, self.deployment = self.deploy('admitted', 'def handle(body, context):\n    return body\n')
+        # No memory left for cold starts
+        WorkerNode.objects.filter(pk=self.worker.pk).update(available_memory_mb=0)
+
+    def busy_instance(self):
+        instance = FunctionInstance.objects.create(deployment=self.deployment, worker=self.worker, port=free_port(),
+                                                   status='RUNNING', max_concurrency=1)
+        self.assertEqual(admission.acquire(routing_table.resolve('admitted')).pk, instance.pk)
+        self.addCleanup(admission.release, instance)
+        return instance
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        self.busy_instance()
+        with mock.patch.object(admission, 'max_queue_depth', 0):
+            response = self.invoke('admitted', {})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(admission.retry_after_seconds))
+        log = self.logs(self.function).get()
+        self.assertEqual((log.status, log.response_status_code, log.end_time is not None), ('THROTTLED', 429, True))
+
+    def test_wait_timeout_without_capacity_is_503_with_retry_after(self):
+        self.busy_instance()
+        with mock.patch.object(admission, 'max_wait_seconds', 0.1):
+            response = self.invoke('admitted', {})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(admission.retry_after_seconds))
+        self.assertEqual(admission.queue_depths(), {})
+        log = self.logs(self.function).get()
+        self.assertEqual((log.status, log.response_status_code), ('FAILURE', 503))
+
+    def test_rejected_batch_logs_every_item(self):
+        self.busy_instance()
+        with mock.patch.object(admission, 'max_queue_depth', 0):
+            response = self.client.post('/api/gateway/invoke/admitted/batch/', [{}, {}, {}], format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual([log.status for log in self.logs(self.function)], ['THROTTLED'] * 3)
+
+    def test_slot_released_when_the_function_fails(self):
+        function, deployment = self.deploy('failing', 'def handle(body, context):\n    raise ValueError(body)\n')
+        instance = self.serve(deployment)
+        for _ in range(2):  # The second call needs the slot the first one held
+            self.assertEqual(self.invoke('failing', {}).status_code, 500)
+        self.assertEqual(inflight.get(instance.pk), 0)
+
+    def test_slot_released_when_the_instance_is_unreachable(self):
+        instance = FunctionInstance.objects.create(deployment=self.deployment, worker=self.worker, port=free_port(),
+                                                   status='RUNNING', max_concurrency=1)
+        self.assertEqual(self.invoke('admitted', {}).status_code, 503)
+        self.assertEqual(inflight.get(instance.pk), 0)
+
+    def test_async_waiter_is_woken_by_release(self):
+        instance = FunctionInstance.objects.create(deployment=self.deployment, worker=self.worker, port=free_port(),
+                                                   status='RUNNING', max_concurrency=1)
+        route = routing_table.resolve('admitted')
+        # Polling alone would only look again after the whole wait
+        controller = AdmissionController(max_wait_seconds=5, poll_seconds=5)
+        self.assertEqual(controller.acquire(route).pk, instance.pk)
+        threading.Timer(0.1, controller.release, args=(instance,)).start()
+
+        started = time.monotonic()
+        acquired = asyncio.run(controller.aacquire(route))
+        self.assertEqual(acquired.pk, instance.pk)
+        self.assertLess(time.monotonic() - started, 1)
+        controller.release(instance)
+
+
+class BalancerTests(SimpleTestCase):
+    def setUp(self):
+        self.instances = [SimpleNamespace(pk=pk, max_concurrency=2) for pk in (9001, 9002, 9003)]
+
+    def route(self, strategy, deployment_id=1):
+        return SimpleNamespace(function=SimpleNamespace(load_balancing=strategy),
+                               deployment=SimpleNamespace(pk=deployment_id), instances=self.instances)
+
+    def busy(self, instance, calls):
+        for _ in range(calls):
+            inflight.acquire(instance.pk)
+            self.addCleanup(inflight.release, instance.pk)
+
+    def test_least_outstanding_picks_the_least_full_instance(self):
+        first, second, third = self.instances
+        third.max_concurrency = 8  # 2 of 8 is less full than 1 of 2
+        self.busy(first, 2)
+        self.busy(second, 1)
+        self.busy(third, 2)
+        self.assertIs(choose_instance(self.route('least_outstanding')), third)
+
+    def test_power_of_two_never_picks_the_busier_of_its_sample(self):
+        first, second, third = self.instances
+        self.busy(first, 2)
+        self.busy(third, 1)
+        for _ in range(20):
+            self.assertIsNot(choose_instance(self.route('power_of_two')), first)
+
+    def test_round_robin_cycles_per_deployment(self):
+        route, other = self.route('round_robin', deployment_id=-1), self.route('round_robin', deployment_id=-2)
+        start = self.instances.index(choose_instance(route))
+        choose_instance(other)
+        picked = [choose_instance(route) for _ in range(3)]
+        self.assertEqual(picked, [self.instances[(start + n) % 3] for n in (1, 2, 3)])
+
+    def test_most_recent_ignores_load(self):
+        self.busy(self.instances[0], 2)
+        self.assertIs(choose_instance(self.route('most_recent')), self.instances[0])
+
+    def test_candidates_and_unknown_strategies(self):
+        self.busy(self.instances[1], 1)
+        self.assertIs(choose_instance(self.route('unknown')), self.instances[0])  # least_outstanding
+        self.assertIs(choose_instance(self.route('most_recent'), instances=self.instances[1:]), self.instances[1])
+        self.assertIsNone(choose_instance(self.route('least_outstanding'), instances=[]))
+
+
+class InFlightReapTests(GatewayTestCase):
+    def test_instance_with_a_call_in_flight_is_not_reaped(self):
+        function, deployment = self.deploy('long', SLEEPY_HANDLER, idle_after_seconds=30, keep_warm_seconds=30)
+        for _ in range(2):
+            FunctionInstance.objects.create(deployment=deployment, worker=self.worker, port=free_port(),
+                                            status='RUNNING')
+        FunctionInstance.objects.update(last_accessed=timezone.now() - timedelta(hours=1))
+        busy = admission.acquire(routing_table.resolve('long'))  # A call starts and runs past the reap
+        self.addCleanup(admission.release, busy)
+        invocation_writer.flush()
+
+        with mock.patch.object(agent_client, 'stop_instance'):
+            reap()
+        statuses = dict(FunctionInstance.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses.pop(busy.pk), 'RUNNING')
+        self.assertEqual(list(statuses.values()), ['TERMINATED'])
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_warm_calls_reuse_one_connection(self):
+        _, port = start_runtime_host(self, SLEEPY_HANDLER)
+        pool = InstanceConnectionPool()
+        self.addCleanup(pool.clear)
+        url = f'http://127.0.0.1:{port}'
+        for _ in range(3):
+            self.assertEqual(pool.post(url, json={}, timeout=5).status_code, 200)
+        connection_pools = pool.get_session(url).get_adapter(url).poolmanager.pools
+        self.assertEqual([connection_pools[key].num_connections for key in connection_pools.keys()], [1])
+
+    def test_least_recently_used_instances_are_dropped(self):
+        pool = InstanceConnectionPool(max_instances=2)
+        a, b = pool.get_session('http://a'), pool.get_session('http://b')
+        pool.get_session('http://a')  # b is now the least recently used
+        pool.get_session('http://c')
+        self.assertEqual(len(pool), 2)
+        self.assertIs(pool.get_session('http://a'), a)
+        self.assertIsNot(pool.get_session('http://b'), b)
+
+    def test_idle_sessions_are_closed(self):
+        pool = InstanceConnectionPool(idle_seconds=60)
+        session = pool.get_session('http://a')
+        with mock.patch('gateway.pool.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNot(pool.get_session('http://a'), session)
+        self.assertEqual(len(pool), 1)
+
+
+class ConnectionPoolEvictionTests(GatewayTestCase):
+    def test_instance_marked_error_loses_its_session(self):
+        function, deployment = self.deploy('evicted', 'def handle(body, context):\n    return body\n')
+        instance = FunctionInstance.objects.create(deployment=deployment, worker=self.worker, port=free_port(),
+                                                   status='RUNNING')
+        session = instance_pool.get_session(instance.get_url())
+        mark_instance_error(instance)
+        self.assertEqual(FunctionInstance.objects.get(pk=instance.pk).status, 'ERROR')
+        self.assertIsNot(instance_pool.get_session(instance.get_url()), session)
+        instance_pool.evict(instance.get_url())
+
+
+class RawPassthroughTests(GatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.function, deployment = self.deploy('reversed', RAW_HANDLER, raw_passthrough=True)
+        self.serve(deployment)
+
+    def post(self, body, content_type, path='/api/gateway/invoke/reversed/'):
+        return self.client.post(path, body, content_type=content_type)
+
+    def test_bytes_are_relayed_unchanged(self):
+        body = bytes(range(256)) * 4  # Not valid UTF-8 or JSON
+        response = self.post(body, 'application/octet-stream')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/x-reversed'))
+        self.assertEqual(response.content, body[::-1])
+        log = self.logs(self.function).get()
+        self.assertEqual((log.status, log.request_body), ('SUCCESS', '<1024 bytes of application/octet-stream>'))
+
+    def test_json_looking_bodies_are_not_parsed(self):
+        body = b'{"b": 1,  "a": 2}'
+        self.assertEqual(self.post(body, 'application/json').content, body[::-1])
+        self.assertEqual(self.logs(self.function).get().request_body, body.decode())
+
+    def test_async_mode_is_refused(self):
+        response = self.post(b'abc', 'application/octet-stream', path='/api/gateway/invoke/reversed/?mode=async')
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncInvokeTests(GatewayTestCase):
+    def test_json_invocation(self):
+        function, deployment = self.deploy('echoed', COUNTING_HANDLER)
+        self.serve(deployment)
+        response = self.invoke('echoed', {'x': 1}, view='ainvoke')
+        self.assertEqual((response.status_code, response.json()), (200, {'call': 1, 'body': {'x': 1}}))
+        log = self.logs(function).get()
+        self.assertEqual((log.status, log.is_cold_start, log.response_status_code), ('SUCCESS', False, 200))
+
+    def test_raw_passthrough_relays_bytes(self):
+        function, deployment = self.deploy('reversed', RAW_HANDLER, raw_passthrough=True)
+        self.serve(deployment)
+        body = bytes(range(256))
+        response = self.client.post('/api/gateway/ainvoke/reversed/', body, content_type='application/octet-stream')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/x-reversed'))
+        self.assertEqual(response.content, body[::-1])
+        self.assertEqual(self.logs(function).get().request_body, '<256 bytes of application/octet-stream>')
+
+    def test_cached_results_are_served_again(self):
+        function, deployment = self.deploy('cached', COUNTING_HANDLER, cache_results=True)
+        self.serve(deployment)
+        for view in ('ainvoke', 'ainvoke', 'invoke'):  # Both views share the cache
+            response = self.invoke('cached', {'x': 1}, view=view)
+            self.assertEqual(response.json(), {'call': 1, 'body': {'x': 1}})
+        self.assertEqual([log.is_cache_hit for log in self.logs(function)], [False, True, True])
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        function, deployment = self.deploy('busy', COUNTING_HANDLER)
+        instance = self.serve(deployment)
+        WorkerNode.objects.filter(pk=self.worker.pk).update(available_memory_mb=0)
+        self.assertEqual(admission.acquire(routing_table.resolve('busy')).pk, instance.pk)
+        self.addCleanup(admission.release, instance)
+        with mock.patch.object(admission, 'max_queue_depth', 0):
+            response = self.invoke('busy', {}, view='ainvoke')
+        self.assertEqual((response.status_code, response['Retry-After']), (429, str(admission.retry_after_seconds)))
+        log = self.logs(function).get()
+        self.assertEqual((log.status, log.response_status_code, log.instance), ('THROTTLED', 429, None))
+
+
+class BatchInvokeTests(GatewayTestCase):
+    def test_every_item_gets_its_own_result_and_log(self):
+        function, deployment = self.deploy('batched', CHECKED_HANDLER)
+        self.serve(deployment)
+        items = [{'x': 1}, {'fail': True}, {'x': 3}]
+        response = self.client.post('/api/gateway/invoke/batched/batch/', {'items': items}, format='json',
+                                    HTTP_X_REQUEST_ID='b1')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([(r['status_code'], r['body'].get('x')) for r in results], [(200, 1), (500, None), (200, 3)])
+
+        logs = {log.request_id: log for log in self.logs(function)}
+        self.assertEqual(sorted(logs), ['b1:0', 'b1:1', 'b1:2'])
+        self.assertEqual([logs[f'b1:{i}'].status for i in range(3)], ['SUCCESS', 'FAILURE', 'SUCCESS'])
+        self.assertEqual([str(logs[f'b1:{i}'].id) for i in range(3)], [r['invocation_id'] for r in results])
+        self.assertEqual(len({log.instance_id for log in logs.values()}), 1)
+
+    def test_batch_size_is_capped(self):
+        self.deploy('capped', CHECKED_HANDLER)
+        with self.settings(GATEWAY_BATCH_MAX_ITEMS=2):
+            response = self.client.post('/api/gateway/invoke/capped/batch/', [{}, {}, {}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_timeout_is_bounded(self):
+        function = Function(name='slow', timeout_seconds=30)
+        with self.settings(GATEWAY_BATCH_MAX_TIMEOUT_SECONDS=120):
+            self.assertEqual(batch_timeout(function, 2), 65)
+            self.assertEqual(batch_timeout(function, 1000), 120)
+        with self.settings(GATEWAY_BATCH_MAX_TIMEOUT_SECONDS=10):
+            self.assertEqual(batch_timeout(function, 1000), 35)  # Still enough for one call
+
+
+class CoalescingTests(GatewayTestCase):
+    def test_concurrent_identical_calls_share_one_downstream_call(self):
+        function, deployment = self.deploy('coalesced', SLOW_COUNTING_HANDLER, coalesce_requests=True)
+        instance = self.serve(deployment)
+        FunctionInstance.objects.filter(pk=instance.pk).update(max_concurrency=4)
+
+        def invoke():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return client.post('/api/gateway/invoke/coalesced/', {'x': 1}, format='json').json()
+        results, errors = run_concurrently(invoke, 5)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [{'call': 1}] * 5)
+        logs = self.logs(function)
+        self.assertEqual([(log.status, log.instance_id) for log in logs], [('SUCCESS', instance.pk)] * 5)
+        self.assertEqual(self.invoke('coalesced', {'x': 2}).json(), {'call': 2})  # Nothing in flight to share
+
+    def test_errors_are_shared_with_waiters(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fail():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('shared')
+
+        def do():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                return str(e)
+        results, errors = run_concurrently(do, 4)
+        self.assertEqual((len(calls), results, errors), (1, ['shared'] * 4, []))
+
+
+class RoutingTableTests(GatewayTestCase):
+    def test_deploy_and_rollback_switch_the_route(self):
+        function, first = self.deploy('routed', COUNTING_HANDLER)
+        self.assertEqual(routing_table.resolve('routed').deployment.pk, first.pk)
+        response = self.client.post(f'/api/orchestrator/functions/{function.pk}/deploy/', {}, format='json')
+        second = response.json()['id']
+        self.assertEqual(str(routing_table.resolve('routed').deployment.pk), second)
+        self.client.post(f'/api/orchestrator/deployments/{first.pk}/rollback/', {}, format='json')
+        self.assertEqual(routing_table.resolve('routed').deployment.pk, first.pk)
+
+    def test_instance_leaves_the_route_when_marked_error(self):
+        function, deployment = self.deploy('routed', COUNTING_HANDLER)
+        instance = FunctionInstance.objects.create(deployment=deployment, worker=self.worker, port=free_port(),
+                                                   status='RUNNING')
+        route = routing_table.resolve('routed')
+        self.assertEqual([i.pk for i in route.instances], [instance.pk])
+
+        instance = FunctionInstance.objects.get(pk=instance.pk)
+        instance.rss_mb = 41.5
+        with self.assertNumQueries(1):  # Heartbeat updates don't look anything up for routing
+            instance.save(update_fields=['rss_mb'])
+        self.assertIs(routing_table.get_cached('routed'), route)
+
+        instance.status = 'ERROR'
+        instance.save(update_fields=['status'])
+        self.assertIsNone(routing_table.get_cached('routed'))
+        self.assertEqual(routing_table.resolve('routed').instances, [])
+
+
+class InvocationLogWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.deployment = make_deployment('logged')
+
+    def new_log(self, **fields):
+        return InvocationRequest(function=self.deployment.function, deployment=self.deployment,
+                                 request_id=str(uuid.uuid4()), start_time=timezone.now(), is_cold_start=False,
+                                 status='SUCCESS', **fields)
+
+    def test_flush_writes_everything_submitted(self):
+        writer = InvocationLogWriter(batch_size=2, flush_interval=0.01)
+        for n in range(50):
+            writer.submit(self.new_log())
+            time.sleep(0.002)  # Long enough for the background thread to take it
+            writer.flush()
+            self.assertEqual(InvocationRequest.objects.count(), n + 1)
+        self.assertEqual((writer.written, writer.dropped), (50, 0))
+
+    def test_full_queue_drops_rows(self):
+        writer = InvocationLogWriter(max_pending=2, overflow='drop')
+        with mock.patch.object(writer, '_ensure_started'):  # Nothing drains the queue
+            self.assertEqual([writer.submit(self.new_log()) for _ in range(3)], [True, True, False])
+        self.assertEqual(writer.dropped, 1)
+        writer.flush()
+        self.assertEqual(InvocationRequest.objects.count(), 2)
+
+    def test_block_policy_waits_for_space_then_drops(self):
+        writer = InvocationLogWriter(max_pending=1, overflow='block', block_timeout=0.2)
+        with mock.patch.object(writer, '_ensure_started'):
+            writer.submit(self.new_log())
+            started = time.monotonic()
+            self.assertFalse(writer.submit(self.new_log()))
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+            started = time.monotonic()
+            self.assertFalse(writer.submit(self.new_log(), block=False))  # Async callers never wait
+            self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(writer.dropped, 2)
+
+    def test_bad_row_does_not_lose_its_batch(self):
+        writer = InvocationLogWriter()
+        good = self.new_log()
+        orphan = InvocationRequest(function_id=uuid.uuid4(), deployment=self.deployment, request_id='orphan',
+                                   start_time=timezone.now(), is_cold_start=False, status='SUCCESS')
+        with mock.patch.object(writer, '_ensure_started'), self.assertLogs('gateway.logwriter', 'ERROR'):
+            writer.submit_many([good, orphan])
+            writer.flush()
+        self.assertEqual(list(InvocationRequest.objects.values_list('pk', flat=True)), [good.pk])
+        self.assertEqual((writer.written, writer.dropped), (1, 1))
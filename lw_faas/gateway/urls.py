@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path('invoke/<str:function_name>/', views.InvokeView.as_view(), name='invoke-function'),
+    path('invoke/<str:function_name>/batch/', views.BatchInvokeView.as_view(), name='batch-invoke-function'),
+    path('ainvoke/<str:function_name>/', views.AsyncInvokeView.as_view(), name='ainvoke-function'),
+    path('metrics/', views.MetricsView.as_view(), name='gateway-metrics'),
 ]
\ No newline at end of file
@@ -1,13 +1,147 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from rest_framework.exceptions import NotFound, ValidationError
-import requests
+from rest_framework.exceptions import NotFound, ValidationError, APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.urls import reverse
 import json
 import uuid
-from datetime import datetime
+from contextlib import contextmanager
 from orchestrator.models import Function, Deployment, FunctionInstance, InvocationRequest
 from orchestrator.serializers import InvocationRequestSerializer
+from .admission import NoCapacity, QueueFull
+from .cache import payload_hash, result_cache
+from .dispatch import invocation_queue
+from .logwriter import invocation_writer
+from .metrics import metrics
+from .routing import routing_table
+from .services import (RawResponse, ResponseStream, aproxy_invocation, loggable_body, proxy_batch,
+                       proxy_invocation)
+from .singleflight import singleflight
+
+
+def is_async_mode(request):
+    """`X-Invocation-Mode: async` or `?mode=async` selects fire-and-forget invocation."""
+    mode = request.headers.get('X-Invocation-Mode') or request.GET.get('mode', '')
+    return mode.lower() == 'async'
+
+
+def _accepted(request, invocation_log):
+    """Body of the 202 returned for a queued invocation."""
+    metrics.incr('invocations.queued')
+    return {
+        "invocation_id": str(invocation_log.id),
+        "status": invocation_log.status,
+        "result_url": request.build_absolute_uri(reverse('invocation-detail', kwargs={'pk': invocation_log.id})),
+    }
+
+
+# Steps shared by InvokeView and AsyncInvokeView; `request` is a DRF Request.
+
+def _request_body(function, request):
+    """
+    The body to send to the function and the text to log for it. Raw pass-through
+    functions get the request body as sent, without parsing it.
+    """
+    if function.raw_passthrough:
+        return request.body, loggable_body(request.body, request.content_type)
+    request_body = json.dumps(request.data)
+    return request_body, request_body
+
+
+def _new_invocation_log(route, request, logged_body):
+    """Invocation log for a call (written in the background once the call completes)."""
+    invocation_id = uuid.uuid4()
+    return InvocationRequest(
+        id=invocation_id,
+        function=route.function,
+        deployment=route.deployment,
+        request_id=request.META.get('HTTP_X_REQUEST_ID', str(invocation_id)),
+        request_body=logged_body, # Be cautious with size/PII
+        request_headers=dict(request.headers),
+        start_time=timezone.now(),
+        is_cold_start=False # Assume warm start, update if not
+    )
+
+
+@contextmanager
+def _logging_rejections(invocation_logs, block=True):
+    """
+    Write the logs of invocations turned away before reaching an instance:
+    THROTTLED for a full admission queue (429), FAILURE when no instance could
+    be had (503). The exception is re-raised for the view to answer with.
+    """
+    try:
+        yield
+    except (QueueFull, NoCapacity) as e:
+        end_time = timezone.now()
+        for invocation_log in invocation_logs:
+            invocation_log.status = 'THROTTLED' if isinstance(e, QueueFull) else 'FAILURE'
+            invocation_log.response_status_code = e.status_code
+            invocation_log.error_message = str(e.detail)
+            invocation_log.end_time = end_time
+        invocation_writer.submit_many(invocation_logs, block=block)
+        raise
+
+
+def _enqueue(request, invocation_log):
+    """Persist and queue a fire-and-forget invocation; returns the body of the 202."""
+    if invocation_log.function.raw_passthrough:
+        raise ValidationError("Async mode is not available for raw pass-through functions.")
+    invocation_queue.enqueue(invocation_log)
+    return _accepted(request, invocation_log)
+
+
+def _payload_digest(function, request):
+    return payload_hash(request.data) if function.cache_results or function.coalesce_requests else None
+
+
+def _from_cache(route, invocation_log, digest):
+    """The cached (status, data) for a repeated payload, recorded on the log as a hit, or None."""
+    cached = result_cache.get(result_cache.key(route, digest))
+    if cached is not None:
+        try:
+            data = json.loads(cached[1])
+        except ValueError:
+            cached = None  # Not JSON (cached before streamed bodies were stored as JSON); run the call again
+    if cached is None:
+        metrics.incr('result_cache.misses')
+        return None
+    metrics.incr('result_cache.hits')
+    invocation_log.is_cache_hit = True
+    invocation_log.status = 'SUCCESS'
+    invocation_log.response_status_code, invocation_log.response_body = cached
+    invocation_log.end_time = timezone.now()
+    return cached[0], data
+
+
+def _store_in_cache(route, invocation_log, digest):
+    if invocation_log.status == 'SUCCESS':
+        result_cache.set(result_cache.key(route, digest), invocation_log.response_status_code,
+                         invocation_log.response_body, route.function.cache_ttl_seconds)
+
+
+def _coalesced_proxy(route, invocation_log, digest):
+    """Share one downstream call among concurrent identical invocations."""
+    def call():
+        return proxy_invocation(route, invocation_log) + (invocation_log,)
+
+    (response_status, response_data, leader_log), shared = singleflight.do((route.deployment.pk, digest), call)
+    if shared:
+        # Record the shared outcome on this invocation's own log row
+        for field in ('instance', 'is_cold_start', 'status', 'response_status_code',
+                      'response_body', 'error_message'):
+            setattr(invocation_log, field, getattr(leader_log, field))
+    return response_status, response_data
+
 
 class InvokeView(APIView):
     """
@@ -18,100 +152,236 @@ class InvokeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, function_name, *args, **kwargs):
-        # 1. Get the function and its active deployment
+        # 1. Get the function and its active deployment (from memory on the warm path)
         try:
-            function = Function.objects.get(name=function_name, is_active=True)
-            deployment = function.deployments.get(is_active=True)
+            route = routing_table.resolve(function_name)
         except (Function.DoesNotExist, Deployment.DoesNotExist):
             raise NotFound(detail="Function not found or no active deployment.")
+        function = route.function
 
-        # 2. Prepare invocation log
-        invocation_id = uuid.uuid4()
-        invocation_log = InvocationRequest.objects.create(
-            id=invocation_id,
-            function=function,
-            deployment=deployment,
-            request_id=request.META.get('HTTP_X_REQUEST_ID', str(invocation_id)),
-            request_body=json.dumps(request.data), # Be cautious with size/PII
-            request_headers=dict(request.headers),
-            start_time=datetime.now(),
-            is_cold_start=False # Assume warm start, update if not
-        )
+        # 2. Prepare invocation log (written in the background once the call completes)
+        request_body, logged_body = _request_body(function, request)
+        invocation_log = _new_invocation_log(route, request, logged_body)
 
-        # 3. Find or launch a function instance (orchestrator logic)
-        # This is simplified. In reality, this would be a complex service call.
-        instance = self._get_available_instance(deployment)
-        if not instance:
-            # Trigger cold start logic
-            instance = self._trigger_cold_start(deployment)
-            invocation_log.is_cold_start = True
-            invocation_log.save()
-
-        # 4. Proxy the request to the worker node
-        target_url = f"{instance.get_url()}/" # Points to runtime_host's server
-        try:
-            # Forward headers, body, etc.
-            headers = {'Content-Type': 'application/json'}
-            # You might forward auth headers or inject a specific one for the runtime
-            resp = requests.post(
-                target_url,
-                data=json.dumps(request.data),
-                headers=headers,
-                timeout=function.timeout_seconds + 5 # Add buffer
-            )
-            response_data = resp.json()
-            response_status = resp.status_code
-
-        except requests.exceptions.Timeout:
-            # Handle timeout
-            response_status = status.HTTP_504_GATEWAY_TIMEOUT
-            response_data = {"error": "Function execution timed out"}
-            invocation_log.status = 'TIMEOUT'
-        except requests.exceptions.ConnectionError:
-            # Handle instance failure
-            response_status = status.HTTP_503_SERVICE_UNAVAILABLE
-            response_data = {"error": "Function instance unavailable"}
-            instance.status = 'ERROR' # Mark instance as errored
-            instance.save()
-            invocation_log.status = 'FAILURE'
-            invocation_log.error_message = "Connection to worker failed"
-        except Exception as e:
-            # Handle any other error
-            response_status = status.HTTP_500_INTERNAL_SERVER_ERROR
-            response_data = {"error": "Internal gateway error"}
-            invocation_log.status = 'FAILURE'
-            invocation_log.error_message = str(e)
-        else:
-            # Success path
-            invocation_log.response_status_code = resp.status_code
-            invocation_log.response_body = resp.text
-            invocation_log.status = 'SUCCESS' if resp.ok else 'FAILURE'
+        # Fire-and-forget: persist the invocation, queue it and answer right away
+        if is_async_mode(request):
+            data = _enqueue(request, invocation_log)
+            return Response(data=data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['result_url']})
+
+        if function.raw_passthrough:
+            with _logging_rejections([invocation_log]):
+                return self._raw_invoke(route, invocation_log, request_body, request.content_type)
+
+        # Serve a repeated payload of a cacheable function without running it again
+        digest = _payload_digest(function, request)
+        if function.cache_results:
+            cached = _from_cache(route, invocation_log, digest)
+            if cached is not None:
+                invocation_writer.submit(invocation_log)
+                return Response(data=cached[1], status=cached[0])
+
+        # 3. Reserve a slot on a warm instance, queueing briefly if all are busy,
+        # or launch a new instance (orchestrator logic), and
+        # 4. Proxy the request to the worker node over a pooled keep-alive connection
+        with _logging_rejections([invocation_log]):
+            if function.coalesce_requests:
+                response_status, response_data = _coalesced_proxy(route, invocation_log, digest)
+            else:
+                # Streamed output of a cacheable function is read whole, so it can be cached
+                response_status, response_data = proxy_invocation(route, invocation_log,
+                                                                  stream=not function.cache_results)
+        if isinstance(response_data, ResponseStream):
+            return self._streaming_response(invocation_log, response_data)
+        if function.cache_results:
+            _store_in_cache(route, invocation_log, digest)
 
         # 5. Finalize the invocation log
-        invocation_log.end_time = datetime.now()
-        invocation_log.save()
+        invocation_log.end_time = timezone.now()
+        invocation_writer.submit(invocation_log)
 
         # 6. Return the response to the client
         return Response(data=response_data, status=response_status)
 
-    def _get_available_instance(self, deployment):
-        """Finds a RUNNING or IDLE instance for the deployment."""
+    def _raw_invoke(self, route, invocation_log, body, content_type):
+        """Forward the body unchanged and relay the response bytes without parsing them."""
+        response_status, response_data = proxy_invocation(
+            route, invocation_log, stream=True, body=body,
+            content_type=content_type or 'application/octet-stream', raw=True
+        )
+        if isinstance(response_data, ResponseStream):
+            return self._streaming_response(invocation_log, response_data)
+
+        invocation_log.end_time = timezone.now()
+        invocation_writer.submit(invocation_log)
+        if isinstance(response_data, RawResponse):
+            return HttpResponse(response_data.content, status=response_status, content_type=response_data.content_type)
+        # The gateway's own errors (timeouts, unavailable instances)
+        return Response(data=response_data, status=response_status)
+
+    def _streaming_response(self, invocation_log, stream):
+        """Relay a generator handler's output to the client chunk by chunk as it arrives."""
+        def finalize():
+            invocation_log.end_time = timezone.now()
+            invocation_writer.submit(invocation_log)
+            metrics.observe('stream.bytes', stream.size)
+
+        stream.on_close = finalize
+        response = StreamingHttpResponse(stream, status=stream.status_code, content_type=stream.content_type)
+        response['X-Invocation-Id'] = str(invocation_log.id)
+        return response
+
+
+class BatchInvokeView(APIView):
+    """
+    Invoke a function once per payload, with one gateway -> instance round trip.
+    POST /invoke/<function_name>/batch/
+    Body: [payload, ...] or {"items": [payload, ...]}; every item gets its own log row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, function_name, *args, **kwargs):
+        # 1. Get the function and its active deployment (from memory on the warm path)
+        try:
+            route = routing_table.resolve(function_name)
+        except (Function.DoesNotExist, Deployment.DoesNotExist):
+            raise NotFound(detail="Function not found or no active deployment.")
+
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty JSON array of payloads, or {\"items\": [...]}.")
+        if len(items) > settings.GATEWAY_BATCH_MAX_ITEMS:
+            raise ValidationError(f"A batch may contain at most {settings.GATEWAY_BATCH_MAX_ITEMS} items.")
+
+        # 2. Prepare one invocation log per item (written in bulk once the batch completes)
+        batch_id = request.META.get('HTTP_X_REQUEST_ID')
+        start_time = timezone.now()
+        request_headers = dict(request.headers)
+        invocation_logs = []
+        for index, item in enumerate(items):
+            invocation_id = uuid.uuid4()
+            invocation_logs.append(InvocationRequest(
+                id=invocation_id,
+                function=route.function,
+                deployment=route.deployment,
+                request_id=f"{batch_id}:{index}" if batch_id else str(invocation_id),
+                request_body=json.dumps(item),
+                request_headers=request_headers,
+                start_time=start_time,
+                is_cold_start=False
+            ))
+
+        # 3. Reserve one instance slot for the whole batch and
+        # 4. Send every item to it in a single request
+        with _logging_rejections(invocation_logs):
+            response_status, results = proxy_batch(route, invocation_logs, items)
+
+        # 5. Finalize the invocation logs
+        end_time = timezone.now()
+        for invocation_log in invocation_logs:
+            invocation_log.end_time = end_time
+        invocation_writer.submit_many(invocation_logs)
+
+        # 6. Return per-item results, or the error that failed the whole batch
+        if response_status != status.HTTP_200_OK:
+            return Response(data=results, status=response_status)
+        return Response(data={"results": [
+            {"invocation_id": str(invocation_log.id), **result}
+            for invocation_log, result in zip(invocation_logs, results)
+        ]})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncInvokeView(View):
+    """
+    Non-blocking variant of InvokeView for ASGI deployments.
+    POST /ainvoke/<function_name>/
+
+    Takes the same steps as InvokeView, but waiting for an instance slot and
+    for the function holds no worker thread. Generator output is returned
+    whole rather than relayed as it arrives, and coalesced calls wait for
+    their shared call on a thread.
+    """
+
+    async def post(self, request, function_name, *args, **kwargs):
+        # Authenticate and parse with the same DRF authenticators and parsers InvokeView uses
+        request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                          authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            user = await sync_to_async(lambda: request.user)()
+        except APIException as e:
+            return self._error_response(e)
+        if not (user and user.is_authenticated):
+            return JsonResponse({"detail": "Authentication credentials were not provided."},
+                                status=status.HTTP_403_FORBIDDEN)
+
+        # 1. Get the function and its active deployment; only a routing miss touches the database
+        try:
+            route = routing_table.get_cached(function_name) or await sync_to_async(routing_table.resolve)(function_name)
+        except (Function.DoesNotExist, Deployment.DoesNotExist):
+            return JsonResponse({"detail": "Function not found or no active deployment."},
+                                status=status.HTTP_404_NOT_FOUND)
+        function = route.function
+
         try:
-            # Simple strategy: find the most recently used IDLE instance
-            return FunctionInstance.objects.filter(
-                deployment=deployment,
-                status__in=['RUNNING', 'IDLE'],
-                worker__status='ONLINE'
-            ).order_by('-last_accessed').first()
-        except FunctionInstance.DoesNotExist:
-            return None
-
-    def _trigger_cold_start(self, deployment):
-        """Complex logic to schedule a function on a worker."""
-        # This is a massive simplification.
-        # 1. Would find a suitable worker with capacity
-        # 2. Would call the runtime management API on that worker to spawn an instance
-        # 3. Would create and return a new FunctionInstance record with status 'PENDING'
-        # 4. Would wait/poll for the instance to become 'RUNNING'
-        # For the PoC, this is the core complexity to implement.
-        raise NotImplementedError("Cold start logic not implemented for PoC.")
+            # 2. Prepare invocation log (written in the background once the call completes)
+            request_body, logged_body = _request_body(function, request)
+            invocation_log = _new_invocation_log(route, request, logged_body)
+
+            # Fire-and-forget: persist the invocation, queue it and answer right away
+            if is_async_mode(request):
+                data = await sync_to_async(_enqueue)(request, invocation_log)
+                response = JsonResponse(data, status=status.HTTP_202_ACCEPTED)
+                response['Location'] = data['result_url']
+                return response
+
+            # Serve a repeated payload of a cacheable function without running it again
+            digest = None if function.raw_passthrough else _payload_digest(function, request)
+            if function.cache_results and not function.raw_passthrough:
+                cached = _from_cache(route, invocation_log, digest)
+                if cached is not None:
+                    invocation_writer.submit(invocation_log, block=False)
+                    return JsonResponse(cached[1], status=cached[0], safe=False)
+
+            # 3. Reserve a slot on a warm instance (waiting without a thread) or launch one, and
+            # 4. Proxy the request without blocking a thread
+            with _logging_rejections([invocation_log], block=False):
+                if function.coalesce_requests and not function.raw_passthrough:
+                    response_status, response_data = await sync_to_async(_coalesced_proxy, thread_sensitive=False)(
+                        route, invocation_log, digest)
+                else:
+                    response_status, response_data = await aproxy_invocation(
+                        route, invocation_log, body=request_body, raw=function.raw_passthrough,
+                        content_type=(request.content_type or 'application/octet-stream') if function.raw_passthrough
+                        else 'application/json'
+                    )
+        except APIException as e:
+            return self._error_response(e)
+        if function.cache_results and not function.raw_passthrough:
+            _store_in_cache(route, invocation_log, digest)
+
+        # 5. Finalize the invocation log
+        invocation_log.end_time = timezone.now()
+        invocation_writer.submit(invocation_log, block=False)
+
+        # 6. Return the response to the client
+        if isinstance(response_data, RawResponse):
+            return HttpResponse(response_data.content, status=response_status, content_type=response_data.content_type)
+        return JsonResponse(response_data, status=response_status, safe=False)
+
+    @staticmethod
+    def _error_response(exc):
+        response = JsonResponse({"detail": exc.detail}, status=exc.status_code)
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = str(int(exc.wait))
+        return response
+
+
+class MetricsView(APIView):
+    """
+    In-process gateway metrics (queue depth and wait time, counters).
+    GET /metrics/
+    """
+    permission_classes = [permissions.AllowAny] # [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.snapshot())
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Function, Deployment, WorkerNode, FunctionInstance, InvocationRequest
+from .models import CodeBlob, Function, Deployment, WorkerNode, FunctionInstance, InvocationRequest, WorkerCacheEntry, PrewarmForecast
 
 
 
@@ -10,9 +10,12 @@ class FunctionAdmin(admin.ModelAdmin):
     search_fields = ('name', )
 
 admin.site.register(Deployment)
+admin.site.register(CodeBlob)
 admin.site.register(WorkerNode)
+admin.site.register(WorkerCacheEntry)
 admin.site.register(FunctionInstance)
 admin.site.register(InvocationRequest)
+admin.site.register(PrewarmForecast)
 
 
 # @admin.register(Deployment)
@@ -0,0 +1,68 @@
+"""
+HTTP client for the worker agents' control servers (runtime/agent.py).
+"""
+import requests
+from django.conf import settings
+
+_session = requests.Session()
+
+
+class AgentError(Exception):
+    """The agent couldn't be reached (status_code None) or refused the command."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _agent_url(worker, path):
+    if not worker.agent_port:
+        raise AgentError(f"Worker {worker.hostname} has no agent registered")
+    return f"http://{worker.ip_address}:{worker.agent_port}{path}"
+
+
+def _headers():
+    return {'X-Agent-Token': settings.WORKER_AGENT_TOKEN} if settings.WORKER_AGENT_TOKEN else {}
+
+
+def _call(method, worker, path, timeout, **kwargs):
+    try:
+        resp = _session.request(method, _agent_url(worker, path), headers=_headers(), timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        raise AgentError(f"Agent on {worker.hostname} unreachable: {e}")
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {'error': resp.text}
+    if not resp.ok:
+        raise AgentError(f"Agent on {worker.hostname} answered {resp.status_code}: {data.get('error', data)}",
+                         status_code=resp.status_code)
+    return data
+
+
+def spawn_instance(instance):
+    """
+    Ask the instance's worker to start a runtime host for it. Returns once the
+    host accepts connections: {"instance_id", "port", "pid", "spawn_mode", "startup_ms"}.
+    """
+    deployment = instance.deployment
+    spec = {
+        'instance_id': str(instance.pk),
+        'deployment_id': str(deployment.pk),
+        'code_sha256': deployment.code_blob_id,
+        'requirements_sha256': deployment.requirements_blob_id,
+        'handler': deployment.entry_point_snapshot,
+        'ready_timeout': settings.WORKER_AGENT_SPAWN_TIMEOUT_SECONDS,
+    }
+    # Leave the agent time to report its own readiness timeout
+    return _call('POST', instance.worker, '/instances', settings.WORKER_AGENT_SPAWN_TIMEOUT_SECONDS + 10, json=spec)
+
+
+def stop_instance(instance):
+    """Ask the instance's worker to stop its runtime host. An instance the agent doesn't know counts as stopped."""
+    try:
+        return _call('DELETE', instance.worker, f"/instances/{instance.pk}", settings.WORKER_AGENT_STOP_TIMEOUT_SECONDS)
+    except AgentError as e:
+        if e.status_code == 404:
+            return {'instance_id': str(instance.pk), 'exit_code': None}
+        raise
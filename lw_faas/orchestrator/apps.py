@@ -1,6 +1,23 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _serving():
+    """False for management commands other than runserver; True under WSGI/ASGI servers."""
+    if os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin'):
+        return True
+    return len(sys.argv) > 1 and sys.argv[1] == 'runserver'
 
 
 class OrchestratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orchestrator'
+
+    def ready(self):
+        # Workers that stop heartbeating are marked OFFLINE even by processes no heartbeat reaches
+        if settings.WORKER_LIVENESS_DETECTOR and _serving():
+            from .liveness import worker_registry
+            worker_registry.start()
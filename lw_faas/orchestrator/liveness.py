@@ -0,0 +1,200 @@
+"""
+In-memory worker liveness: heartbeats without a database write each.
+
+Workers heartbeat every few seconds (runtime/agent.py). `worker_registry` keeps
+each worker's last heartbeat and the fields it reports in memory and only
+writes to WorkerNode when something changes: a new worker, a new address or
+agent port, a worker coming back ONLINE. `last_heartbeat` itself is written
+for all workers heard from in one UPDATE every WORKER_HEARTBEAT_FLUSH_SECONDS,
+so it lags by up to that much.
+
+A background thread flushes heartbeats and runs the failure detector: ONLINE
+workers whose `last_heartbeat` is older than WORKER_HEARTBEAT_TIMEOUT_SECONDS
+become OFFLINE, their live instances ERROR, and the instances' memory is
+returned. The detector reads the database, so with several orchestrator
+processes a worker heartbeating to any of them stays ONLINE, as long as the
+flush interval is well under the timeout. The gateway reads the registry
+directly (is_routable) to stop routing to a silent worker before the detector
+has run.
+
+Serving processes start the thread when Django loads (OrchestratorConfig.ready),
+so a process that never receives a heartbeat, such as a gateway-only process or
+one restarted while the workers are down, still detects silent workers.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import FunctionInstance, WorkerNode
+from .provisioning import LIVE_STATUSES
+from .scheduler import release_instance_memory, resize_capacity
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK = 500  # Worker ids per UPDATE, below SQLite's parameter limit
+
+
+class _WorkerState:
+    __slots__ = ('worker', 'seen')
+
+    def __init__(self, worker):
+        self.worker = worker  # The WorkerNode as last written; only the registry saves it
+        self.seen = time.monotonic()
+
+
+class WorkerRegistry:
+
+    def __init__(self, flush_interval=10.0, timeout=30.0, check_interval=5.0):
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.writes = 0  # Statements that changed worker rows, for benchmarks/heartbeats.py
+        self._workers = {}  # hostname -> _WorkerState
+        self._by_id = {}    # worker id -> _WorkerState
+        self._dirty = set()  # Ids heard from since the last flush
+        self._lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def start(self):
+        """Start the flush and failure detector thread, once per process."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='worker-liveness', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def heartbeat(self, hostname, ip_address=None, agent_port=None, max_memory_mb=None, available_memory_mb=None):
+        """
+        Record a heartbeat and return the worker's WorkerNode (treat it as read-only).
+        Registers unknown workers; otherwise writes only what changed.
+        """
+        self.start()
+        state = self._workers.get(hostname)
+        if state is None:
+            worker, created = WorkerNode.objects.get_or_create(
+                hostname=hostname,
+                defaults={
+                    'ip_address': ip_address,
+                    'max_memory_mb': max_memory_mb or 0,
+                    'available_memory_mb': available_memory_mb if available_memory_mb is not None else max_memory_mb or 0,
+                    'agent_port': agent_port,
+                    'status': 'ONLINE',
+                }
+            )
+            self.writes += created
+            with self._lock:
+                state = self._workers.setdefault(hostname, _WorkerState(worker))
+                self._by_id[worker.pk] = state
+            if created:
+                return worker
+        worker = state.worker
+        state.seen = time.monotonic()
+
+        changed = []
+        if ip_address and ip_address != worker.ip_address:
+            worker.ip_address = ip_address
+            changed.append('ip_address')
+        if agent_port is not None and agent_port != worker.agent_port:
+            worker.agent_port = agent_port
+            changed.append('agent_port')
+        if worker.status == 'OFFLINE':
+            worker.status = 'ONLINE'
+            changed.append('status')
+        if changed:
+            worker.last_heartbeat = timezone.now()
+            worker.save(update_fields=changed + ['last_heartbeat'])
+            self.writes += 1
+        else:
+            with self._lock:
+                self._dirty.add(worker.pk)
+        # After registration available_memory_mb tracks the orchestrator's reservations
+        # (orchestrator/scheduler.py), so only a capacity change moves it
+        if max_memory_mb is not None and int(max_memory_mb) != worker.max_memory_mb:
+            resize_capacity(worker.pk, int(max_memory_mb))
+            worker.max_memory_mb = int(max_memory_mb)
+            self.writes += 1
+        return worker
+
+    def is_routable(self, worker_id):
+        """False for a worker this process has heard from but not within the timeout, or has marked OFFLINE."""
+        state = self._by_id.get(worker_id)
+        if state is None:
+            return True  # Heartbeats go to another process; trust the database status
+        return state.worker.status != 'OFFLINE' and time.monotonic() - state.seen < self.timeout
+
+    def flush(self):
+        """Write `last_heartbeat` for every worker heard from since the last flush."""
+        with self._lock:
+            dirty, self._dirty = list(self._dirty), set()
+            self._last_flush = time.monotonic()
+        now = timezone.now()
+        for start in range(0, len(dirty), FLUSH_CHUNK):
+            chunk = dirty[start:start + FLUSH_CHUNK]
+            WorkerNode.objects.filter(pk__in=chunk).update(last_heartbeat=now)
+            self.writes += 1
+            # Another orchestrator process may have declared one of them dead meanwhile
+            for worker in WorkerNode.objects.filter(pk__in=chunk, status='OFFLINE'):
+                logger.info("Worker %s is heartbeating again", worker.hostname)
+                worker.status = 'ONLINE'
+                worker.save(update_fields=['status'])
+                self.writes += 1
+                state = self._by_id.get(worker.pk)
+                if state is not None:
+                    state.worker.status = 'ONLINE'
+
+    def detect_failures(self):
+        """Mark ONLINE workers that stopped heartbeating OFFLINE. Returns the workers marked."""
+        cutoff = timezone.now() - timedelta(seconds=self.timeout)
+        now = time.monotonic()
+        failed = []
+        for worker in WorkerNode.objects.filter(status='ONLINE', last_heartbeat__lt=cutoff):
+            state = self._by_id.get(worker.pk)
+            if state is not None and now - state.seen < self.timeout:
+                continue  # Heard from here; its heartbeat is waiting for the next flush
+            self.mark_offline(worker)
+            failed.append(worker)
+        return failed
+
+    def mark_offline(self, worker):
+        """Take a worker out of service: OFFLINE, its live instances ERROR with their memory returned."""
+        logger.warning("Worker %s missed heartbeats since %s; marking it OFFLINE", worker.hostname, worker.last_heartbeat)
+        worker.status = 'OFFLINE'
+        worker.save(update_fields=['status'])  # Signals take its instances out of gateway routing
+        self.writes += 1
+        state = self._by_id.get(worker.pk)
+        if state is not None:
+            state.worker.status = 'OFFLINE'
+        for instance in FunctionInstance.objects.filter(worker=worker, status__in=LIVE_STATUSES):
+            instance.status = 'ERROR'
+            instance.save(update_fields=['status'])
+            release_instance_memory(instance)
+        # If it comes back, reconcile_worker() has the agent stop whatever it still runs
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+                self.detect_failures()
+            except Exception:
+                logger.exception("Worker liveness check failed")
+            finally:
+                close_old_connections()
+
+
+worker_registry = WorkerRegistry(
+    flush_interval=settings.WORKER_HEARTBEAT_FLUSH_SECONDS,
+    timeout=settings.WORKER_HEARTBEAT_TIMEOUT_SECONDS,
+    check_interval=settings.WORKER_LIVENESS_CHECK_SECONDS,
+)
@@ -0,0 +1,71 @@
+"""Shared shapes of the orchestrator's background-pass and report commands."""
+import abc
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+def _format_stats(stats):
+    return ', '.join(f"{key} {value}" for key, value in sorted(stats.items()))
+
+
+class PeriodicCommand(BaseCommand, abc.ABC):
+    """
+    Runs run_pass() every --interval seconds (default: the `interval_setting`
+    setting), or once with --once, and prints the summed counts it returned on exit.
+    """
+    label = ''  # Names the command in its summary line
+    interval_setting = ''
+    idle_summary = 'nothing to do'
+
+    @abc.abstractmethod
+    def run_pass(self):
+        """One pass; returns a Counter of what it did."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, self.interval_setting),
+                            help='Seconds between passes')
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+
+    def handle(self, *args, **options):
+        totals = {}
+        try:
+            while True:
+                stats = self.run_pass()
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+                if stats and options['verbosity'] > 1:
+                    self.stdout.write(_format_stats(stats))
+                close_old_connections()
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{self.label}: {_format_stats(totals) or self.idle_summary}."))
+
+
+class ReportCommand(BaseCommand, abc.ABC):
+    """Prints the rows of report(hours) as a table (write_table), or as JSON with --json."""
+
+    @abc.abstractmethod
+    def report(self, hours):
+        """Rows (dicts) covering the last `hours`."""
+
+    @abc.abstractmethod
+    def write_table(self, rows):
+        """Print the rows for a terminal."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Report window')
+        parser.add_argument('--json', action='store_true', help='Print the rows as JSON')
+
+    def handle(self, *args, **options):
+        rows = self.report(options['hours'])
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        else:
+            self.write_table(rows)
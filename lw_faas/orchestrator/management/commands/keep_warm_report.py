@@ -0,0 +1,22 @@
+from orchestrator.management.base import ReportCommand
+from orchestrator.reaper import keep_warm_report
+
+
+class Command(ReportCommand):
+    help = (
+        "Shows, per function, the cold-start rate next to the memory its "
+        "instances kept reserved, with the keep-warm policy that produced them."
+    )
+
+    def report(self, hours):
+        return keep_warm_report(hours=hours)
+
+    def write_table(self, rows):
+        self.stdout.write(f"{'function':<30}{'idle/keep s':>13}{'min/max':>9}{'calls':>9}{'cold':>7}"
+                          f"{'cold %':>8}{'inst':>6}{'reaped':>8}{'avg MB':>9}{'MB-h':>9}")
+        for row in rows:
+            policy = f"{row['idle_after_seconds']}/{row['keep_warm_seconds']}"
+            limits = f"{row['min_instances']}/{row['max_instances'] or '-'}"
+            self.stdout.write(f"{row['function'][:29]:<30}{policy:>13}{limits:>9}{row['invocations']:>9}"
+                              f"{row['cold_starts']:>7}{row['cold_start_rate']:>8.1%}{row['instances']:>6}"
+                              f"{row['terminated']:>8}{row['avg_reserved_mb']:>9.0f}{row['mb_hours']:>9.1f}")
@@ -0,0 +1,23 @@
+from orchestrator.management.base import ReportCommand
+from orchestrator.prewarm import prewarm_report
+
+
+class Command(ReportCommand):
+    help = (
+        "Shows, per function, how well the pre-warm planner's forecasts matched "
+        "the invocations that arrived and how many cold starts pre-warmed "
+        "instances avoided."
+    )
+
+    def report(self, hours):
+        return prewarm_report(hours=hours)
+
+    def write_table(self, rows):
+        self.stdout.write(f"{'function':<30}{'windows':>8}{'predicted':>11}{'actual':>8}{'WAPE':>7}{'bias':>8}"
+                          f"{'prewarmed':>11}{'used':>6}{'cold':>6}{'avoided':>9}")
+        for row in rows:
+            wape = f"{row['wape']:.0%}" if row['wape'] is not None else '-'
+            bias = f"{row['bias']:+.0%}" if row['bias'] is not None else '-'
+            self.stdout.write(f"{row['function'][:29]:<30}{row['windows']:>8}{row['predicted']:>11.1f}{row['actual']:>8}"
+                              f"{wape:>7}{bias:>8}{row['prewarmed']:>11}{row['prewarmed_used']:>6}"
+                              f"{row['cold_starts']:>6}{row['cold_starts_avoided_rate']:>9.0%}")
@@ -0,0 +1,16 @@
+from orchestrator.management.base import PeriodicCommand
+from orchestrator.prewarm import plan
+
+
+class Command(PeriodicCommand):
+    help = (
+        "Forecasts each function's invocations for the upcoming time-of-day "
+        "bucket and starts instances ahead of them, within the pre-warm memory "
+        "budget. Runs a pass every --interval seconds."
+    )
+    label = 'Pre-warm planner'
+    interval_setting = 'PREWARM_INTERVAL_SECONDS'
+    idle_summary = 'nothing to forecast'
+
+    def run_pass(self):
+        return plan()
@@ -0,0 +1,15 @@
+from orchestrator.management.base import PeriodicCommand
+from orchestrator.reaper import reap
+
+
+class Command(PeriodicCommand):
+    help = (
+        "Applies the functions' keep-warm policies: idles and terminates unused "
+        "instances, returning their memory to the workers, and keeps "
+        "min_instances warm. Runs a pass every --interval seconds."
+    )
+    label = 'Reaper'
+    interval_setting = 'REAPER_INTERVAL_SECONDS'
+
+    def run_pass(self):
+        return reap()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0003_delete_worker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='functioninstance',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=1, help_text='Maximum in-flight invocations the instance accepts (reported by runtime_host).'),
+        ),
+    ]
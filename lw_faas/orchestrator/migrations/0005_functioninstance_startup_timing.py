@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0004_functioninstance_max_concurrency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='functioninstance',
+            name='spawn_mode',
+            field=models.CharField(blank=True, choices=[('spawn', 'Fresh interpreter'), ('zygote', 'Forked from zygote')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='startup_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
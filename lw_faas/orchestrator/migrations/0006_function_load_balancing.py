@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0005_functioninstance_startup_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='load_balancing',
+            field=models.CharField(choices=[('least_outstanding', 'Least outstanding requests'), ('power_of_two', 'Power of two choices'), ('round_robin', 'Round robin'), ('most_recent', 'Most recently used')], default='least_outstanding', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0006_function_load_balancing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invocationrequest',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCESS', 'Success'), ('FAILURE', 'Failure'), ('TIMEOUT', 'Timeout')], max_length=20),
+        ),
+    ]
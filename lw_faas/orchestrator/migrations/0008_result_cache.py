@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0007_invocationrequest_queued_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='cache_results',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='cache_ttl_seconds',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='invocationrequest',
+            name='is_cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+    ]
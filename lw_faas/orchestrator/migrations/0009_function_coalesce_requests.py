@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0008_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='coalesce_requests',
+            field=models.BooleanField(default=False),
+        ),
+    ]
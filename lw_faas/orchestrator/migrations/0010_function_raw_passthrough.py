@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0009_function_coalesce_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='raw_passthrough',
+            field=models.BooleanField(default=False),
+        ),
+    ]
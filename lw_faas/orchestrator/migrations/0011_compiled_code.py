@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0010_function_raw_passthrough'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='functioninstance',
+            name='code_load_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='code_load_saved_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='code_source',
+            field=models.CharField(blank=True, choices=[('source', 'Compiled from source'), ('bytecode', 'Deploy-time bytecode')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CompiledCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_tag', models.CharField(max_length=32)),
+                ('bytecode', models.BinaryField()),
+                ('compile_ms', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('deployment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compiled_code', to='orchestrator.deployment')),
+            ],
+            options={
+                'unique_together': {('deployment', 'cache_tag')},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:56
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+_NAME_RE = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?(.*)$')
+
+
+def requirements_hash(text):
+    # Frozen copy of runtime.envstore.requirements_hash; later changes there must not change this migration
+    options, packages = set(), set()
+    for line in text.splitlines():
+        line = line.split(' #', 1)[0].strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('-'):
+            options.add(' '.join(line.split()))
+            continue
+        requirement, _, marker = line.partition(';')
+        match = _NAME_RE.match(requirement.replace(' ', ''))
+        if not match:
+            packages.add(line)
+            continue
+        name, extras, spec = match.groups()
+        name = re.sub(r'[-_.]+', '-', name).lower()
+        extras = '[' + ','.join(sorted(e.strip().lower() for e in extras[1:-1].split(','))) + ']' if extras else ''
+        if spec.startswith('@'):
+            spec = ' @ ' + spec[1:] + (' ' if marker else '')
+        elif spec:
+            spec = ','.join(sorted(spec.split(',')))
+        marker = ' '.join(marker.split())
+        packages.add(name + extras + spec + ('; ' + marker if marker else ''))
+    normalized = '\n'.join(sorted(options) + sorted(packages))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def backfill_requirements_hash(apps, schema_editor):
+    Deployment = apps.get_model('orchestrator', 'Deployment')
+    for deployment in Deployment.objects.only('requirements_snapshot'):
+        deployment.requirements_hash = requirements_hash(deployment.requirements_snapshot)
+        deployment.save(update_fields=['requirements_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0011_compiled_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deployment',
+            name='requirements_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(backfill_requirements_hash, migrations.RunPython.noop),
+    ]
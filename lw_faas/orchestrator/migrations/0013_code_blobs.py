@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:10
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def snapshots_to_blobs(apps, schema_editor):
+    CodeBlob = apps.get_model('orchestrator', 'CodeBlob')
+    Deployment = apps.get_model('orchestrator', 'Deployment')
+
+    def store(content):
+        data = content.encode('utf-8')
+        blob, _ = CodeBlob.objects.get_or_create(
+            sha256=hashlib.sha256(data).hexdigest(), defaults={'content': content, 'size': len(data)}
+        )
+        return blob
+
+    for deployment in Deployment.objects.all():
+        deployment.code_blob = store(deployment.code_snapshot)
+        deployment.requirements_blob = store(deployment.requirements_snapshot)
+        deployment.save(update_fields=['code_blob', 'requirements_blob'])
+
+
+def blobs_to_snapshots(apps, schema_editor):
+    Deployment = apps.get_model('orchestrator', 'Deployment')
+    for deployment in Deployment.objects.select_related('code_blob', 'requirements_blob'):
+        deployment.code_snapshot = deployment.code_blob.content
+        deployment.requirements_snapshot = deployment.requirements_blob.content
+        deployment.save(update_fields=['code_snapshot', 'requirements_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0012_deployment_requirements_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deployment',
+            name='code_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='code_deployments', to='orchestrator.codeblob'),
+        ),
+        migrations.AddField(
+            model_name='deployment',
+            name='requirements_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='requirements_deployments', to='orchestrator.codeblob'),
+        ),
+        # Old rows keep their text until it has been copied into blobs
+        migrations.AlterField(
+            model_name='deployment',
+            name='code_snapshot',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='requirements_snapshot',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(snapshots_to_blobs, blobs_to_snapshots),
+        migrations.RemoveField(
+            model_name='deployment',
+            name='code_snapshot',
+        ),
+        migrations.RemoveField(
+            model_name='deployment',
+            name='requirements_snapshot',
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='code_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='code_deployments', to='orchestrator.codeblob'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='requirements_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='requirements_deployments', to='orchestrator.codeblob'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0013_code_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('env', 'Dependency environment'), ('code', 'Code blob')], max_length=8)),
+                ('digest', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='memory_mb',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='workernode',
+            index=models.Index(fields=['status', 'available_memory_mb'], name='orchestrato_status_916fb3_idx'),
+        ),
+        migrations.AddField(
+            model_name='workercacheentry',
+            name='worker',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cache_entries', to='orchestrator.workernode'),
+        ),
+        migrations.AddIndex(
+            model_name='workercacheentry',
+            index=models.Index(fields=['kind', 'digest'], name='orchestrato_kind_4494bd_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='workercacheentry',
+            unique_together={('worker', 'kind', 'digest')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0014_placement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='functioninstance',
+            name='rss_mb',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workernode',
+            name='agent_port',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='functioninstance',
+            name='port',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
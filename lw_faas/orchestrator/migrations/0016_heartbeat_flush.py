@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0015_worker_agent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workernode',
+            name='last_heartbeat',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
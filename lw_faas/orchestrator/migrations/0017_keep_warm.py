@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0016_heartbeat_flush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='idle_after_seconds',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='keep_warm_seconds',
+            field=models.PositiveIntegerField(default=600),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='max_instances',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='min_instances',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='stopped_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='functioninstance',
+            name='last_accessed',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='functioninstance',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('IDLE', 'Idle'), ('ERROR', 'Error'), ('TERMINATED', 'Terminated')], default='PENDING', max_length=20),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0017_keep_warm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='functioninstance',
+            name='prewarmed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PrewarmForecast',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('predicted_invocations', models.FloatField()),
+                ('target_instances', models.PositiveIntegerField(default=0)),
+                ('instances_started', models.PositiveIntegerField(default=0)),
+                ('actual_invocations', models.PositiveIntegerField(blank=True, null=True)),
+                ('function', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecasts', to='orchestrator.function')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window_end'], name='orchestrato_window__608373_idx')],
+                'unique_together': {('function', 'window_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0018_prewarm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deployment',
+            name='drain_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='functioninstance',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
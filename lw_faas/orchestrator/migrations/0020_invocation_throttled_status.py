@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0019_blue_green'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invocationrequest',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCESS', 'Success'), ('FAILURE', 'Failure'), ('TIMEOUT', 'Timeout'), ('THROTTLED', 'Throttled')], max_length=20),
+        ),
+    ]
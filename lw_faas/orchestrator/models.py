@@ -1,6 +1,8 @@
+import hashlib
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
 class Function(models.Model):
     """
@@ -22,6 +24,29 @@ class Function(models.Model):
     )   # Resource Configuration
     memory_mb = models.PositiveIntegerField(default=128)  # Memory limit
     timeout_seconds = models.PositiveIntegerField(default=30)  # Execution timeout
+    # How the gateway spreads invocations over warm instances (see gateway/balancer.py)
+    LOAD_BALANCING_CHOICES = (
+        ('least_outstanding', 'Least outstanding requests'),
+        ('power_of_two', 'Power of two choices'),
+        ('round_robin', 'Round robin'),
+        ('most_recent', 'Most recently used'),
+    )
+    load_balancing = models.CharField(max_length=32, choices=LOAD_BALANCING_CHOICES, default='least_outstanding')
+    # Opt-in gateway result cache for pure functions (see gateway/cache.py)
+    cache_results = models.BooleanField(default=False)
+    cache_ttl_seconds = models.PositiveIntegerField(default=60)
+    # Share one downstream call among identical concurrent invocations (see gateway/singleflight.py)
+    coalesce_requests = models.BooleanField(default=False)
+    # Forward request and response bodies to and from the runtime host unchanged, in any
+    # content type, instead of parsing and re-serializing JSON
+    raw_passthrough = models.BooleanField(default=False)
+    # Keep-warm policy (see orchestrator/reaper.py): instances unused for idle_after_seconds
+    # become IDLE and are stopped once unused for keep_warm_seconds, keeping at least
+    # min_instances warm. max_instances caps cold starts (0 for no limit).
+    idle_after_seconds = models.PositiveIntegerField(default=60)
+    keep_warm_seconds = models.PositiveIntegerField(default=600)
+    min_instances = models.PositiveIntegerField(default=0)
+    max_instances = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
@@ -30,6 +55,34 @@ class Function(models.Model):
         return f"{self.name} ({self.id})"
 
 
+class CodeBlob(models.Model):
+    """
+    Immutable text (function code or requirements) stored once and addressed by
+    the SHA-256 of its UTF-8 bytes. Deployments reference blobs, so rollbacks and
+    redeploys of unchanged code don't store another copy.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    content = models.TextField()
+    size = models.PositiveIntegerField()  # Bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def store(cls, content):
+        """Return the blob for `content`, creating it if this content hasn't been stored yet."""
+        blob, _ = cls.objects.get_or_create(
+            sha256=cls.digest(content),
+            defaults={'content': content, 'size': len(content.encode('utf-8'))},
+        )
+        return blob
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size} bytes)"
+
+
 class Deployment(models.Model):
     """
     A specific revision (snapshot) of a Function that can be deployed.
@@ -38,11 +91,17 @@ class Deployment(models.Model):
     function = models.ForeignKey(Function, on_delete=models.CASCADE, related_name='deployments')
     version = models.PositiveIntegerField()  # e.g., 1, 2, 3...
     comment = models.CharField(max_length=255, blank=True)
-    code_snapshot = models.TextField()  # Snapshot the code and config at the time of deployment
-    requirements_snapshot = models.TextField()
+    # Snapshot the code and config at the time of deployment
+    code_blob = models.ForeignKey(CodeBlob, on_delete=models.PROTECT, related_name='code_deployments')
+    requirements_blob = models.ForeignKey(CodeBlob, on_delete=models.PROTECT, related_name='requirements_deployments')
+    # Content address of the dependency environment on workers (see runtime/envstore.py)
+    requirements_hash = models.CharField(max_length=64, blank=True, db_index=True)
     entry_point_snapshot = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=False, help_text="Is this the live deployment?")
+    # After a blue/green switch (orchestrator/rollout.py) the previous deployment's
+    # instances stay warm until then, for an instant rollback
+    drain_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ['function', 'version']  # Ensure version is unique per function
@@ -51,6 +110,40 @@ class Deployment(models.Model):
     def __str__(self):
         return f"{self.function.name} - v{self.version} ({'Active' if self.is_active else 'Inactive'})"
 
+    # The snapshot texts, read from and stored as blobs
+    @property
+    def code_snapshot(self):
+        return self.code_blob.content
+
+    @code_snapshot.setter
+    def code_snapshot(self, content):
+        self.code_blob = CodeBlob.store(content)
+
+    @property
+    def requirements_snapshot(self):
+        return self.requirements_blob.content
+
+    @requirements_snapshot.setter
+    def requirements_snapshot(self, content):
+        self.requirements_blob = CodeBlob.store(content)
+
+
+class CompiledCode(models.Model):
+    """
+    A deployment's code snapshot compiled for one Python version (see orchestrator/compiler.py).
+    """
+    deployment = models.ForeignKey(Deployment, on_delete=models.CASCADE, related_name='compiled_code')
+    cache_tag = models.CharField(max_length=32)  # sys.implementation.cache_tag, e.g. 'cpython-311'
+    bytecode = models.BinaryField()  # importlib.util.MAGIC_NUMBER + marshal.dumps(code)
+    compile_ms = models.FloatField()  # What each instance start would spend compiling the source
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['deployment', 'cache_tag']
+
+    def __str__(self):
+        return f"{self.deployment} [{self.cache_tag}]"
+
 
 class WorkerNode(models.Model):
     """
@@ -64,14 +157,36 @@ class WorkerNode(models.Model):
         choices=(('ONLINE', 'Online'), ('OFFLINE', 'Offline'), ('DRAINING', 'Draining')),
         default='ONLINE'
     )
-    last_heartbeat = models.DateTimeField(auto_now=True)  # Updated by the worker regularly
+    last_heartbeat = models.DateTimeField(default=timezone.now)  # Flushed periodically by orchestrator/liveness.py
     max_memory_mb = models.PositiveIntegerField()      # Resource capacity
-    available_memory_mb = models.PositiveIntegerField()  # Could be calculated, but stored for simplicity
+    available_memory_mb = models.PositiveIntegerField()  # Unreserved memory, kept by orchestrator/scheduler.py
+    agent_port = models.PositiveIntegerField(null=True, blank=True)  # Worker agent control server (runtime/agent.py)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_memory_mb'])]  # Placement candidates
 
     def __str__(self):
         return f"{self.hostname} ({self.status})"
 
 
+class WorkerCacheEntry(models.Model):
+    """
+    A dependency environment (runtime/envstore.py) or code blob (runtime/blobcache.py)
+    a worker reported having locally, used for placement affinity.
+    """
+    KIND_CHOICES = (('env', 'Dependency environment'), ('code', 'Code blob'))
+    worker = models.ForeignKey(WorkerNode, on_delete=models.CASCADE, related_name='cache_entries')
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    digest = models.CharField(max_length=64)  # Deployment.requirements_hash or CodeBlob.sha256
+
+    class Meta:
+        unique_together = ['worker', 'kind', 'digest']
+        indexes = [models.Index(fields=['kind', 'digest'])]
+
+    def __str__(self):
+        return f"{self.worker.hostname} {self.kind} {self.digest[:12]}"
+
+
 class FunctionInstance(models.Model):
     """
     Represents an active (warm) instance of a function ready to handle requests.
@@ -88,12 +203,36 @@ class FunctionInstance(models.Model):
             ('RUNNING', 'Running'),  # Alive and ready to receive requests
             ('IDLE', 'Idle'),        # Running but no recent requests (maybe scaled down)
             ('ERROR', 'Error'),      # Crashed or unhealthy
+            ('TERMINATED', 'Terminated'),  # Stopped by the reaper; its port and memory are released
         ),
         default='PENDING'
     )
-    port = models.PositiveIntegerField()    # The port on the worker node where runtime_host is listening
+    # The port on the worker node where runtime_host is listening; allocated by the worker agent
+    port = models.PositiveIntegerField(null=True, blank=True)
+    max_concurrency = models.PositiveIntegerField(
+        default=1,
+        help_text="Maximum in-flight invocations the instance accepts (reported by runtime_host)."
+    )
+    spawn_mode = models.CharField(
+        max_length=20,
+        choices=(('spawn', 'Fresh interpreter'), ('zygote', 'Forked from zygote')),
+        blank=True
+    )
+    memory_mb = models.PositiveIntegerField(default=0)  # Reserved on the worker at placement (orchestrator/scheduler.py)
+    rss_mb = models.FloatField(null=True, blank=True)  # Resident memory last reported by the worker agent
+    startup_ms = models.FloatField(null=True, blank=True)  # Launch request -> ready, for cold-start comparisons
+    code_source = models.CharField(
+        max_length=20,
+        choices=(('source', 'Compiled from source'), ('bytecode', 'Deploy-time bytecode')),
+        blank=True
+    )
+    code_load_ms = models.FloatField(null=True, blank=True)  # Time to get the handler's code object
+    code_load_saved_ms = models.FloatField(null=True, blank=True)  # Compile time avoided by loading bytecode
     started_at = models.DateTimeField(auto_now_add=True)    # Track usage for scaling and cleanup
-    last_accessed = models.DateTimeField(auto_now=True)  # Updated on every request
+    last_accessed = models.DateTimeField(default=timezone.now)  # Flushed in batches by gateway/logwriter.py
+    stopped_at = models.DateTimeField(null=True, blank=True)  # When its memory was given back to the worker
+    ready_at = models.DateTimeField(null=True, blank=True)  # When the runtime host registered through instance_ready
+    prewarmed = models.BooleanField(default=False)  # Started ahead of forecast traffic (orchestrator/prewarm.py)
 
     class Meta:
         unique_together = ['worker', 'port']  # A port can only be used by one instance per worker
@@ -105,6 +244,29 @@ class FunctionInstance(models.Model):
         return f"Instance of {self.deployment.function.name} on {self.worker.hostname}:{self.port}"
 
 
+class PrewarmForecast(models.Model):
+    """
+    The pre-warm planner's forecast (orchestrator/prewarm.py) of one function's
+    invocations in one time-of-day bucket, the instances it kept warm for it,
+    and what actually arrived, filled in once the bucket is over.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    function = models.ForeignKey(Function, on_delete=models.CASCADE, related_name='forecasts')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    predicted_invocations = models.FloatField()
+    target_instances = models.PositiveIntegerField(default=0)  # Live instances the planner aims for
+    instances_started = models.PositiveIntegerField(default=0)
+    actual_invocations = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['function', 'window_start']
+        indexes = [models.Index(fields=['window_end'])]
+
+    def __str__(self):
+        return f"{self.function.name} {self.window_start:%Y-%m-%d %H:%M}: {self.predicted_invocations:.1f}"
+
+
 class InvocationRequest(models.Model):
     """
     A log of every function invocation request.
@@ -128,12 +290,16 @@ class InvocationRequest(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(null=True, blank=True)
     is_cold_start = models.BooleanField()
+    is_cache_hit = models.BooleanField(default=False)  # Served from the gateway result cache
 
     # Status
     STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),    # Async invocation waiting for a consumer
+        ('RUNNING', 'Running'),  # Async invocation picked up by a consumer
         ('SUCCESS', 'Success'),
         ('FAILURE', 'Failure'),
         ('TIMEOUT', 'Timeout'),
+        ('THROTTLED', 'Throttled'),  # Turned away by the gateway's admission queue (429)
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
 
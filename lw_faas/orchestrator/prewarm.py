@@ -0,0 +1,266 @@
+"""
+Predictive pre-warming: start instances ahead of the traffic a function is
+expected to get, instead of only cold starting when a call arrives.
+
+Time is cut into time-of-day buckets of PREWARM_BUCKET_MINUTES. Forecaster
+predicts a function's invocations in a bucket from the invocation log (the
+(function, start_time) index) as a blend of
+
+- its time-of-day profile: the average count in the same bucket on each of
+  the previous PREWARM_HISTORY_DAYS days, and
+- its current level: an EWMA over the last PREWARM_EWMA_BUCKETS complete
+  buckets, which follows changes the profile hasn't seen yet.
+
+Each plan() pass (`manage.py run_prewarm_planner`) forecasts the bucket
+starting PREWARM_LEAD_SECONDS from now, turns the forecast into a number of
+instances from the function's average call duration (Little's law), records
+it as a PrewarmForecast and starts the missing instances, marked `prewarmed`,
+most calls per MB first, within PREWARM_MEMORY_BUDGET_MB. The reaper
+(reaper.py) keeps forecast instances warm for the window. Once a window is
+over its actual count is filled in; prewarm_report() (`manage.py
+prewarm_report`) shows forecast accuracy and the cold starts avoided.
+"""
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import ExtractHour, ExtractMinute
+from django.utils import timezone
+
+from .models import Function, FunctionInstance, InvocationRequest, PrewarmForecast
+from .provisioning import LIVE_STATUSES, ProvisioningError, start_instance
+from .scheduler import NoWorkerAvailable
+
+logger = logging.getLogger(__name__)
+
+
+def _calls():
+    # Cache hits never reach an instance
+    return InvocationRequest.objects.filter(is_cache_hit=False)
+
+
+class Forecaster:
+    """Per-function invocation forecasts for time-of-day buckets, from the invocation log."""
+
+    def __init__(self, bucket_minutes=15, history_days=7, ewma_alpha=0.5, ewma_buckets=8, profile_weight=0.5):
+        if (24 * 60) % bucket_minutes:
+            raise ValueError("bucket_minutes must divide a day")
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.history_days = history_days
+        self.ewma_alpha = ewma_alpha
+        self.ewma_buckets = ewma_buckets
+        self.profile_weight = profile_weight
+
+    def bucket_bounds(self, moment):
+        """(start, end) of the bucket containing `moment`, in the current time zone."""
+        local = timezone.localtime(moment)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = midnight + self.bucket * ((local - midnight) // self.bucket)
+        return start, start + self.bucket
+
+    def profile(self, window_start, now):
+        """{function id: average invocations in this bucket over the previous days it existed}."""
+        days = range(1, self.history_days + 1)
+        same_bucket = reduce(or_, (
+            Q(start_time__gte=window_start - timedelta(days=d), start_time__lt=window_start - timedelta(days=d) + self.bucket)
+            for d in days
+        ))
+        counts = dict(_calls().filter(same_bucket).values_list('function').annotate(n=Count('id')))
+        first_seen = _calls().filter(
+            start_time__gte=window_start - timedelta(days=self.history_days), start_time__lt=now
+        ).values_list('function').annotate(first=Min('start_time'))
+        profile = {}
+        for function_id, first in first_seen:
+            # Only days on which the function was already being called count
+            observed = sum(1 for d in days if window_start - timedelta(days=d) + self.bucket > first)
+            if observed:
+                profile[function_id] = counts.get(function_id, 0) / observed
+        return profile
+
+    def level(self, now):
+        """{function id: EWMA of invocations per bucket over the last complete buckets}."""
+        current_start, _ = self.bucket_bounds(now)
+        since = current_start - self.bucket * self.ewma_buckets
+        minutes = self.bucket.seconds // 60
+        # Minute of day each bucket starts at -> its position; the buckets span less than a day
+        index = {}
+        for i in range(self.ewma_buckets):
+            start = timezone.localtime(since + self.bucket * i)
+            index[start.hour * 60 + start.minute] = i
+        counts = defaultdict(lambda: [0] * self.ewma_buckets)
+        rows = _calls().filter(start_time__gte=since, start_time__lt=current_start).annotate(
+            hour=ExtractHour('start_time'), minute=ExtractMinute('start_time')
+        ).values_list('function', 'hour', 'minute').annotate(n=Count('id'))
+        for function_id, hour, minute, n in rows:
+            minute_of_day = hour * 60 + minute
+            i = index.get(minute_of_day - minute_of_day % minutes)
+            if i is not None:
+                counts[function_id][i] += n
+        level = {}
+        for function_id, series in counts.items():
+            ewma = series[0]
+            for n in series[1:]:
+                ewma = self.ewma_alpha * n + (1 - self.ewma_alpha) * ewma
+            level[function_id] = ewma
+        return level
+
+    def forecast(self, window_start, now=None):
+        """{function id: predicted invocations in the bucket starting at `window_start`}."""
+        now = now or timezone.now()
+        profile = self.profile(window_start, now)
+        level = self.level(now)
+        forecasts = {}
+        for function_id in set(profile) | set(level):
+            if function_id in profile:
+                forecasts[function_id] = (self.profile_weight * profile[function_id]
+                                          + (1 - self.profile_weight) * level.get(function_id, 0.0))
+            else:
+                forecasts[function_id] = level[function_id]  # Less than a day of history
+        return forecasts
+
+
+forecaster = Forecaster(
+    bucket_minutes=settings.PREWARM_BUCKET_MINUTES,
+    history_days=settings.PREWARM_HISTORY_DAYS,
+    ewma_alpha=settings.PREWARM_EWMA_ALPHA,
+    ewma_buckets=settings.PREWARM_EWMA_BUCKETS,
+    profile_weight=settings.PREWARM_PROFILE_WEIGHT,
+)
+
+
+def target_instances(function, predicted, duration_seconds, concurrency):
+    """Instances needed for `predicted` calls in one bucket, each lasting `duration_seconds` on average."""
+    if predicted < settings.PREWARM_MIN_INVOCATIONS:
+        return 0
+    in_flight = predicted / forecaster.bucket.total_seconds() * (duration_seconds or 0)
+    target = max(1, math.ceil(in_flight / max(concurrency, 1)))
+    return min(target, function.max_instances) if function.max_instances else target
+
+
+def record_actuals(now):
+    """Fill in the actual invocation counts of forecast windows that have ended. Returns how many."""
+    pending = list(PrewarmForecast.objects.filter(actual_invocations__isnull=True, window_end__lte=now))
+    for forecast in pending:
+        forecast.actual_invocations = _calls().filter(
+            function_id=forecast.function_id, start_time__gte=forecast.window_start, start_time__lt=forecast.window_end
+        ).count()
+    PrewarmForecast.objects.bulk_update(pending, ['actual_invocations'])
+    return len(pending)
+
+
+def plan(now=None):
+    """Forecast the upcoming bucket and start the instances it calls for. Returns counts of what was done."""
+    now = now or timezone.now()
+    stats = Counter()
+    stats['scored'] = record_actuals(now)
+    window_start, window_end = forecaster.bucket_bounds(now + timedelta(seconds=settings.PREWARM_LEAD_SECONDS))
+    predictions = forecaster.forecast(window_start, now)
+    if not predictions:
+        return stats
+
+    functions = Function.objects.filter(pk__in=list(predictions), is_active=True)
+    durations = dict(InvocationRequest.objects.filter(
+        function__in=functions, start_time__gte=now - timedelta(days=1), end_time__isnull=False, is_cache_hit=False
+    ).values_list('function').annotate(
+        d=Avg(ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField()))
+    ))
+    live = {row['deployment__function']: row for row in FunctionInstance.objects.filter(
+        deployment__function__in=functions, deployment__is_active=True, status__in=LIVE_STATUSES
+    ).values('deployment__function').annotate(n=Count('id'), concurrency=Max('max_concurrency'))}
+    budget = settings.PREWARM_MEMORY_BUDGET_MB - (FunctionInstance.objects.filter(
+        prewarmed=True, status__in=LIVE_STATUSES).aggregate(mb=Sum('memory_mb'))['mb'] or 0)
+
+    wanted = []
+    for function in functions:
+        predicted = predictions[function.pk]
+        current = live.get(function.pk, {})
+        duration = durations.get(function.pk)
+        target = target_instances(function, predicted, duration.total_seconds() if duration else None,
+                                  current.get('concurrency') or 1)
+        forecast, _ = PrewarmForecast.objects.update_or_create(
+            function=function, window_start=window_start,
+            defaults={'window_end': window_end, 'predicted_invocations': predicted, 'target_instances': target},
+        )
+        stats['forecasts'] += 1
+        missing = target - current.get('n', 0)
+        if missing > 0:
+            wanted.append((predicted / max(function.memory_mb, 1), function, forecast, missing))
+
+    # Most expected calls per MB first, while the budget lasts
+    for _, function, forecast, missing in sorted(wanted, key=lambda w: w[0], reverse=True):
+        deployment = function.deployments.filter(is_active=True).first()
+        started = 0
+        for _ in range(missing if deployment else 0):
+            if function.memory_mb > budget:
+                stats['over_budget'] += 1
+                break
+            try:
+                start_instance(deployment, prewarmed=True)
+            except (NoWorkerAvailable, ProvisioningError) as e:
+                logger.warning("Pre-warming %s: %s", function.name, e)
+                stats['start_failed'] += 1
+                break
+            budget -= function.memory_mb
+            started += 1
+        if started:
+            PrewarmForecast.objects.filter(pk=forecast.pk).update(instances_started=F('instances_started') + started)
+            stats['started'] += started
+    return stats
+
+
+def prewarm_targets(now):
+    """{function id: instances the planner wants warm now or within the lead time}, for the reaper."""
+    rows = PrewarmForecast.objects.filter(
+        window_start__lte=now + timedelta(seconds=settings.PREWARM_LEAD_SECONDS), window_end__gt=now, target_instances__gt=0
+    ).values_list('function').annotate(target=Max('target_instances'))
+    return dict(rows)
+
+
+def prewarm_report(hours=24, now=None):
+    """
+    Per function over the last `hours`: forecast accuracy over the windows that
+    ended (WAPE is total absolute error over total actual calls; bias is
+    positive when over-forecasting) and the cold starts pre-warming avoided.
+    A pre-warmed instance that served calls counts as one avoided cold start.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(hours=hours)
+    accuracy = defaultdict(lambda: {'windows': 0, 'predicted': 0.0, 'actual': 0, 'abs_error': 0.0})
+    for predicted, actual, function_id in PrewarmForecast.objects.filter(
+            window_end__gt=since, window_end__lte=now, actual_invocations__isnull=False
+    ).values_list('predicted_invocations', 'actual_invocations', 'function'):
+        row = accuracy[function_id]
+        row['windows'] += 1
+        row['predicted'] += predicted
+        row['actual'] += actual
+        row['abs_error'] += abs(predicted - actual)
+
+    prewarmed = dict(FunctionInstance.objects.filter(prewarmed=True, started_at__gte=since).values_list(
+        'deployment__function').annotate(n=Count('id')))
+    calls = InvocationRequest.objects.filter(start_time__gte=since, start_time__lt=now)
+    avoided = dict(calls.filter(instance__prewarmed=True).values_list('function').annotate(
+        n=Count('instance', distinct=True)))
+    cold = dict(calls.filter(is_cold_start=True).values_list('function').annotate(n=Count('id')))
+
+    rows = []
+    for function in Function.objects.filter(pk__in=set(accuracy) | set(prewarmed) | set(cold)).order_by('name'):
+        acc = accuracy[function.pk]
+        saved, cold_starts = avoided.get(function.pk, 0), cold.get(function.pk, 0)
+        rows.append({
+            'function': function.name,
+            'windows': acc['windows'],
+            'predicted': acc['predicted'],
+            'actual': acc['actual'],
+            'wape': acc['abs_error'] / acc['actual'] if acc['actual'] else None,
+            'bias': (acc['predicted'] - acc['actual']) / acc['actual'] if acc['actual'] else None,
+            'prewarmed': prewarmed.get(function.pk, 0),
+            'prewarmed_used': saved,
+            'cold_starts': cold_starts,
+            'cold_starts_avoided_rate': saved / (saved + cold_starts) if saved + cold_starts else 0.0,
+        })
+    return rows
@@ -0,0 +1,129 @@
+"""
+Starting instances on worker agents and reconciling what the agents report.
+
+start_instance() is the cold start path: place the instance (scheduler.py),
+record it as PENDING, and have the worker's agent (runtime/agent.py) start a
+runtime host for it. terminate_instance() is the reverse, for the reaper
+(reaper.py). reconcile_worker() runs on every agent heartbeat and brings the
+database in line with the processes the agent actually runs.
+"""
+import logging
+
+from django.db import connection, transaction
+
+from . import agent_client
+from .models import Function, FunctionInstance
+from .scheduler import place, release_instance_memory, release_memory
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATUSES = ('PENDING', 'RUNNING', 'IDLE')
+
+
+class ProvisioningError(Exception):
+    """The chosen worker's agent couldn't start the instance."""
+
+
+class InstanceLimitReached(ProvisioningError):
+    """The function already has its `max_instances` live instances."""
+
+
+def start_instance(deployment, policy=None, prewarmed=False):
+    """
+    Start a new instance of `deployment` and return it RUNNING (with worker and
+    deployment loaded). Raises scheduler.NoWorkerAvailable or ProvisioningError.
+    `prewarmed` marks instances started ahead of traffic (prewarm.py).
+    """
+    max_instances = deployment.function.max_instances
+    live = FunctionInstance.objects.filter(deployment=deployment, status__in=LIVE_STATUSES)
+    if max_instances and live.count() >= max_instances:
+        raise InstanceLimitReached(f"{deployment.function.name} already has {max_instances} instances")
+    placement = place(deployment, policy=policy)
+    try:
+        with transaction.atomic():
+            # Checked again with concurrent starts (gateway, reaper, pre-warm planner) kept
+            # out: the Function row is locked, or on SQLite the INSERT takes the write lock
+            if connection.features.has_select_for_update:
+                Function.objects.select_for_update().get(pk=deployment.function_id)
+            instance = FunctionInstance.objects.create(
+                deployment=deployment, worker=placement.worker, memory_mb=placement.memory_mb, status='PENDING',
+                prewarmed=prewarmed,
+            )
+            if max_instances and live.count() > max_instances:
+                raise InstanceLimitReached(f"{deployment.function.name} already has {max_instances} instances")
+    except InstanceLimitReached:
+        release_memory(placement.worker.pk, placement.memory_mb)
+        raise
+    try:
+        reply = agent_client.spawn_instance(instance)
+    except agent_client.AgentError as e:
+        logger.warning("Starting instance %s on %s failed: %s", instance.pk, placement.worker.hostname, e)
+        release_instance_memory(instance)
+        instance.status = 'ERROR'
+        instance.save(update_fields=['status', 'memory_mb'])
+        raise ProvisioningError(str(e))
+
+    # The agent owns its ports: a dead instance's row may still hold a port it has reused
+    FunctionInstance.objects.filter(worker=placement.worker, port=reply['port']).exclude(pk=instance.pk).update(port=None)
+    # The runtime host may already have registered itself through instance_ready
+    instance.refresh_from_db()
+    instance.port = reply['port']
+    instance.spawn_mode = instance.spawn_mode or reply.get('spawn_mode') or ''
+    instance.startup_ms = instance.startup_ms or reply.get('startup_ms')
+    if instance.status == 'PENDING':
+        instance.status = 'RUNNING'
+    # Only our fields: the host's instance_ready registration may land at the same time
+    instance.save(update_fields=['port', 'spawn_mode', 'startup_ms', 'status'])
+    return instance
+
+
+def terminate_instance(instance):
+    """
+    Retire an instance: TERMINATED (out of gateway routing), its runtime host
+    stopped and its memory returned to the worker. If the agent can't be
+    reached, it gets the stop order with its next heartbeat instead.
+    """
+    instance.status = 'TERMINATED'
+    instance.port = None
+    instance.save(update_fields=['status', 'port'])  # Signals take it out of gateway routing
+    try:
+        agent_client.stop_instance(instance)
+    except agent_client.AgentError as e:
+        logger.warning("Stopping instance %s on %s failed: %s", instance.pk, instance.worker.hostname, e)
+    release_instance_memory(instance)
+
+
+def reconcile_worker(worker, reported):
+    """
+    Apply an agent's instance report: `reported` is its list of
+    {"instance_id", "state", "rss_mb", ...}. Live instances the agent no longer
+    runs become ERROR and give back their memory; resident memory is updated.
+    Returns the ids of instances the agent should stop, because the database
+    doesn't consider them live.
+    """
+    reported = {str(item.get('instance_id')): item for item in reported if item.get('instance_id')}
+    known = {str(i.pk): i for i in FunctionInstance.objects.filter(worker=worker).exclude(
+        status__in=('ERROR', 'TERMINATED'), memory_mb=0)}
+
+    changed_rss = []
+    for instance_id, instance in known.items():
+        item = reported.get(instance_id)
+        if item is None:
+            # PENDING instances may not have reached the agent yet; start_instance handles their failures
+            if instance.status in ('RUNNING', 'IDLE'):
+                logger.warning("Instance %s is no longer running on %s", instance_id, worker.hostname)
+                instance.status = 'ERROR'
+                instance.save(update_fields=['status'])  # Signals take it out of gateway routing
+            if instance.status in ('ERROR', 'TERMINATED'):
+                release_instance_memory(instance)
+            continue
+        rss_mb = item.get('rss_mb')
+        # Skip writes for small changes; hundreds of instances report every few seconds
+        if rss_mb is not None and (instance.rss_mb is None or abs(rss_mb - instance.rss_mb) >= 1):
+            instance.rss_mb = rss_mb
+            changed_rss.append(instance)
+    if changed_rss:
+        FunctionInstance.objects.bulk_update(changed_rss, ['rss_mb'])
+
+    live = {instance_id for instance_id, i in known.items() if i.status in LIVE_STATUSES}
+    return sorted(instance_id for instance_id in reported if instance_id not in live)
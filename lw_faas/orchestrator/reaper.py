@@ -0,0 +1,177 @@
+"""
+Scale-to-zero: retire warm instances that aren't being used.
+
+Each pass of reap() applies every function's keep-warm policy (the
+idle_after_seconds / keep_warm_seconds / min_instances / max_instances fields
+on Function) to its live instances, going by `last_accessed` (flushed by the
+gateway when calls start and end, see gateway/logwriter.py; FunctionSerializer
+keeps idle_after_seconds at least timeout_seconds, so no call outlasts it):
+
+- RUNNING instances unused for idle_after_seconds become IDLE. They still take
+  calls; a call brings them back to RUNNING.
+- IDLE instances unused for keep_warm_seconds are terminated, least recently
+  used first, keeping min_instances of the active deployment.
+- IDLE instances beyond max_instances are terminated right away.
+- Instances of deployments that are no longer active are terminated once
+  unused for idle_after_seconds, after the deployment's drain window if a
+  blue/green switch (rollout.py) left it one.
+- Functions with fewer than min_instances live instances get new ones.
+
+Instances the pre-warm planner (prewarm.py) wants for the current or next
+forecast window count toward min_instances when deciding what to terminate.
+
+Terminated instances give their memory back to the worker
+(provisioning.terminate_instance). `manage.py run_reaper` runs passes in a
+loop; `manage.py keep_warm_report` shows what each policy costs in cold starts
+and memory.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Function, FunctionInstance, InvocationRequest
+from .prewarm import prewarm_targets
+from .provisioning import LIVE_STATUSES, ProvisioningError, start_instance, terminate_instance
+from .scheduler import NoWorkerAvailable
+
+logger = logging.getLogger(__name__)
+
+
+def _unused_for(instance, now):
+    return (now - instance.last_accessed).total_seconds()
+
+
+def reap(now=None):
+    """Run one pass over every function with live instances. Returns counts of what was done."""
+    now = now or timezone.now()
+    stats = Counter()
+    by_function = defaultdict(list)
+    for instance in FunctionInstance.objects.filter(status__in=LIVE_STATUSES).select_related(
+            'deployment__function', 'worker'):
+        by_function[instance.deployment.function].append(instance)
+    # Functions that should keep instances warm but have none
+    for function in Function.objects.filter(is_active=True, min_instances__gt=0).exclude(pk__in=[f.pk for f in by_function]):
+        by_function[function] = []
+
+    targets = prewarm_targets(now)
+    for function, instances in by_function.items():
+        try:
+            _apply_policy(function, instances, now, stats, floor=targets.get(function.pk, 0))
+        except Exception:
+            logger.exception("Applying the keep-warm policy of %s failed", function.name)
+            stats['errors'] += 1
+    return stats
+
+
+def _apply_policy(function, instances, now, stats, floor=0):
+    active, retired = [], []
+    for instance in instances:
+        (active if instance.deployment.is_active else retired).append(instance)
+
+    for instance in retired:
+        draining = instance.deployment.drain_until and instance.deployment.drain_until > now
+        if not draining and instance.status != 'PENDING' and _unused_for(instance, now) >= function.idle_after_seconds:
+            _terminate(instance, stats)
+
+    idle = []
+    for instance in active:
+        unused = _unused_for(instance, now)
+        if instance.status == 'RUNNING' and unused >= function.idle_after_seconds:
+            # Conditional, so a call recorded since the query isn't overwritten
+            if FunctionInstance.objects.filter(pk=instance.pk, status='RUNNING',
+                                               last_accessed=instance.last_accessed).update(status='IDLE'):
+                instance.status = 'IDLE'
+                stats['idled'] += 1
+        if instance.status == 'IDLE':
+            idle.append(instance)
+
+    live = len(active)
+    floor = max(function.min_instances, floor)
+    idle.sort(key=lambda i: i.last_accessed)  # Least recently used first
+    for instance in idle:
+        over_max = function.max_instances and live > function.max_instances
+        expired = _unused_for(instance, now) >= function.keep_warm_seconds
+        if not over_max and (live <= floor or not expired):
+            continue
+        if _terminate(instance, stats):
+            live -= 1
+
+    if function.is_active and live < function.min_instances:
+        deployment = active[0].deployment if active else function.deployments.filter(is_active=True).first()
+        for _ in range(function.min_instances - live if deployment else 0):
+            try:
+                start_instance(deployment)
+            except (NoWorkerAvailable, ProvisioningError) as e:
+                logger.warning("Keeping %s warm: %s", function.name, e)
+                stats['start_failed'] += 1
+                break
+            stats['started'] += 1
+
+
+def _terminate(instance, stats):
+    # Skip it if it was used since it was loaded
+    if not FunctionInstance.objects.filter(pk=instance.pk, status=instance.status,
+                                           last_accessed=instance.last_accessed).exists():
+        return False
+    terminate_instance(instance)
+    stats['terminated'] += 1
+    return True
+
+
+def keep_warm_report(hours=24, now=None):
+    """
+    Per function over the last `hours`: invocations, cold starts and the memory
+    reserved for its instances, to weigh keep-warm policies against each other.
+    Reserved memory is the function's memory_mb for each instance's lifetime.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(hours=hours)
+    window = (now - since).total_seconds()
+
+    calls = {row['function']: row for row in InvocationRequest.objects.filter(
+        start_time__gte=since, is_cache_hit=False
+    ).values('function').annotate(invocations=Count('id'), cold_starts=Count('id', filter=Q(is_cold_start=True)))}
+
+    mb_seconds = Counter()
+    instances = Counter()
+    terminated = Counter()
+    for instance in FunctionInstance.objects.filter(started_at__lt=now).filter(
+            Q(stopped_at__isnull=True) | Q(stopped_at__gt=since)).select_related('deployment__function'):
+        function = instance.deployment.function
+        if instance.stopped_at:
+            end = instance.stopped_at
+        elif instance.status in LIVE_STATUSES:
+            end = now
+        else:
+            end = instance.last_accessed  # Failed before stopped_at was recorded
+        lifetime = (min(end, now) - max(instance.started_at, since)).total_seconds()
+        if lifetime <= 0:
+            continue
+        mb_seconds[function.pk] += function.memory_mb * lifetime
+        instances[function.pk] += 1
+        if instance.status == 'TERMINATED':
+            terminated[function.pk] += 1
+
+    rows = []
+    for function in Function.objects.filter(pk__in=set(calls) | set(mb_seconds)).order_by('name'):
+        row = calls.get(function.pk, {})
+        invocations = row.get('invocations', 0)
+        cold_starts = row.get('cold_starts', 0)
+        rows.append({
+            'function': function.name,
+            'idle_after_seconds': function.idle_after_seconds,
+            'keep_warm_seconds': function.keep_warm_seconds,
+            'min_instances': function.min_instances,
+            'max_instances': function.max_instances,
+            'invocations': invocations,
+            'cold_starts': cold_starts,
+            'cold_start_rate': cold_starts / invocations if invocations else 0.0,
+            'instances': instances[function.pk],
+            'terminated': terminated[function.pk],
+            'avg_reserved_mb': mb_seconds[function.pk] / window,
+            'mb_hours': mb_seconds[function.pk] / 3600,
+        })
+    return rows
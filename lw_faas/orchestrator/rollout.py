@@ -0,0 +1,89 @@
+"""
+Switching a function to another deployment (deploys and rollbacks).
+
+activate() with `instances` is a blue/green switch: the target deployment
+first gets that many instances, started on worker agents (provisioning.py),
+and only once each runtime host has registered through instance_ready does
+the active pointer move, in one transaction, so the gateway never routes to a
+deployment with nothing warm behind it. Without `instances` the switch is
+immediate and the next calls cold start, as before.
+
+The deployment that was active keeps its instances for `drain_seconds`
+(Deployment.drain_until; the reaper leaves them alone until then), so calls
+already on them finish and rolling back to it within the window needs no
+cold start: its instances are still live, count toward the target and the
+switch is instant.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Deployment, Function, FunctionInstance
+from .provisioning import LIVE_STATUSES, ProvisioningError, start_instance, terminate_instance
+from .scheduler import NoWorkerAvailable
+
+logger = logging.getLogger(__name__)
+
+
+class RolloutError(Exception):
+    """The new deployment's instances couldn't be started; the active deployment is unchanged."""
+
+
+def _ready(deployment):
+    return FunctionInstance.objects.filter(deployment=deployment, status__in=('RUNNING', 'IDLE'),
+                                           ready_at__isnull=False)
+
+
+def activate(deployment, instances=0, drain_seconds=None, timeout=None):
+    """
+    Make `deployment` its function's active deployment, after `instances` of
+    its instances are up and registered. Raises RolloutError if they aren't
+    within `timeout` seconds; instances started for it are terminated then.
+    """
+    drain_seconds = settings.DEPLOY_DRAIN_SECONDS if drain_seconds is None else drain_seconds
+    timeout = settings.DEPLOY_PREWARM_TIMEOUT_SECONDS if timeout is None else timeout
+    started = []
+    if instances > 0:
+        # Instances still warm from before (a rollback within the drain window) count
+        live = FunctionInstance.objects.filter(deployment=deployment, status__in=LIVE_STATUSES).count()
+        try:
+            for _ in range(instances - live):
+                started.append(start_instance(deployment))
+            _wait_ready(deployment, instances, started, timeout)
+        except (NoWorkerAvailable, ProvisioningError, RolloutError) as e:
+            for instance in started:
+                instance.refresh_from_db()
+                if instance.status in LIVE_STATUSES:
+                    terminate_instance(instance)
+            logger.warning("Pre-warming %s v%s failed: %s", deployment.function.name, deployment.version, e)
+            raise RolloutError(str(e))
+
+    with transaction.atomic():
+        # Switches of one function run one after another, each seeing the last one's result.
+        # SQLite has no row locks; the UPDATE below takes its database write lock instead.
+        if connection.features.has_select_for_update:
+            Function.objects.select_for_update().get(pk=deployment.function_id)
+        Deployment.objects.filter(function=deployment.function_id, is_active=True).exclude(pk=deployment.pk).update(
+            is_active=False, drain_until=timezone.now() + timedelta(seconds=drain_seconds)
+        )
+        deployment.is_active = True
+        deployment.drain_until = None
+        deployment.save()  # Signals switch gateway routing once this commits
+    return deployment
+
+
+def _wait_ready(deployment, instances, started, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        if _ready(deployment).count() >= instances:
+            return
+        failed = FunctionInstance.objects.filter(pk__in=[i.pk for i in started]).exclude(status__in=LIVE_STATUSES)
+        if failed.exists():
+            raise RolloutError(f"{failed.count()} of the new instances failed to start")
+        if time.monotonic() >= deadline:
+            raise RolloutError(f"Instances not registered within {timeout:g}s")
+        time.sleep(0.2)
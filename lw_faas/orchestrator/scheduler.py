@@ -0,0 +1,128 @@
+"""
+Placement of new function instances on worker nodes.
+
+`WorkerNode.available_memory_mb` is the orchestrator's ledger of unreserved
+memory: placing an instance subtracts its function's `memory_mb` with a
+conditional UPDATE, so concurrent cold starts can't oversubscribe a node,
+and stopping the instance gives it back (release_memory).
+
+Candidates are ONLINE workers with enough free memory, ranked by a policy:
+
+    best_fit  the worker left with the least free memory (bin packing; keeps
+              whole nodes free for large functions and for scaling down)
+    spread    the worker with the largest free fraction (fewer noisy neighbours)
+    affinity  workers that reported having the deployment's dependency
+              environment or code cached (runtime/envstore.py,
+              runtime/blobcache.py, see update_worker_cache) first, best fit
+              among equals
+
+The default comes from ORCHESTRATOR_PLACEMENT_POLICY.
+"""
+from django.conf import settings
+from django.db.models import Exists, ExpressionWrapper, F, FloatField, OuterRef
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import FunctionInstance, WorkerCacheEntry, WorkerNode
+
+POLICIES = ('best_fit', 'spread', 'affinity')
+
+
+class NoWorkerAvailable(Exception):
+    """No ONLINE worker has enough unreserved memory for the instance."""
+
+
+class Placement:
+    """A worker with memory reserved for one new instance."""
+    __slots__ = ('worker', 'memory_mb', 'policy')
+
+    def __init__(self, worker, memory_mb, policy):
+        self.worker = worker
+        self.memory_mb = memory_mb
+        self.policy = policy
+
+    def __repr__(self):
+        return f"<Placement {self.worker.hostname} {self.memory_mb}MB ({self.policy})>"
+
+
+def ranked_workers(deployment, memory_mb, policy):
+    """ONLINE workers that can fit `memory_mb`, best first for `policy`."""
+    workers = WorkerNode.objects.filter(status='ONLINE', available_memory_mb__gte=memory_mb, max_memory_mb__gt=0)
+    if policy == 'best_fit':
+        return workers.order_by('available_memory_mb', 'id')
+    if policy == 'spread':
+        free_fraction = ExpressionWrapper(F('available_memory_mb') * 1.0 / F('max_memory_mb'), output_field=FloatField())
+        return workers.annotate(free_fraction=free_fraction).order_by('-free_fraction', 'id')
+    if policy == 'affinity':
+        # A missing environment costs a pip install, missing code only a blob fetch
+        cached = WorkerCacheEntry.objects.filter(worker=OuterRef('pk'))
+        return workers.annotate(
+            env_cached=Exists(cached.filter(kind='env', digest=deployment.requirements_hash)),
+            code_cached=Exists(cached.filter(kind='code', digest=deployment.code_blob_id)),
+        ).order_by('-env_cached', '-code_cached', 'available_memory_mb', 'id')
+    raise ValueError(f"Unknown placement policy {policy!r}; expected one of {', '.join(POLICIES)}")
+
+
+def reserve_memory(worker_id, memory_mb):
+    """Take `memory_mb` from a worker if it is ONLINE and still has it free. Returns whether it did."""
+    return WorkerNode.objects.filter(
+        pk=worker_id, status='ONLINE', available_memory_mb__gte=memory_mb
+    ).update(available_memory_mb=F('available_memory_mb') - memory_mb) == 1
+
+
+def release_memory(worker_id, memory_mb):
+    """Return memory reserved by reserve_memory() (never above the worker's capacity)."""
+    WorkerNode.objects.filter(pk=worker_id).update(
+        available_memory_mb=Least(F('available_memory_mb') + memory_mb, F('max_memory_mb'))
+    )
+
+
+def release_instance_memory(instance):
+    """Return the memory reserved for an instance to its worker; later calls for it do nothing."""
+    memory_mb = FunctionInstance.objects.filter(pk=instance.pk).values_list('memory_mb', flat=True).first()
+    stopped_at = timezone.now()
+    if memory_mb and FunctionInstance.objects.filter(pk=instance.pk, memory_mb=memory_mb).update(
+            memory_mb=0, stopped_at=stopped_at):
+        release_memory(instance.worker_id, memory_mb)
+        instance.stopped_at = stopped_at
+    instance.memory_mb = 0
+
+
+def resize_capacity(worker_id, max_memory_mb):
+    """Apply a worker's reported capacity, keeping the memory already reserved on it."""
+    WorkerNode.objects.filter(pk=worker_id).update(
+        available_memory_mb=Greatest(F('available_memory_mb') + max_memory_mb - F('max_memory_mb'), 0),
+        max_memory_mb=max_memory_mb,
+    )
+
+
+def update_worker_cache(worker_id, kind, digests):
+    """Replace what a worker has cached of one kind ('env' or 'code') with the `digests` it reported."""
+    digests = set(digests)
+    entries = WorkerCacheEntry.objects.filter(worker_id=worker_id, kind=kind)
+    entries.exclude(digest__in=digests).delete()
+    known = set(entries.values_list('digest', flat=True))
+    WorkerCacheEntry.objects.bulk_create(
+        [WorkerCacheEntry(worker_id=worker_id, kind=kind, digest=digest) for digest in digests - known],
+        ignore_conflicts=True,
+    )
+
+
+def place(deployment, policy=None):
+    """
+    Pick a worker for a new instance of `deployment` and reserve the function's
+    memory on it. The caller creates the instance with `memory_mb` set, and calls
+    release_memory() if it can't start one. Raises NoWorkerAvailable.
+    """
+    policy = policy or settings.ORCHESTRATOR_PLACEMENT_POLICY
+    memory_mb = deployment.function.memory_mb
+    for _ in range(settings.ORCHESTRATOR_PLACEMENT_ATTEMPTS):
+        candidates = list(ranked_workers(deployment, memory_mb, policy)[:settings.ORCHESTRATOR_PLACEMENT_CANDIDATES])
+        if not candidates:
+            break
+        for worker in candidates:
+            # Another cold start may have taken the memory since the ranking query
+            if reserve_memory(worker.pk, memory_mb):
+                worker.available_memory_mb -= memory_mb
+                return Placement(worker, memory_mb, policy)
+    raise NoWorkerAvailable(f"No worker has {memory_mb}MB free for {deployment}")
@@ -7,7 +7,24 @@ class FunctionSerializer(serializers.ModelSerializer):
         model = Function
         fields = '__all__'
 
+    def validate(self, attrs):
+        def value(field):
+            return attrs.get(field, getattr(self.instance, field, Function._meta.get_field(field).default))
+        # The reaper goes by when an instance was last used, which a call running
+        # longer than this wouldn't update in time
+        if value('idle_after_seconds') < value('timeout_seconds'):
+            raise serializers.ValidationError("'idle_after_seconds' can't be shorter than 'timeout_seconds'.")
+        if value('keep_warm_seconds') < value('idle_after_seconds'):
+            raise serializers.ValidationError("'keep_warm_seconds' can't be shorter than 'idle_after_seconds'.")
+        if value('max_instances') and value('min_instances') > value('max_instances'):
+            raise serializers.ValidationError("'min_instances' can't exceed 'max_instances'.")
+        return attrs
+
 class DeploymentSerializer(serializers.ModelSerializer):
+    # The snapshot texts, as before they were stored as blobs
+    code_snapshot = serializers.CharField(read_only=True)
+    requirements_snapshot = serializers.CharField(read_only=True)
+
     class Meta:
         model = Deployment
         fields = '__all__'
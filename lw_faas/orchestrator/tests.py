@@ -1,3 +1,309 @@
-from django.test import TestCase
+import io
+import itertools
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.db import close_old_connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from runtime import runtime_host
+from . import agent_client
+from .compiler import CACHE_TAG
+from .liveness import WorkerRegistry, worker_registry
+from .management.base import PeriodicCommand, ReportCommand
+from .models import CodeBlob, CompiledCode, Deployment, Function, FunctionInstance, InvocationRequest, WorkerNode
+from .prewarm import Forecaster, target_instances
+from .provisioning import InstanceLimitReached, ProvisioningError, start_instance
+from .rollout import activate
+from .scheduler import NoWorkerAvailable, place, release_instance_memory
+
+CODE = "def handle(body, context):\n    return body\n"
+
+
+def make_deployment(name, is_active=True, version=1, **fields):
+    function = Function.objects.filter(name=name).first() or Function.objects.create(name=name, code=CODE, **fields)
+    return Deployment.objects.create(function=function, version=version, code_blob=CodeBlob.store(CODE),
+                                     requirements_blob=CodeBlob.store(''), entry_point_snapshot='handle',
+                                     is_active=is_active)
+
+
+def make_worker(hostname='w1', memory_mb=1024):
+    return WorkerNode.objects.create(hostname=hostname, ip_address='127.0.0.1', agent_port=7070,
+                                     max_memory_mb=memory_mb, available_memory_mb=memory_mb)
+
+
+def run_concurrently(target, count):
+    """Call `target` from `count` threads at once; returns (results, exceptions)."""
+    results, errors = [], []
+    barrier = threading.Barrier(count)
+
+    def run():
+        try:
+            barrier.wait()
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            close_old_connections()
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class ConcurrentPlacementTests(TransactionTestCase):
+    def test_concurrent_placements_never_oversubscribe_a_worker(self):
+        worker = make_worker(memory_mb=1024)
+        deployment = make_deployment('placed', memory_mb=256)
+
+        placements, errors = run_concurrently(lambda: place(deployment), 12)
+
+        self.assertEqual(len(placements), 4)
+        self.assertEqual(len(errors), 8)
+        self.assertTrue(all(isinstance(e, NoWorkerAvailable) for e in errors), errors)
+        worker.refresh_from_db()
+        self.assertEqual(worker.available_memory_mb, 0)
+
+
+class MemoryLedgerTests(TestCase):
+    def setUp(self):
+        self.worker = make_worker(memory_mb=1024)
+        self.deployment = make_deployment('ledger', memory_mb=256)
+
+    def test_failed_start_gives_the_memory_back(self):
+        with mock.patch.object(agent_client, 'spawn_instance', side_effect=agent_client.AgentError('refused')):
+            with self.assertRaises(ProvisioningError):
+                start_instance(self.deployment)
+        self.worker.refresh_from_db()
+        self.assertEqual(self.worker.available_memory_mb, 1024)
+        instance = FunctionInstance.objects.get()
+        self.assertEqual((instance.status, instance.memory_mb), ('ERROR', 0))
+
+    def test_release_is_counted_once(self):
+        with mock.patch.object(agent_client, 'spawn_instance', return_value={'port': 20001}):
+            instance = start_instance(self.deployment)
+        self.worker.refresh_from_db()
+        self.assertEqual(self.worker.available_memory_mb, 768)
+        release_instance_memory(instance)
+        release_instance_memory(instance)
+        self.worker.refresh_from_db()
+        self.assertEqual(self.worker.available_memory_mb, 1024)
+
+    def test_no_worker_with_enough_memory(self):
+        big = make_deployment('big', memory_mb=2048)
+        with self.assertRaises(NoWorkerAvailable):
+            place(big)
+        self.worker.refresh_from_db()
+        self.assertEqual(self.worker.available_memory_mb, 1024)
+
+
+class ConcurrentActivationTests(TransactionTestCase):
+    def test_concurrent_switches_leave_one_deployment_active(self):
+        current = make_deployment('switched')
+        candidates = [make_deployment('switched', is_active=False, version=v) for v in (2, 3, 4)]
+        for _ in range(5):
+            switches = iter(candidates)
+            _, errors = run_concurrently(lambda: activate(next(switches)), len(candidates))
+            self.assertEqual(errors, [])
+            active = Deployment.objects.filter(function=current.function, is_active=True)
+            self.assertEqual(active.count(), 1)
+            self.assertIn(active.get().pk, [c.pk for c in candidates])
+
+
+class InstanceLimitTests(TransactionTestCase):
+    def test_concurrent_starts_stay_within_max_instances(self):
+        worker = make_worker(memory_mb=4096)
+        deployment = make_deployment('limited', memory_mb=128, max_instances=2)
+        ports = itertools.count(20001)
+
+        with mock.patch.object(agent_client, 'spawn_instance', side_effect=lambda instance: {'port': next(ports)}):
+            started, errors = run_concurrently(lambda: start_instance(deployment), 6)
+
+        self.assertEqual(len(started), 2)
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(isinstance(e, InstanceLimitReached) for e in errors), errors)
+        self.assertEqual(FunctionInstance.objects.filter(deployment=deployment).count(), 2)
+        worker.refresh_from_db()
+        self.assertEqual(worker.available_memory_mb, 4096 - 2 * 128)
+
+
+class FailureDetectorTests(TestCase):
+    def test_silent_worker_is_marked_offline(self):
+        # A process that never received a heartbeat, e.g. one restarted during an outage
+        registry = WorkerRegistry(timeout=30)
+        silent = make_worker('silent')
+        WorkerNode.objects.filter(pk=silent.pk).update(last_heartbeat=timezone.now() - timedelta(seconds=60))
+        with mock.patch.object(agent_client, 'spawn_instance', return_value={'port': 20001}):
+            instance = start_instance(make_deployment('stranded', memory_mb=256))
+        healthy = make_worker('healthy')
+
+        self.assertEqual([w.pk for w in registry.detect_failures()], [silent.pk])
+        silent.refresh_from_db()
+        healthy.refresh_from_db()
+        instance.refresh_from_db()
+        self.assertEqual((silent.status, healthy.status), ('OFFLINE', 'ONLINE'))
+        self.assertEqual((instance.status, instance.memory_mb), ('ERROR', 0))
+        self.assertEqual(silent.available_memory_mb, 1024)
+
+    def test_serving_processes_start_the_detector(self):
+        config = apps.get_app_config('orchestrator')
+        for argv, started in ((['gunicorn', 'lw_faas.wsgi'], True), (['manage.py', 'runserver'], True),
+                              (['manage.py', 'migrate'], False)):
+            with mock.patch('sys.argv', argv), mock.patch.object(worker_registry, 'start') as start:
+                config.ready()
+            self.assertEqual(start.called, started, argv)
+
+
+class DeployCompilationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def deploy(self, code):
+        function = Function.objects.create(name='compiled', code=code)
+        return function, self.client.post(f'/api/orchestrator/functions/{function.pk}/deploy/', {}, format='json')
+
+    def test_code_that_does_not_compile_is_rejected(self):
+        function, response = self.deploy("def handle(body, context)\n    return body\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('SyntaxError', response.json()['detail'])
+        self.assertEqual(response.json()['line'], 1)
+        self.assertFalse(Deployment.objects.filter(function=function).exists())
+
+    def test_runtime_host_loads_the_deploy_time_bytecode(self):
+        function, response = self.deploy(CODE)
+        self.assertEqual(response.status_code, 201)
+        deployment_id = response.json()['id']
+        self.assertEqual(CompiledCode.objects.get(deployment=deployment_id).cache_tag, CACHE_TAG)
+        response = self.client.get(f'/api/orchestrator/deployments/{deployment_id}/bytecode/')
+        self.assertEqual((response.status_code, response['X-Python-Cache-Tag']), (200, CACHE_TAG))
+        missing = self.client.get(f'/api/orchestrator/deployments/{deployment_id}/bytecode/?cache_tag=cpython-00')
+        self.assertEqual(missing.status_code, 404)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        code_path, bytecode_path = os.path.join(tmp.name, 'handler.py'), os.path.join(tmp.name, 'handler.pyc')
+        with open(code_path, 'w') as f:
+            f.write(CODE)
+        for bytecode, source, filename in ((response.content, 'bytecode', '<compiled v1>'),
+                                           (b'\0' * 4 + response.content[4:], 'source', code_path)):
+            with open(bytecode_path, 'wb') as f:
+                f.write(bytecode)
+            with mock.patch.multiple(runtime_host, user_function=None, user_input_format='json',
+                                     user_output_content_type='application/octet-stream',
+                                     user_code_source=None, user_code_load_ms=None), \
+                    mock.patch('sys.stdout', io.StringIO()), mock.patch('sys.stderr', io.StringIO()):
+                handle = runtime_host.load_user_function(code_path, 'handle', bytecode_path)
+                self.assertEqual(runtime_host.user_code_source, source)
+            self.assertEqual(handle.__code__.co_filename, filename)
+            self.assertEqual(handle({'x': 1}, {}), {'x': 1})
+
+
+class CodeBlobReuseTests(TestCase):
+    def deploy(self, function, code):
+        Function.objects.filter(pk=function.pk).update(code=code)
+        response = APIClient().post(f'/api/orchestrator/functions/{function.pk}/deploy/', {}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Deployment.objects.get(pk=response.json()['id'])
+
+    def test_unchanged_code_reuses_its_blob(self):
+        function = Function.objects.create(name='stored', code=CODE)
+        first = self.deploy(function, CODE)
+        self.assertEqual(CodeBlob.objects.count(), 2)  # Code and the empty requirements
+        self.assertEqual(self.deploy(function, CODE).code_blob_id, first.code_blob_id)
+        self.assertEqual(CodeBlob.objects.count(), 2)
+
+        changed = self.deploy(function, CODE + "# changed\n")
+        self.assertNotEqual(changed.code_blob_id, first.code_blob_id)
+        reverted = self.deploy(function, CODE)
+        self.assertEqual((reverted.code_blob_id, CodeBlob.objects.count()), (first.code_blob_id, 3))
+
+        response = APIClient().get(f'/api/orchestrator/blobs/{first.code_blob_id}/')
+        self.assertEqual((response.content.decode(), response['ETag']), (CODE, f'"{first.code_blob_id}"'))
+
+
+class KeepWarmPolicyValidationTests(TestCase):
+    def test_instances_go_idle_no_sooner_than_a_call_can_run(self):
+        client = APIClient()
+        response = client.post('/api/orchestrator/functions/', {'name': 'slow', 'code': CODE, 'timeout_seconds': 120,
+                                                                 'idle_after_seconds': 60}, format='json')
+        self.assertEqual(response.status_code, 400)
+        function = Function.objects.create(name='slow', code=CODE)
+        response = client.patch(f'/api/orchestrator/functions/{function.pk}/', {'timeout_seconds': 90}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.patch(f'/api/orchestrator/functions/{function.pk}/',
+                                {'timeout_seconds': 90, 'idle_after_seconds': 90}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+
+class ForecasterTests(TestCase):
+    def setUp(self):
+        self.deployment = make_deployment('forecast')
+        self.function = self.deployment.function
+        self.now = timezone.make_aware(datetime(2026, 5, 4, 10, 7))
+        self.forecaster = Forecaster(bucket_minutes=15, history_days=7, ewma_alpha=0.5, ewma_buckets=2,
+                                     profile_weight=0.5)
+
+    def calls(self, count, days_ago=0, hour=10, minute=0, deployment=None, **fields):
+        deployment = deployment or self.deployment
+        start_time = self.now.replace(hour=hour, minute=minute) - timedelta(days=days_ago)
+        InvocationRequest.objects.bulk_create(
+            InvocationRequest(function=deployment.function, deployment=deployment, request_id=str(n),
+                              request_body='{}', start_time=start_time, is_cold_start=False, status='SUCCESS',
+                              **fields)
+            for n in range(count)
+        )
+
+    def test_buckets_divide_the_day(self):
+        start, end = self.forecaster.bucket_bounds(self.now)
+        self.assertEqual((start.time().isoformat(), end.time().isoformat()), ('10:00:00', '10:15:00'))
+        with self.assertRaises(ValueError):
+            Forecaster(bucket_minutes=7)
+
+    def test_profile_averages_the_days_the_function_existed(self):
+        window_start, _ = self.forecaster.bucket_bounds(self.now + timedelta(minutes=15))
+        self.calls(4, days_ago=1, minute=20)
+        self.calls(2, days_ago=2, minute=16)
+        self.calls(5, days_ago=1, minute=20, is_cache_hit=True)  # Never reached an instance
+        self.assertEqual(self.forecaster.profile(window_start, self.now), {self.function.pk: 3.0})
+
+    def test_forecast_blends_profile_and_recent_level(self):
+        window_start, _ = self.forecaster.bucket_bounds(self.now + timedelta(minutes=15))
+        self.calls(4, days_ago=1, minute=20)
+        self.calls(2, days_ago=2, minute=16)
+        self.calls(2, hour=9, minute=31)
+        self.calls(6, hour=9, minute=50)
+        new = make_deployment('new')  # No history on previous days: the level alone
+        self.calls(4, hour=9, minute=50, deployment=new)
+
+        self.assertEqual(self.forecaster.level(self.now), {self.function.pk: 4.0, new.function.pk: 2.0})
+        self.assertEqual(self.forecaster.forecast(window_start, self.now),
+                         {self.function.pk: 3.5, new.function.pk: 2.0})
+
+
+class TargetInstancesTests(TestCase):
+    def test_instances_from_forecast_duration_and_concurrency(self):
+        function = Function(name='planned', max_instances=0)
+        # 900 calls in a 15 minute bucket lasting 2s each: 2 calls in flight on average
+        self.assertEqual(target_instances(function, 900, 2.0, 1), 2)
+        self.assertEqual(target_instances(function, 900, 2.0, 4), 1)
+        self.assertEqual(target_instances(function, 9000, 2.0, 1), 20)
+        self.assertEqual(target_instances(function, 10, None, 1), 1)  # No durations yet: one instance
+        function.max_instances = 5
+        self.assertEqual(target_instances(function, 9000, 2.0, 1), 5)
+        with self.settings(PREWARM_MIN_INVOCATIONS=50):
+            self.assertEqual(target_instances(function, 10, 2.0, 1), 0)
+
+
+class ManagementBaseTests(SimpleTestCase):
+    def test_commands_must_implement_their_hooks(self):
+        for base in (PeriodicCommand, ReportCommand):
+            with self.assertRaises(TypeError):
+                base()
@@ -5,6 +5,7 @@ from . import views
 router = DefaultRouter()
 router.register(r'functions', views.FunctionViewSet, basename='functions')
 router.register(r'deployments', views.DeploymentViewSet, basename='deployment')
+router.register(r'blobs', views.CodeBlobViewSet, basename='blob')
 router.register(r'workers', views.WorkerNodeViewSet, basename='worker')
 router.register(r'instances', views.FunctionInstanceViewSet, basename='instance')
 router.register(r'invocations', views.InvocationRequestViewSet, basename='invocation')
@@ -4,7 +4,12 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from .models import Function, Deployment, WorkerNode, FunctionInstance, InvocationRequest
+from django.http import HttpResponse
+from runtime.envstore import requirements_hash
+from .compiler import CACHE_TAG, code_filename, compile_deployment, compile_source
+from .models import CodeBlob, CompiledCode, Function, Deployment, WorkerNode, FunctionInstance, InvocationRequest
+from .provisioning import LIVE_STATUSES
+from .rollout import RolloutError, activate
 from .serializers import (FunctionSerializer, DeploymentSerializer,
                           WorkerNodeSerializer, FunctionInstanceSerializer,
                           InvocationRequestSerializer)
@@ -14,6 +19,44 @@ class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff
 
+def _rollout_options(request, function):
+    """
+    activate() arguments from the request: "strategy" is "immediate" (default)
+    or "blue_green", which first starts "instances" of the deployment
+    (default: as many as the active one has live, at least 1) and keeps the
+    old deployment's instances warm for "drain_seconds" (orchestrator/rollout.py).
+    Raises ValueError with a message for the client.
+    """
+    strategy = request.data.get('strategy', 'immediate')
+    if strategy == 'immediate':
+        # Nothing was warmed for it; the old instances go as soon as they are idle
+        return {'instances': 0, 'drain_seconds': 0}
+    if strategy != 'blue_green':
+        raise ValueError("'strategy' must be 'immediate' or 'blue_green'.")
+    instances = request.data.get('instances')
+    if instances is None:
+        instances = max(1, FunctionInstance.objects.filter(
+            deployment__function=function, deployment__is_active=True, status__in=LIVE_STATUSES).count())
+    drain_seconds = request.data.get('drain_seconds')
+    try:
+        instances = int(instances)
+        drain_seconds = None if drain_seconds is None else float(drain_seconds)
+    except (TypeError, ValueError):
+        raise ValueError("'instances' and 'drain_seconds' must be numbers.")
+    if instances < 1 or (drain_seconds is not None and drain_seconds < 0):
+        raise ValueError("'instances' must be at least 1 and 'drain_seconds' not negative.")
+    return {'instances': instances, 'drain_seconds': drain_seconds}
+
+def _switch_to(deployment, options, serializer_class, success_status):
+    try:
+        activate(deployment, **options)
+    except RolloutError as e:
+        # The deployment stays on record, inactive; a rollback to it retries the switch
+        return Response({"detail": f"Deployment not activated: {e}",
+                         "deployment": serializer_class(deployment).data},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(serializer_class(deployment).data, status=success_status)
+
 class FunctionViewSet(viewsets.ModelViewSet):
     """
     API endpoint to manage Functions.
@@ -24,26 +67,37 @@ class FunctionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def deploy(self, request, pk=None):
-        """Create a new Deployment for this Function."""
+        """Create a new Deployment for this Function and make it active (options: _rollout_options)."""
         function = self.get_object()
+        try:
+            options = _rollout_options(request, function)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         # Logic to create a new Deployment snapshot
         # This would typically be in a service layer
         new_version = function.deployments.count() + 1
+        # Compile once here, so code that can't run is rejected before it is deployed
+        try:
+            bytecode, compile_ms = compile_source(function.code, code_filename(function.name, new_version))
+        except (SyntaxError, ValueError) as e:
+            return Response({
+                "detail": f"Function code does not compile: {e.__class__.__name__}: {getattr(e, 'msg', e)}",
+                "line": getattr(e, 'lineno', None),
+                "offset": getattr(e, 'offset', None),
+            }, status=status.HTTP_400_BAD_REQUEST)
         deployment = Deployment.objects.create(
             function=function,
             version=new_version,
             comment=request.data.get('comment', ''),
-            code_snapshot=function.code,
-            requirements_snapshot=function.requirements,
+            # Unchanged code or requirements (redeploys, reverts) reuse the stored blob
+            code_blob=CodeBlob.store(function.code),
+            requirements_blob=CodeBlob.store(function.requirements),
+            requirements_hash=requirements_hash(function.requirements),
             entry_point_snapshot=function.entry_point,
         )
-        # Deactivate other deployments for this function
-        function.deployments.exclude(id=deployment.id).update(is_active=False)
-        deployment.is_active = True
-        deployment.save()
-
-        serializer = DeploymentSerializer(deployment)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        CompiledCode.objects.create(deployment=deployment, cache_tag=CACHE_TAG,
+                                    bytecode=bytecode, compile_ms=compile_ms)
+        return _switch_to(deployment, options, DeploymentSerializer, status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'])
     def invoke(self, request, pk=None):
@@ -63,22 +117,57 @@ class DeploymentViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         # Optionally filter by function_id from URL
-        queryset = Deployment.objects.all()
+        queryset = Deployment.objects.select_related('code_blob', 'requirements_blob')
         function_id = self.request.query_params.get('function_id')
         if function_id is not None:
             queryset = queryset.filter(function_id=function_id)
         return queryset
 
+    @action(detail=True, methods=['get'])
+    def bytecode(self, request, pk=None):
+        """
+        The deployment's compiled code for a runtime host to load
+        (?cache_tag=cpython-311, defaulting to the orchestrator's Python).
+        """
+        deployment = self.get_object()
+        cache_tag = request.query_params.get('cache_tag', CACHE_TAG)
+        compiled = deployment.compiled_code.filter(cache_tag=cache_tag).first()
+        if compiled is None:
+            if cache_tag != CACHE_TAG:
+                return Response({"detail": f"No bytecode for {cache_tag}; load the source instead."},
+                                status=status.HTTP_404_NOT_FOUND)
+            # Deployments made before deploy-time compilation are compiled on first request
+            compiled = compile_deployment(deployment)
+        response = HttpResponse(bytes(compiled.bytecode), content_type='application/x-python-code')
+        response['X-Python-Cache-Tag'] = compiled.cache_tag
+        response['X-Compile-Ms'] = f"{compiled.compile_ms:.3f}"
+        return response
+
     @action(detail=True, methods=['post'])
     def rollback(self, request, pk=None):
-        """Set this specific deployment as active."""
+        """Set this specific deployment as active (options: _rollout_options)."""
         deployment = self.get_object()
-        # Deactivate all other deployments for this function
-        Deployment.objects.filter(function=deployment.function).exclude(id=deployment.id).update(is_active=False)
-        deployment.is_active = True
-        deployment.save()
-        serializer = self.get_serializer(deployment)
-        return Response(serializer.data)
+        try:
+            options = _rollout_options(request, deployment.function)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _switch_to(deployment, options, self.get_serializer_class(), status.HTTP_200_OK)
+
+class CodeBlobViewSet(viewsets.GenericViewSet):
+    """
+    Content-addressed code and requirements blobs, fetched by SHA-256.
+    Blobs never change, so workers cache them indefinitely (runtime/blobcache.py).
+    """
+    permission_classes = [AllowAny] # [IsAdminUser]
+    queryset = CodeBlob.objects.all()
+    lookup_value_regex = '[0-9a-f]{64}'
+
+    def retrieve(self, request, pk=None):
+        blob = self.get_object()
+        response = HttpResponse(blob.content, content_type='text/plain; charset=utf-8')
+        response['ETag'] = f'"{blob.sha256}"'
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
 
 class WorkerNodeViewSet(viewsets.ReadOnlyModelViewSet):
     """
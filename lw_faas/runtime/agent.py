@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+AryaXAI FaaS Platform - Worker Agent
+Starts, supervises and stops the runtime hosts on one worker node.
+
+The orchestrator (orchestrator/agent_client.py) sends commands to the agent's
+HTTP control server:
+
+    POST   /instances          {"instance_id", "deployment_id", "code_sha256",
+                                "requirements_sha256", "handler", "env": {...}}
+                               -> 201 {"instance_id", "port", "pid", "spawn_mode", "startup_ms"}
+                               once the runtime host accepts connections
+    DELETE /instances/<id>     -> 200 {"instance_id", "exit_code"}
+    GET    /instances          -> 200 {"instances": [...]}
+    GET    /health             -> 200 {"status": "ok", "instances": N, "free_ports": N}
+
+For a spawn the agent takes a port from its free-list, gets the code from the
+local blob cache (runtime/blobcache.py), the dependency environment from the
+environment store (runtime/envstore.py) and the deploy-time bytecode, then
+forks the host from the zygote (runtime/zygote.py) when one is running and the
+function has no dependencies, or starts `<env>/bin/python runtime_host.py`.
+Readiness is detected by connecting to the host's port.
+
+One monitor thread notices hosts that exit and returns their ports; one
+heartbeat thread reports the worker, every instance with its resident memory
+(from /proc) and the cached environments and code to the orchestrator, and
+stops the instances the orchestrator's reply lists. After an environment loses
+its last deployment the same thread runs the store's garbage collection. Nothing runs per instance,
+so hundreds of instances cost two threads.
+
+Started with `python manage.py run_worker_agent`.
+"""
+
+import collections
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUNTIME_DIR = os.path.dirname(os.path.abspath(__file__))
+if RUNTIME_DIR not in sys.path:
+    sys.path.insert(0, RUNTIME_DIR)
+
+from blobcache import BlobCache  # noqa: E402
+from envstore import EnvironmentStore, normalize_requirements  # noqa: E402
+import zygote  # noqa: E402
+
+RUNTIME_HOST = os.path.join(RUNTIME_DIR, 'runtime_host.py')
+
+# Configuration from Environment Variables
+AGENT_PORT = int(os.getenv('AGENT_PORT', '7070'))
+AGENT_TOKEN = os.getenv('AGENT_TOKEN')  # Shared secret expected in X-Agent-Token, if set
+AGENT_HOSTNAME = os.getenv('AGENT_HOSTNAME', socket.gethostname())
+AGENT_IP_ADDRESS = os.getenv('AGENT_IP_ADDRESS', '127.0.0.1')  # Address the gateway reaches instances on
+AGENT_PORT_RANGE = os.getenv('AGENT_PORT_RANGE', '20000-29999')
+AGENT_MAX_MEMORY_MB = int(os.getenv('AGENT_MAX_MEMORY_MB', '0'))  # 0 = MemTotal from /proc/meminfo
+AGENT_HEARTBEAT_SECONDS = float(os.getenv('AGENT_HEARTBEAT_SECONDS', '5'))
+AGENT_MONITOR_SECONDS = float(os.getenv('AGENT_MONITOR_SECONDS', '0.5'))
+AGENT_READY_TIMEOUT_SECONDS = float(os.getenv('AGENT_READY_TIMEOUT_SECONDS', '30'))
+AGENT_STOP_GRACE_SECONDS = float(os.getenv('AGENT_STOP_GRACE_SECONDS', '5'))
+AGENT_LOG_DIR = os.getenv('AGENT_LOG_DIR')  # Per-instance stdout/stderr files; discarded if unset
+ORCHESTRATOR_URL = os.getenv('ORCHESTRATOR_URL')  # e.g. http://orchestrator:8000
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class AgentError(Exception):
+    """A command the agent can't carry out; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+class PortAllocator:
+    """
+    Free-list of the worker's instance ports. Released ports go to the back, so a
+    port is reused as late as possible (after its old connections have closed).
+    Ports something else on the host is listening on are skipped.
+    """
+
+    def __init__(self, first, last):
+        self._free = collections.deque(range(first, last + 1))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bindable(port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            # Same option the runtime host's server sets, so TIME_WAIT leftovers don't count as taken
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind(('', port))
+            except OSError:
+                return False
+        return True
+
+    def allocate(self):
+        with self._lock:
+            for _ in range(len(self._free)):
+                port = self._free.popleft()
+                if self._bindable(port):
+                    return port
+                self._free.append(port)
+        raise AgentError("No free port for another instance", status=503)
+
+    def release(self, port):
+        with self._lock:
+            self._free.append(port)
+
+    def __len__(self):
+        return len(self._free)
+
+
+def read_rss_mb(pid):
+    """Resident memory of a process and its direct children (pre-forked workers), in MB."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    pages = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                pages += int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return round(pages * PAGE_SIZE / (1024 * 1024), 1)
+
+
+def is_alive(pid):
+    """Whether a process we didn't start (forked by the zygote) is still running."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The state follows the parenthesised command name; Z is exited but not yet reaped
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return False
+
+
+def total_memory_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 0
+
+
+class ManagedInstance:
+    __slots__ = ('instance_id', 'deployment_id', 'requirements', 'port', 'pid', 'proc',
+                 'spawn_mode', 'started_at', 'state', 'exit_code')
+
+    def __init__(self, instance_id, deployment_id, requirements, port):
+        self.instance_id = instance_id
+        self.deployment_id = deployment_id
+        self.requirements = requirements  # Normalized; '' when the host runs without an environment
+        self.port = port
+        self.pid = None
+        self.proc = None  # Popen for hosts we started; None for zygote forks
+        self.spawn_mode = None
+        self.started_at = time.time()
+        self.state = 'starting'
+        self.exit_code = None
+
+    def poll(self):
+        """Return True once the host process has exited."""
+        if self.pid is None:
+            return False
+        if self.proc is not None:
+            self.exit_code = self.proc.poll()
+            return self.exit_code is not None
+        return not is_alive(self.pid)
+
+    def as_dict(self):
+        return {
+            'instance_id': self.instance_id,
+            'deployment_id': self.deployment_id,
+            'port': self.port,
+            'pid': self.pid,
+            'state': self.state,
+            'spawn_mode': self.spawn_mode,
+            'rss_mb': read_rss_mb(self.pid) if self.pid else None,
+        }
+
+
+class WorkerAgent:
+
+    def __init__(self, hostname=AGENT_HOSTNAME, ip_address=AGENT_IP_ADDRESS, agent_port=AGENT_PORT,
+                 port_range=AGENT_PORT_RANGE, orchestrator_url=ORCHESTRATOR_URL,
+                 zygote_socket=zygote.ZYGOTE_SOCKET_PATH, blob_cache=None, env_store=None):
+        self.hostname = hostname
+        self.ip_address = ip_address
+        self.agent_port = agent_port
+        self.port_range = port_range
+        first, _, last = port_range.partition('-')
+        self.ports = PortAllocator(int(first), int(last or first))
+        self.orchestrator_url = orchestrator_url.rstrip('/') if orchestrator_url else None
+        self.zygote_socket = zygote_socket
+        self.blobs = blob_cache or BlobCache(orchestrator_url=orchestrator_url)
+        self.envs = env_store or EnvironmentStore()
+        self.instances = {}  # instance_id -> ManagedInstance
+        self._env_users = collections.Counter()  # deployment_id -> instances using its environment
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._reported_cache = None
+        self._env_released = threading.Event()  # Set when garbage collection may free something
+        self._env_released.set()  # Environments left unreferenced before a restart
+
+    # Spawning
+
+    def spawn(self, spec):
+        instance_id = str(spec.get('instance_id') or '')
+        deployment_id = str(spec.get('deployment_id') or '')
+        code_sha256 = spec.get('code_sha256')
+        if not instance_id or not deployment_id or not code_sha256:
+            raise AgentError("Missing 'instance_id', 'deployment_id' or 'code_sha256'.", status=400)
+        with self._lock:
+            if instance_id in self.instances:
+                raise AgentError(f"Instance {instance_id} already exists.", status=409)
+            instance = ManagedInstance(instance_id, deployment_id, '', self.ports.allocate())
+            self.instances[instance_id] = instance
+
+        try:
+            self._start(instance, spec, code_sha256)
+            self._wait_ready(instance, spec.get('ready_timeout') or AGENT_READY_TIMEOUT_SECONDS)
+        except BaseException as e:
+            self._discard(instance, kill=True)
+            if isinstance(e, AgentError):
+                raise
+            raise AgentError(f"Could not start instance {instance_id}: {e}")
+        instance.state = 'running'
+        return {
+            'instance_id': instance_id,
+            'port': instance.port,
+            'pid': instance.pid,
+            'spawn_mode': instance.spawn_mode,
+            'startup_ms': round((time.time() - instance.started_at) * 1000, 2),
+        }
+
+    def _start(self, instance, spec, code_sha256):
+        code_path = self.blobs.get(code_sha256, '.py')
+        python = sys.executable
+        requirements_sha256 = spec.get('requirements_sha256')
+        if requirements_sha256:
+            with open(self.blobs.get(requirements_sha256)) as f:
+                requirements = normalize_requirements(f.read())
+            if requirements:
+                # Environments are shared by every deployment with the same requirements
+                env_path = self.envs.acquire(instance.deployment_id, requirements)
+                with self._lock:
+                    self._env_users[instance.deployment_id] += 1
+                instance.requirements = requirements
+                python = os.path.join(env_path, 'bin', 'python')
+        bytecode_path = self._bytecode(instance.deployment_id)
+
+        env = {str(k): str(v) for k, v in (spec.get('env') or {}).items()}
+        env['INSTANCE_ID'] = instance.instance_id
+        if self.orchestrator_url:
+            env['ORCHESTRATOR_URL'] = self.orchestrator_url
+        handler = spec.get('handler') or 'handle'
+
+        # A zygote fork skips interpreter startup, but the zygote has no function's dependencies
+        if not instance.requirements and self._zygote_available():
+            reply = zygote.request_spawn(instance.instance_id, code_path, instance.port, handler=handler, env=env,
+                                         socket_path=self.zygote_socket, bytecode_path=bytecode_path)
+            instance.pid = reply['pid']
+            instance.spawn_mode = 'zygote'
+            return
+
+        env.update({
+            'USER_FUNCTION_PATH': code_path,
+            'FUNCTION_HANDLER_NAME': handler,
+            'RUNTIME_HOST_PORT': str(instance.port),
+            'RUNTIME_SPAWN_MODE': 'spawn',
+            'RUNTIME_SPAWN_TIME': str(instance.started_at),
+        })
+        if bytecode_path:
+            env['USER_FUNCTION_BYTECODE_PATH'] = bytecode_path
+        output = subprocess.DEVNULL
+        if AGENT_LOG_DIR:
+            os.makedirs(AGENT_LOG_DIR, exist_ok=True)
+            output = open(os.path.join(AGENT_LOG_DIR, f"{instance.instance_id}.log"), 'ab')
+        try:
+            instance.proc = subprocess.Popen(
+                [python, RUNTIME_HOST], env=dict(os.environ, **env), stdin=subprocess.DEVNULL,
+                stdout=output, stderr=subprocess.STDOUT, start_new_session=True,
+            )
+        finally:
+            if output is not subprocess.DEVNULL:
+                output.close()
+        instance.pid = instance.proc.pid
+        instance.spawn_mode = 'spawn'
+
+    def _zygote_available(self):
+        return bool(self.zygote_socket) and os.path.exists(self.zygote_socket)
+
+    def _bytecode(self, deployment_id):
+        """Local copy of the deployment's deploy-time bytecode, or None to compile from source."""
+        cache_tag = sys.implementation.cache_tag
+        path = os.path.join(self.blobs.root, 'bytecode', f"{deployment_id}.{cache_tag}.pyc")
+        if os.path.exists(path):
+            return path
+        if not self.orchestrator_url:
+            return None
+        url = f"{self.orchestrator_url}/api/orchestrator/deployments/{deployment_id}/bytecode/?cache_tag={cache_tag}"
+        try:
+            with urllib.request.urlopen(url, timeout=10) as resp:
+                data = resp.read()
+        except (urllib.error.URLError, OSError) as e:
+            print(f"WARNING: No bytecode for deployment {deployment_id}: {e}", file=sys.stderr)
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def _wait_ready(self, instance, timeout):
+        """Wait until the host accepts connections on its port; it binds only after loading the function."""
+        deadline = time.monotonic() + timeout
+        delay = 0.002
+        while time.monotonic() < deadline:
+            if instance.poll():
+                raise AgentError(f"Runtime host for instance {instance.instance_id} exited during startup "
+                                 f"(exit code {instance.exit_code}).", status=422)
+            try:
+                with socket.create_connection(('127.0.0.1', instance.port), timeout=0.1):
+                    return
+            except OSError:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        raise AgentError(f"Runtime host for instance {instance.instance_id} not ready after {timeout}s.", status=504)
+
+    # Stopping
+
+    def stop(self, instance_id, grace=AGENT_STOP_GRACE_SECONDS):
+        with self._lock:
+            instance = self.instances.get(instance_id)
+        if instance is None:
+            raise AgentError(f"Unknown instance {instance_id}.", status=404)
+        instance.state = 'stopping'
+        self._terminate(instance, grace)
+        self._discard(instance)
+        return {'instance_id': instance_id, 'exit_code': instance.exit_code}
+
+    def _terminate(self, instance, grace):
+        """SIGTERM the host's process group (it runs in its own session), then SIGKILL after `grace`."""
+        if instance.pid is None or instance.poll():
+            return
+        for signum, wait in ((signal.SIGTERM, grace), (signal.SIGKILL, 5)):
+            try:
+                os.killpg(instance.pid, signum)
+            except ProcessLookupError:
+                return
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                if instance.poll():
+                    return
+                time.sleep(0.02)
+
+    def _discard(self, instance, kill=False):
+        """Forget an instance and return its port and environment reference."""
+        if kill:
+            self._terminate(instance, grace=0)
+        with self._lock:
+            if self.instances.pop(instance.instance_id, None) is None:
+                return
+            release_env = False
+            if instance.requirements:
+                self._env_users[instance.deployment_id] -= 1
+                if self._env_users[instance.deployment_id] <= 0:
+                    del self._env_users[instance.deployment_id]
+                    release_env = True
+        self.ports.release(instance.port)
+        if release_env:
+            self.envs.release(instance.deployment_id, instance.requirements)
+            self._env_released.set()
+
+    # Supervision and reporting
+
+    def monitor(self):
+        """Forget hosts that exited on their own; the next heartbeat leaves them out."""
+        while not self._stopping.wait(AGENT_MONITOR_SECONDS):
+            with self._lock:
+                running = [i for i in self.instances.values() if i.state == 'running']
+            for instance in running:
+                if instance.poll():
+                    print(f"Runtime host for instance {instance.instance_id} exited (exit code {instance.exit_code}).")
+                    self._discard(instance)
+
+    def list_instances(self):
+        with self._lock:
+            instances = list(self.instances.values())
+        return [i.as_dict() for i in instances]
+
+    def heartbeat_payload(self):
+        payload = {
+            'hostname': self.hostname,
+            'ip_address': self.ip_address,
+            'agent_port': self.agent_port,
+            'max_memory_mb': AGENT_MAX_MEMORY_MB or total_memory_mb(),
+            'instances': self.list_instances(),
+        }
+        # Cache contents change rarely; only send them when they did
+        cache = (sorted(self.envs.environments()), sorted(self.blobs.cached()))
+        if cache != self._reported_cache:
+            payload['cached_envs'], payload['cached_code'] = cache
+        return payload, cache
+
+    def collect_env_garbage(self):
+        """Remove unreferenced environments over the store's limits, if one was released since the last run."""
+        if not self._env_released.is_set():
+            return []
+        self._env_released.clear()
+        return self.envs.collect_garbage()
+
+    def heartbeat(self):
+        while not self._stopping.is_set():
+            try:
+                self.collect_env_garbage()
+            except Exception as e:
+                print(f"WARNING: Environment garbage collection failed: {e}", file=sys.stderr)
+            if self.orchestrator_url:
+                try:
+                    self._send_heartbeat()
+                except Exception as e:
+                    print(f"WARNING: Heartbeat failed: {e}", file=sys.stderr)
+            self._stopping.wait(AGENT_HEARTBEAT_SECONDS)
+
+    def _send_heartbeat(self):
+        payload, cache = self.heartbeat_payload()
+        req = urllib.request.Request(
+            f"{self.orchestrator_url}/api/runtime/heartbeat/",
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            reply = json.loads(resp.read() or b'{}')
+        if 'cached_envs' in payload:
+            self._reported_cache = cache
+        # Instances the orchestrator doesn't consider live (e.g. marked ERROR) are stopped
+        for instance_id in reply.get('stop', []):
+            threading.Thread(target=self._stop_quietly, args=(instance_id,), daemon=True).start()
+
+    def _stop_quietly(self, instance_id):
+        try:
+            self.stop(instance_id)
+        except AgentError:
+            pass
+
+    def shutdown(self):
+        self._stopping.set()
+        with self._lock:
+            instances = list(self.instances.values())
+        for instance in instances:
+            self._terminate(instance, AGENT_STOP_GRACE_SECONDS)
+            self._discard(instance)
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    agent = None  # Set by serve()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # The control plane is chatty; instance events are printed by the agent
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if AGENT_TOKEN and self.headers.get('X-Agent-Token') != AGENT_TOKEN:
+            self._send(403, {'error': 'Invalid agent token.'})
+            return False
+        return True
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == '/health':
+            self._send(200, {'status': 'ok', 'instances': len(self.agent.instances), 'free_ports': len(self.agent.ports)})
+        elif self.path == '/instances':
+            self._send(200, {'instances': self.agent.list_instances()})
+        else:
+            self._send(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != '/instances':
+            self._send(404, {'error': 'Not found.'})
+            return
+        try:
+            self._send(201, self.agent.spawn(self._read_json()))
+        except ValueError:
+            self._send(400, {'error': 'Invalid JSON.'})
+        except AgentError as e:
+            self._send(e.status, {'error': str(e)})
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        match = re.fullmatch(r'/instances/([^/]+)', self.path)
+        if not match:
+            self._send(404, {'error': 'Not found.'})
+            return
+        try:
+            self._send(200, self.agent.stop(match.group(1)))
+        except AgentError as e:
+            self._send(e.status, {'error': str(e)})
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(agent):
+    """
+    Run the control server and the monitor and heartbeat threads until
+    interrupted (SIGINT or SIGTERM), then stop every runtime host.
+    """
+    signal.signal(signal.SIGTERM, _interrupt)
+    handler = type('Handler', (AgentRequestHandler,), {'agent': agent})
+    httpd = ThreadingHTTPServer(('', agent.agent_port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=agent.monitor, name='agent-monitor', daemon=True).start()
+    threading.Thread(target=agent.heartbeat, name='agent-heartbeat', daemon=True).start()
+    print(f"Worker agent {agent.hostname} listening on port {agent.agent_port}; "
+          f"instance ports {agent.port_range}, zygote {'on' if agent._zygote_available() else 'off'}")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        agent.shutdown()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+AryaXAI FaaS Platform - Worker Blob Cache
+Local copies of content-addressed code blobs (orchestrator CodeBlob).
+
+A blob is fetched from the orchestrator's /api/orchestrator/blobs/<sha256>/
+endpoint the first time an instance on this worker needs it, checked against
+its hash and kept on disk; every later instance of any deployment with the
+same code uses the local file:
+
+    <BLOB_CACHE_DIR>/<first 2 hex digits>/<sha256><suffix>
+
+Concurrent requests for a missing blob, from threads or other processes on
+the worker, wait for a single fetch.
+
+Usage:
+    python blobcache.py <sha256> [--suffix .py]   # prints the local path
+"""
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import urllib.request
+
+# Configuration from Environment Variables
+BLOB_CACHE_DIR = os.getenv('BLOB_CACHE_DIR', '/var/cache/lw_faas/blobs')
+ORCHESTRATOR_URL = os.getenv('ORCHESTRATOR_URL')  # e.g. http://orchestrator:8000
+BLOB_FETCH_TIMEOUT_SECONDS = float(os.getenv('BLOB_FETCH_TIMEOUT_SECONDS', '30'))
+
+
+_BLOB_PREFIX_RE = re.compile(r'^[0-9a-f]{2}$')
+_BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$')
+
+
+class BlobIntegrityError(Exception):
+    """The fetched content doesn't hash to the requested digest."""
+
+
+class BlobCache:
+
+    def __init__(self, root=BLOB_CACHE_DIR, orchestrator_url=ORCHESTRATOR_URL,
+                 timeout=BLOB_FETCH_TIMEOUT_SECONDS):
+        self.root = root
+        self.orchestrator_url = orchestrator_url
+        self.timeout = timeout
+        self.hits = 0
+        self.fetches = 0
+        self._locks = {}  # sha256 -> threading.Lock
+        self._locks_guard = threading.Lock()
+
+    def local_path(self, sha256, suffix=''):
+        return os.path.join(self.root, sha256[:2], f"{sha256}{suffix}")
+
+    def get(self, sha256, suffix=''):
+        """
+        Path of the local copy of a blob, fetching it if this worker doesn't have
+        it yet. `suffix` (e.g. '.py' for code loaded as a module) is part of the file name.
+        """
+        if len(sha256) != 64 or not all(c in '0123456789abcdef' for c in sha256):
+            raise ValueError(f"Not a SHA-256 hex digest: {sha256!r}")
+        path = self.local_path(sha256, suffix)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        with self._thread_lock(sha256), self._file_lock(sha256):
+            # Another thread or process may have fetched it while we waited
+            if os.path.exists(path):
+                self.hits += 1
+                return path
+            self._fetch(sha256, path)
+        return path
+
+    def cached(self):
+        """
+        Digests of every blob on disk (reported in worker heartbeats). Only blob
+        paths count; other files under the root (the agent's bytecode) are skipped.
+        """
+        digests = set()
+        if not os.path.isdir(self.root):
+            return digests
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not _BLOB_PREFIX_RE.match(prefix) or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if _BLOB_NAME_RE.match(name) and name.startswith(prefix):
+                    digests.add(name[:64])
+        return digests
+
+    def _fetch(self, sha256, path):
+        if not self.orchestrator_url:
+            raise RuntimeError(f"Blob {sha256[:12]} is not cached and ORCHESTRATOR_URL is not set")
+        url = f"{self.orchestrator_url.rstrip('/')}/api/orchestrator/blobs/{sha256}/"
+        with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+            content = resp.read()
+        if hashlib.sha256(content).hexdigest() != sha256:
+            raise BlobIntegrityError(f"Content fetched for blob {sha256[:12]} does not match its hash")
+        # Write under a temporary name so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.fetch-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        self.fetches += 1
+
+    def _thread_lock(self, sha256):
+        with self._locks_guard:
+            return self._locks.setdefault(sha256, threading.Lock())
+
+    @contextlib.contextmanager
+    def _file_lock(self, sha256):
+        directory = os.path.join(self.root, sha256[:2])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f".{sha256}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the local path of a code blob, fetching it if needed.')
+    parser.add_argument('sha256')
+    parser.add_argument('--suffix', default='')
+    args = parser.parse_args()
+    try:
+        print(BlobCache().get(args.sha256, args.suffix))
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
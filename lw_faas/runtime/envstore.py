@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+AryaXAI FaaS Platform - Dependency Environment Store
+Content-addressed virtualenvs for function dependencies on a worker node.
+
+Instead of one virtualenv per deployment, environments are keyed by a hash of
+the normalized requirements, so every deployment with the same requirements
+(e.g. redeploys that only change code) shares one prebuilt environment:
+
+    <ENV_STORE_ROOT>/<python cache tag>/<requirements hash>/   the virtualenv
+        .lw_env.json   requirements, referencing deployments, last use
+    <ENV_STORE_ROOT>/locks/                                     one lock file per environment
+
+Deployments take a reference with `acquire` and drop it with `release`.
+`collect_garbage` removes unreferenced environments, least recently used
+first, until the store is within ENV_STORE_MAX_ENVS / ENV_STORE_MAX_MB; the
+worker agent (runtime/agent.py) runs it after a release.
+Packages are installed with pip; with ENV_STORE_FIND_LINKS set, only from that
+local wheel directory (--no-index), so no network access is needed.
+
+Usage:
+    python envstore.py acquire <deployment_id> <requirements.txt>   # prints the environment path
+    python envstore.py release <deployment_id> <requirements.txt>
+    python envstore.py gc
+    python envstore.py list
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import venv
+
+# Configuration from Environment Variables
+ENV_STORE_ROOT = os.getenv('ENV_STORE_ROOT', '/venvs')
+ENV_STORE_FIND_LINKS = os.getenv('ENV_STORE_FIND_LINKS')  # Local wheel directory; disables the package index
+ENV_STORE_MAX_ENVS = int(os.getenv('ENV_STORE_MAX_ENVS', '50'))
+ENV_STORE_MAX_MB = int(os.getenv('ENV_STORE_MAX_MB', '10240'))
+
+METADATA_FILE = '.lw_env.json'
+_NAME_RE = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?(.*)$')
+
+
+def normalize_requirements(text):
+    """
+    Canonical form of a requirements file: comments, blank lines, duplicates and
+    insignificant whitespace removed, project names normalized (PEP 503) and
+    lines sorted, so equivalent files hash the same.
+    """
+    options, packages = set(), set()
+    for line in text.splitlines():
+        line = line.split(' #', 1)[0].strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('-'):
+            options.add(' '.join(line.split()))
+            continue
+        # Spaces are insignificant in the name and specifiers, but environment
+        # markers need them around 'and', 'or' and 'in'
+        requirement, _, marker = line.partition(';')
+        match = _NAME_RE.match(requirement.replace(' ', ''))
+        if not match:
+            packages.add(line)
+            continue
+        name, extras, spec = match.groups()
+        name = re.sub(r'[-_.]+', '-', name).lower()
+        extras = '[' + ','.join(sorted(e.strip().lower() for e in extras[1:-1].split(','))) + ']' if extras else ''
+        if spec.startswith('@'):
+            spec = ' @ ' + spec[1:] + (' ' if marker else '')  # A URL needs whitespace before ';'
+        elif spec:
+            # Order of comma-separated specifiers doesn't matter ('<2,>=1' == '>=1,<2')
+            spec = ','.join(sorted(spec.split(',')))
+        marker = ' '.join(marker.split())
+        packages.add(name + extras + spec + ('; ' + marker if marker else ''))
+    return '\n'.join(sorted(options) + sorted(packages))
+
+
+def requirements_hash(text):
+    """Content address of a requirements file (independent of the Python version)."""
+    return hashlib.sha256(normalize_requirements(text).encode('utf-8')).hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class EnvironmentStore:
+    """The environments under one root directory for the running Python version."""
+
+    def __init__(self, root=ENV_STORE_ROOT, find_links=ENV_STORE_FIND_LINKS,
+                 max_envs=ENV_STORE_MAX_ENVS, max_bytes=ENV_STORE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.envs_dir = os.path.join(root, sys.implementation.cache_tag)
+        self.locks_dir = os.path.join(root, 'locks')
+        self.find_links = find_links
+        self.max_envs = max_envs
+        self.max_bytes = max_bytes
+        os.makedirs(self.envs_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.envs_dir, key)
+
+    def python_for(self, key):
+        """The interpreter to start runtime_host.py with for this environment."""
+        return os.path.join(self.path_for(key), 'bin', 'python')
+
+    @contextlib.contextmanager
+    def _lock(self, key, blocking=True):
+        """Exclusive lock on one environment, shared by every process using this store."""
+        with open(os.path.join(self.locks_dir, f"{key}.lock"), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_metadata(self, key):
+        try:
+            with open(os.path.join(self.path_for(key), METADATA_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # Missing, or a build that never finished
+
+    def _write_metadata(self, key, metadata):
+        path = os.path.join(self.path_for(key), METADATA_FILE)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path_for(key), prefix='.meta-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path)
+
+    def acquire(self, deployment_id, requirements):
+        """
+        Return the environment path for `requirements`, building it if no
+        deployment has needed it yet, and record `deployment_id` as a user.
+        """
+        key = requirements_hash(requirements)
+        with self._lock(key):
+            metadata = self._read_metadata(key)
+            if metadata is None:
+                self._build(key, requirements)
+                metadata = {
+                    'requirements': normalize_requirements(requirements),
+                    'refs': [],
+                    'created_at': time.time(),
+                    'size_bytes': _dir_size(self.path_for(key)),
+                }
+            else:
+                print(f"Reusing environment {key[:12]} for deployment {deployment_id}")
+            metadata['refs'] = sorted(set(metadata['refs']) | {str(deployment_id)})
+            metadata['last_used'] = time.time()
+            self._write_metadata(key, metadata)
+        return self.path_for(key)
+
+    def release(self, deployment_id, requirements):
+        """Drop a deployment's reference; the environment stays until garbage collected."""
+        key = requirements_hash(requirements)
+        with self._lock(key):
+            metadata = self._read_metadata(key)
+            if metadata is None:
+                return
+            metadata['refs'] = [ref for ref in metadata['refs'] if ref != str(deployment_id)]
+            metadata['last_used'] = time.time()
+            self._write_metadata(key, metadata)
+
+    def _build(self, key, requirements):
+        """Create the virtualenv and install the requirements into it."""
+        path = self.path_for(key)
+        shutil.rmtree(path, ignore_errors=True)  # Leftovers of an interrupted build
+        started = time.monotonic()
+        print(f"Building environment {key[:12]} in {path}")
+        venv.EnvBuilder(with_pip=False, symlinks=True).create(path)
+
+        normalized = normalize_requirements(requirements)
+        if normalized:
+            with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as req_file:
+                req_file.write(normalized + '\n')
+            command = [sys.executable, '-m', 'pip', '--python', self.python_for(key), 'install',
+                       '--no-input', '--disable-pip-version-check', '--no-cache-dir', '-r', req_file.name]
+            if self.find_links:
+                command[-2:-2] = ['--no-index', '--find-links', self.find_links]
+            try:
+                subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            except subprocess.CalledProcessError as e:
+                shutil.rmtree(path, ignore_errors=True)
+                raise RuntimeError(f"Installing requirements for environment {key[:12]} failed:\n{e.stdout}")
+            finally:
+                os.unlink(req_file.name)
+        print(f"Built environment {key[:12]} in {time.monotonic() - started:.1f}s")
+
+    def environments(self):
+        """Metadata of every complete environment, keyed by hash."""
+        envs = {}
+        for key in os.listdir(self.envs_dir):
+            metadata = self._read_metadata(key)
+            if metadata is not None:
+                envs[key] = metadata
+        return envs
+
+    def collect_garbage(self):
+        """
+        Remove unreferenced environments, least recently used first, until the
+        store is within its limits. Returns the removed hashes.
+        """
+        envs = self.environments()
+        total_bytes = sum(m.get('size_bytes', 0) for m in envs.values())
+        count = len(envs)
+        removed = []
+        candidates = sorted((m.get('last_used', 0), key) for key, m in envs.items() if not m['refs'])
+        for _, key in candidates:
+            if count <= self.max_envs and total_bytes <= self.max_bytes:
+                break
+            # Skip environments being acquired right now rather than wait for them
+            with self._lock(key, blocking=False) as locked:
+                if not locked:
+                    continue
+                metadata = self._read_metadata(key)
+                if metadata is None or metadata['refs']:
+                    continue
+                shutil.rmtree(self.path_for(key), ignore_errors=True)
+            count -= 1
+            total_bytes -= metadata.get('size_bytes', 0)
+            removed.append(key)
+            print(f"Removed environment {key[:12]} ({metadata.get('size_bytes', 0) // 1024} KiB)")
+        return removed
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('acquire', 'release', 'gc', 'list'):
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    store = EnvironmentStore()
+    command = sys.argv[1]
+    if command in ('acquire', 'release'):
+        deployment_id, requirements_path = sys.argv[2], sys.argv[3]
+        with open(requirements_path) as f:
+            requirements = f.read()
+        if command == 'acquire':
+            print(store.acquire(deployment_id, requirements))
+        else:
+            store.release(deployment_id, requirements)
+    elif command == 'gc':
+        store.collect_garbage()
+    else:
+        for key, metadata in sorted(store.environments().items(), key=lambda item: -item[1].get('last_used', 0)):
+            print(f"{key[:12]}  refs={len(metadata['refs'])}  {metadata.get('size_bytes', 0) // 1024} KiB  "
+                  f"{metadata['requirements'].replace(chr(10), ', ') or '(no requirements)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from runtime import agent
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the worker agent: accepts spawn/stop commands from the orchestrator, "
+        "starts and supervises runtime hosts on ports from a local free-list, and "
+        "reports them with their memory use in heartbeats. Runs on each worker; "
+        "it talks to the orchestrator over HTTP only, not to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=agent.AGENT_PORT, help='Control server port')
+        parser.add_argument('--hostname', default=agent.AGENT_HOSTNAME, help='Worker name registered with the orchestrator')
+        parser.add_argument('--ip-address', default=agent.AGENT_IP_ADDRESS,
+                            help='Address the gateway reaches this worker\'s instances on')
+        parser.add_argument('--port-range', default=agent.AGENT_PORT_RANGE, help='Instance ports, e.g. 20000-29999')
+        parser.add_argument('--orchestrator-url', default=agent.ORCHESTRATOR_URL,
+                            help='Where heartbeats, blobs and bytecode come from')
+        parser.add_argument('--zygote-socket', default=agent.zygote.ZYGOTE_SOCKET_PATH,
+                            help='Fork hosts from the zygote listening here, when it is running')
+
+    def handle(self, *args, **options):
+        if not options['orchestrator_url']:
+            self.stderr.write("No --orchestrator-url / ORCHESTRATOR_URL: heartbeats are disabled and "
+                              "only code blobs already cached locally can be started.")
+        worker_agent = agent.WorkerAgent(
+            hostname=options['hostname'],
+            ip_address=options['ip_address'],
+            agent_port=options['port'],
+            port_range=options['port_range'],
+            orchestrator_url=options['orchestrator_url'],
+            zygote_socket=options['zygote_socket'],
+        )
+        try:
+            agent.serve(worker_agent)
+        except KeyboardInterrupt:
+            self.stdout.write("Worker agent stopped; its runtime hosts were shut down.")
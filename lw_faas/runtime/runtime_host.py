@@ -4,57 +4,150 @@ AryaXAI FaaS Platform - Generic Runtime Host
 Executes a user's Python function in response to HTTP POST requests.
 """
 
+import asyncio
+import collections.abc
+import gc
 import importlib.util
+import inspect
+import marshal
 import os
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
 import signal
+import threading
+import time
+import urllib.error
+import urllib.request
 
 # Configuration from Environment Variables
 USER_FUNCTION_PATH = os.getenv('USER_FUNCTION_PATH')
+# Optional code object compiled at deploy time (orchestrator/compiler.py); used instead
+# of compiling USER_FUNCTION_PATH when it matches this interpreter's version
+USER_FUNCTION_BYTECODE_PATH = os.getenv('USER_FUNCTION_BYTECODE_PATH')
 FUNCTION_HANDLER_NAME = os.getenv('FUNCTION_HANDLER_NAME', 'handle')
 RUNTIME_HOST_PORT = int(os.getenv('RUNTIME_HOST_PORT', '8080'))
 INSTANCE_ID = os.getenv('INSTANCE_ID')  # Provided by the orchestrator
+ORCHESTRATOR_URL = os.getenv('ORCHESTRATOR_URL')  # e.g. http://orchestrator:8000
+# Maximum number of invocations this instance executes at the same time.
+# Requests beyond the limit are rejected with a 503 "busy" response.
+# 0 picks a default based on whether the handler is sync or async.
+RUNTIME_MAX_CONCURRENCY = int(os.getenv('RUNTIME_MAX_CONCURRENCY', '0'))
+DEFAULT_SYNC_CONCURRENCY = 4
+DEFAULT_ASYNC_CONCURRENCY = 256
+# Number of pre-forked worker processes sharing the listening socket (1 = no forking)
+RUNTIME_WORKERS = int(os.getenv('RUNTIME_WORKERS', '1'))
+# A child that dies sooner than this after being forked is restarted with a delay
+WORKER_RESTART_BACKOFF_SECONDS = 1.0
+# Set by whatever launched this host ('spawn' for a fresh interpreter, 'zygote'
+# for a fork of the zygote) and the epoch time of the launch request, used to
+# report cold-start duration to the orchestrator.
+RUNTIME_SPAWN_MODE = os.getenv('RUNTIME_SPAWN_MODE', 'spawn')
+RUNTIME_SPAWN_TIME = float(os.getenv('RUNTIME_SPAWN_TIME', '0')) or None
+# Idle keep-alive connections are closed after this many seconds. Keep it
+# above the gateway's pool idle timeout so the gateway closes first.
+RUNTIME_KEEPALIVE_TIMEOUT = float(os.getenv('RUNTIME_KEEPALIVE_TIMEOUT', '75'))
+# Marks responses streamed from a generator handler, for the gateway to relay as they arrive
+STREAM_HEADER = 'X-Function-Stream'
+NO_CHUNK = object()
 
 # Global reference to the loaded user function
 user_function = None
+# How the request body is handed to the handler, from its optional `input_format`
+# attribute ('json', 'text' or 'bytes'), and the Content-Type sent with bytes it
+# returns, from its optional `content_type` attribute.
+INPUT_FORMATS = ('json', 'text', 'bytes')
+user_input_format = 'json'
+user_output_content_type = 'application/octet-stream'
+# Where the handler's code object came from ('source' or 'bytecode') and how long it took
+user_code_source = None
+user_code_load_ms = None
+
+# Long-lived event loop that runs `async def` handlers, started on first use
+event_loop = None
+event_loop_lock = threading.Lock()
+
+
+class ConcurrencyLimitedHTTPServer(ThreadingHTTPServer):
+    """Thread-per-request server that caps the number of in-flight invocations."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_concurrency):
+        super().__init__(server_address, handler_class)
+        self.max_concurrency = max(1, max_concurrency)
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def split_slots(self, workers):
+        """
+        Give this pre-forked child its share of the limit. Each child counts its
+        own slots, so one that is killed mid-request takes its held slots with it
+        instead of leaking them from a semaphore the others share.
+        """
+        self.slots = threading.BoundedSemaphore(max(1, self.max_concurrency // workers))
 
 
 class FunctionRequestHandler(BaseHTTPRequestHandler):
     """HTTP Handler that passes the request body to the user's function."""
+    # HTTP/1.1 keeps connections open between requests so the gateway can reuse them.
+    # Every response must therefore carry a Content-Length (or close the connection).
+    protocol_version = 'HTTP/1.1'
+    timeout = RUNTIME_KEEPALIVE_TIMEOUT
 
     def do_POST(self):
         """Handle POST requests to execute the function."""
-        if self.path != '/':
-            self.send_error(404, "Endpoint not found. Use POST '/'.")
+        if self.path not in ('/', '/batch'):
+            self.send_error(404, "Endpoint not found. Use POST '/' or '/batch'.")
+            return
+
+        # Reject immediately instead of queueing when every slot is taken,
+        # so the gateway can route the request elsewhere.
+        if not self.server.slots.acquire(False):
+            self.send_busy()
             return
+        try:
+            if self.path == '/batch':
+                self.execute_batch()
+            else:
+                self.execute_function()
+        finally:
+            self.server.slots.release()
 
+    def execute_function(self):
+        """Run the user's function for the current request."""
         # 1. Read the request body
         content_length = int(self.headers.get('Content-Length', 0))
-        request_body = self.rfile.read(content_length).decode('utf-8')
+        request_body = self.rfile.read(content_length)
 
         # 2. Prepare a context object (optional but useful for the function)
         context = {
             'request_id': self.headers.get('X-Request-ID'),
             'instance_id': INSTANCE_ID,
+            'content_type': self.headers.get('Content-Type'),
         }
 
         # 3. Call the user's function with the request body
         try:
-            # Parse JSON if possible, else pass raw string
-            try:
-                parsed_body = json.loads(request_body) if request_body else {}
-            except json.JSONDecodeError:
-                parsed_body = request_body
+            # Decode only as far as the handler declares it needs
+            parsed_body = decode_body(request_body, user_input_format)
 
             # This is the crucial execution line
-            result = user_function(parsed_body, context)
+            result = call_user_function(parsed_body, context)
+
+            # Generator handlers stream their output as it is produced
+            if is_stream(result):
+                self.send_stream(result)
+                return
 
-            # 4. Format the successful response
-            response_body = json.dumps(result).encode('utf-8')
+            # 4. Format the successful response; bytes are sent as they are
+            if isinstance(result, (bytes, bytearray, memoryview)):
+                response_body = bytes(result)
+                content_type = user_output_content_type
+            else:
+                response_body = json.dumps(result).encode('utf-8')
+                content_type = 'application/json'
             self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Type', content_type)
             self.send_header('Content-Length', str(len(response_body)))
             self.end_headers()
             self.wfile.write(response_body)
@@ -75,17 +168,290 @@ class FunctionRequestHandler(BaseHTTPRequestHandler):
             # Log the error for debugging
             print(f"ERROR: User function raised an exception: {e}", file=sys.stderr)
 
+    def execute_batch(self):
+        """
+        Run the user's function once per item of a {"items": [...], "request_ids": [...]}
+        body. Each item gets its own status code and result or error, so one failing
+        item doesn't fail the batch.
+        """
+        content_length = int(self.headers.get('Content-Length', 0))
+        request_body = self.rfile.read(content_length).decode('utf-8')
+        try:
+            batch = json.loads(request_body)
+            items = batch['items']
+            if not isinstance(items, list):
+                raise TypeError("'items' must be a list")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": "Invalid batch", "message": str(e)})
+            return
+
+        request_ids = batch.get('request_ids') or []
+        contexts = [
+            {
+                'request_id': request_ids[i] if i < len(request_ids) else self.headers.get('X-Request-ID'),
+                'instance_id': INSTANCE_ID,
+            }
+            for i in range(len(items))
+        ]
+        results = run_batch(items, contexts)
+        try:
+            self.send_json(200, {"results": results})
+        except (TypeError, ValueError):
+            # Only report the items whose results can't be serialized as failed
+            self.send_json(200, {"results": [
+                result if is_json_serializable(result) else
+                item_error(TypeError("Function result is not JSON serializable"))
+                for result in results
+            ]})
+
+    def send_stream(self, result):
+        """
+        Send a generator handler's output with chunked transfer encoding, one
+        chunk per yielded value. bytes/str values are sent as they are, anything
+        else as NDJSON lines. If the handler fails midway, the error is sent as a
+        last NDJSON line and the body is left unterminated so the caller can tell.
+        """
+        chunks = iterate_chunks(result)
+        first = next(chunks, NO_CHUNK)  # Errors before the first chunk still get a 500
+        raw = isinstance(first, (bytes, str))
+        if isinstance(first, str):
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            content_type = 'application/octet-stream' if raw else 'application/x-ndjson'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header(STREAM_HEADER, '1')
+        self.end_headers()
+        try:
+            chunk = first
+            while chunk is not NO_CHUNK:
+                data = encode_chunk(chunk, raw)
+                try:
+                    self.write_chunk(data)
+                except OSError:
+                    # The caller went away; the handler's own OSErrors are failures like any other
+                    self.close_connection = True
+                    return
+                chunk = next(chunks, NO_CHUNK)
+        except Exception as e:
+            print(f"ERROR: User function raised an exception while streaming: {e}", file=sys.stderr)
+            if not raw:
+                self.write_chunk(encode_chunk({
+                    "error": "Function execution failed",
+                    "message": str(e),
+                    "type": e.__class__.__name__
+                }, raw))
+            self.close_connection = True
+            return
+        finally:
+            chunks.close()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        if data:  # An empty chunk would end the body
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b'\r\n')
+
+    def send_json(self, status_code, data):
+        response_body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def send_busy(self):
+        """Tell the caller this instance is at its concurrency limit."""
+        busy_response = {
+            "error": "Instance busy",
+            "max_concurrency": self.server.max_concurrency,
+        }
+        response_body = json.dumps(busy_response).encode('utf-8')
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.send_header('Retry-After', '1')
+        self.send_header('X-Instance-Busy', '1')
+        # The request body was not read, so this connection can't be reused.
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(response_body)
+
     def log_message(self, format, *args):
         # Suppress the default HTTP server log for cleaner output
         # You could send this to a structured logger in a real implementation
         pass
 
 
-def load_user_function(module_path, function_name):
+def get_event_loop():
+    """Return the shared event loop, starting its thread on first use."""
+    global event_loop
+
+    with event_loop_lock:
+        if event_loop is None:
+            event_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=event_loop.run_forever, name='runtime-event-loop', daemon=True)
+            thread.start()
+    return event_loop
+
+
+async def _await_result(awaitable):
+    return await awaitable
+
+
+def call_user_function(parsed_body, context):
+    """
+    Invoke the user's function. Coroutines returned by `async def` handlers
+    are scheduled on the shared event loop, so many awaiting invocations
+    interleave on one loop while each request thread waits for its own result.
+    """
+    result = user_function(parsed_body, context)
+    if inspect.isawaitable(result):
+        future = asyncio.run_coroutine_threadsafe(_await_result(result), get_event_loop())
+        result = future.result()
+    return result
+
+
+def decode_body(raw, input_format):
+    """
+    The handler's view of a request body: unchanged bytes, UTF-8 text, or (the
+    default) parsed JSON that falls back to the text when it isn't JSON.
+    """
+    if input_format == 'bytes':
+        return raw
+    if input_format == 'text':
+        return raw.decode('utf-8')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)  # Accepts bytes, so valid JSON is not decoded separately first
+    except ValueError:
+        return raw.decode('utf-8')
+
+
+def item_error(e):
+    """Per-item result for a batch item whose invocation raised."""
+    print(f"ERROR: User function raised an exception: {e}", file=sys.stderr)
+    return {
+        "status_code": 500,
+        "body": {"error": "Function execution failed", "message": str(e), "type": e.__class__.__name__},
+    }
+
+
+def is_json_serializable(value):
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+async def _run_async_batch(items, contexts):
+    async def run_item(item, context):
+        try:
+            result = user_function(item, context)
+            if inspect.isasyncgen(result):
+                result = [chunk async for chunk in result]
+            else:
+                result = await result
+            return {"status_code": 200, "body": result}
+        except Exception as e:
+            return item_error(e)
+
+    return await asyncio.gather(*(run_item(item, context) for item, context in zip(items, contexts)))
+
+
+def run_batch(items, contexts):
+    """
+    Invoke the user's function for every item. Sync handlers run the items in
+    order on the request thread; `async def` handlers run them concurrently on
+    the shared event loop.
+    """
+    if is_async_handler(user_function):
+        future = asyncio.run_coroutine_threadsafe(_run_async_batch(items, contexts), get_event_loop())
+        return future.result()
+
+    results = []
+    for item, context in zip(items, contexts):
+        try:
+            result = call_user_function(item, context)
+            if is_stream(result):
+                result = list(iterate_chunks(result))
+            results.append({"status_code": 200, "body": result})
+        except Exception as e:
+            results.append(item_error(e))
+    return results
+
+
+def is_stream(result):
+    """True for results a handler produces incrementally: generators and other iterators."""
+    return isinstance(result, collections.abc.Iterator) or inspect.isasyncgen(result)
+
+
+def _iterate_async(agen):
+    loop = get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(_await_result(agen.__anext__()), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+def iterate_chunks(result):
+    """A generator over a streaming result; async generators are driven on the shared event loop."""
+    if inspect.isasyncgen(result):
+        return _iterate_async(result)
+    return (chunk for chunk in result)
+
+
+def encode_chunk(chunk, raw):
+    if raw:
+        return chunk.encode('utf-8') if isinstance(chunk, str) else bytes(chunk)
+    return json.dumps(chunk).encode('utf-8') + b'\n'
+
+
+def is_async_handler(func):
+    """True if the handler is an `async def` function or async generator (or such a callable object)."""
+    return any(inspect.iscoroutinefunction(f) or inspect.isasyncgenfunction(f)
+               for f in (func, getattr(func, '__call__', None)))
+
+
+def resolve_max_concurrency():
+    """Concurrency limit from the environment, or a default for the handler type."""
+    if RUNTIME_MAX_CONCURRENCY > 0:
+        return RUNTIME_MAX_CONCURRENCY
+    if is_async_handler(user_function):
+        return DEFAULT_ASYNC_CONCURRENCY
+    return DEFAULT_SYNC_CONCURRENCY
+
+
+def read_bytecode(bytecode_path):
+    """
+    Code object from a file compiled at deploy time (orchestrator/compiler.py),
+    or None if it can't be used here, e.g. because it is from another Python version.
+    """
+    try:
+        with open(bytecode_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        print(f"WARNING: Could not read bytecode {bytecode_path}: {e}; compiling source instead.", file=sys.stderr)
+        return None
+    if data[:4] != importlib.util.MAGIC_NUMBER:
+        print(f"WARNING: Bytecode {bytecode_path} is for another Python version; compiling source instead.",
+              file=sys.stderr)
+        return None
+    return marshal.loads(data[4:])
+
+
+def load_user_function(module_path, function_name, bytecode_path=None):
     """
-    Dynamically load a Python function from a specified file.
+    Dynamically load a Python function from a specified file, using the
+    deploy-time compiled code at `bytecode_path` when it is given and usable.
     """
-    global user_function
+    global user_function, user_input_format, user_output_content_type, user_code_source, user_code_load_ms
 
     if not os.path.exists(module_path):
         raise FileNotFoundError(f"Function code not found at path: {module_path}")
@@ -99,9 +465,17 @@ def load_user_function(module_path, function_name):
         raise ImportError(f"Could not load spec from file: {module_path}")
     module = importlib.util.module_from_spec(spec)
 
+    # Get the module's code object, timing it so the saving from bytecode can be reported
+    started = time.perf_counter()
+    code = read_bytecode(bytecode_path) if bytecode_path else None
+    user_code_source = 'bytecode' if code is not None else 'source'
+    if code is None:
+        code = spec.loader.get_code(module_name)  # Raises SyntaxError for bad source
+    user_code_load_ms = round((time.perf_counter() - started) * 1000, 3)
+
     # Execute the module to load its functions and variables
     try:
-        spec.loader.exec_module(module)
+        exec(code, module.__dict__)
     except Exception as e:
         raise ImportError(f"Failed to execute module {module_path}: {e}")
 
@@ -112,17 +486,139 @@ def load_user_function(module_path, function_name):
     if not callable(user_function):
         raise TypeError(f"'{function_name}' in {module_path} is not a callable function.")
 
-    print(f"Successfully loaded function '{function_name}' from {module_path}")
+    user_input_format = getattr(user_function, 'input_format', 'json')
+    if user_input_format not in INPUT_FORMATS:
+        raise ValueError(f"'{function_name}'.input_format must be one of {', '.join(INPUT_FORMATS)}")
+    user_output_content_type = getattr(user_function, 'content_type', 'application/octet-stream')
+
+    kind = 'async' if is_async_handler(user_function) else 'sync'
+    print(f"Successfully loaded {kind} function '{function_name}' from {module_path} "
+          f"(input: {user_input_format}, code from {user_code_source} in {user_code_load_ms} ms)")
     return user_function
 
 
+def notify_ready(port, max_concurrency):
+    """
+    Register this instance with the orchestrator's /api/runtime/instance_ready/ endpoint.
+    Falls back to printing the readiness line when no orchestrator URL is configured.
+    Returns False if the orchestrator no longer wants this instance (409).
+    """
+    if not INSTANCE_ID:
+        return True
+
+    startup_ms = None
+    if RUNTIME_SPAWN_TIME:
+        startup_ms = round((time.time() - RUNTIME_SPAWN_TIME) * 1000, 2)
+
+    print(f"INSTANCE_READY: ID={INSTANCE_ID}, PORT={port}, MAX_CONCURRENCY={max_concurrency}, "
+          f"SPAWN_MODE={RUNTIME_SPAWN_MODE}, STARTUP_MS={startup_ms}, "
+          f"CODE_SOURCE={user_code_source}, CODE_LOAD_MS={user_code_load_ms}")
+    if not ORCHESTRATOR_URL:
+        return True
+
+    payload = json.dumps({
+        'instance_id': INSTANCE_ID,
+        'port': port,
+        'max_concurrency': max_concurrency,
+        'spawn_mode': RUNTIME_SPAWN_MODE,
+        'startup_ms': startup_ms,
+        'code_source': user_code_source,
+        'code_load_ms': user_code_load_ms,
+        'cache_tag': sys.implementation.cache_tag,
+    }).encode('utf-8')
+    req = urllib.request.Request(
+        f"{ORCHESTRATOR_URL.rstrip('/')}/api/runtime/instance_ready/",
+        data=payload,
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            resp.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 409:
+            print("Orchestrator reports this instance is no longer live.", file=sys.stderr)
+            return False
+        print(f"WARNING: Failed to register with orchestrator: {e}", file=sys.stderr)
+    except Exception as e:
+        print(f"WARNING: Failed to register with orchestrator: {e}", file=sys.stderr)
+    return True
+
+
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully."""
     print(f"\nReceived signal {signum}. Shutting down runtime host.")
     sys.exit(0)
 
 
-if __name__ == '__main__':
+def worker_signal_handler(signum, frame):
+    """Pre-forked children exit quietly; the parent reports the shutdown."""
+    sys.exit(0)
+
+
+def fork_worker(httpd, workers):
+    """Fork one child that serves requests on the inherited listening socket."""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, worker_signal_handler)
+        signal.signal(signal.SIGTERM, worker_signal_handler)
+        httpd.split_slots(workers)
+        exit_code = 0
+        try:
+            httpd.serve_forever()
+        except SystemExit:
+            pass
+        except BaseException as e:
+            print(f"ERROR: Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+
+def run_prefork(httpd, workers):
+    """
+    Serve with `workers` forked children sharing the already-bound socket.
+
+    The user module is imported once in this parent before forking, so its
+    pages are shared copy-on-write by every child. The parent only supervises:
+    it restarts children that exit and terminates them all on shutdown.
+    """
+    # Move everything imported so far out of the GC's generations, so
+    # collections in the children don't touch (and un-share) those pages.
+    gc.freeze()
+
+    children = {}  # pid -> fork time
+    try:
+        for _ in range(workers):
+            children[fork_worker(httpd, workers)] = time.monotonic()
+        print(f"Pre-forked {workers} workers: {sorted(children)}")
+
+        while True:
+            pid, wait_status = os.wait()
+            started_at = children.pop(pid, None)
+            if started_at is None:
+                continue
+            print(f"WARNING: Worker {pid} exited with status {os.waitstatus_to_exitcode(wait_status)}; restarting.",
+                  file=sys.stderr)
+            if time.monotonic() - started_at < WORKER_RESTART_BACKOFF_SECONDS:
+                time.sleep(WORKER_RESTART_BACKOFF_SECONDS)
+            children[fork_worker(httpd, workers)] = time.monotonic()
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+def main():
+    """Load the user's function and serve it until shut down."""
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -138,25 +634,38 @@ if __name__ == '__main__':
 
     try:
         # Load the user's function. This will crash if it fails, which is intended.
-        load_user_function(USER_FUNCTION_PATH, FUNCTION_HANDLER_NAME)
+        load_user_function(USER_FUNCTION_PATH, FUNCTION_HANDLER_NAME, USER_FUNCTION_BYTECODE_PATH)
     except Exception as e:
         print(f"FATAL: Failed to load user function: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Start the HTTP server
-    httpd = HTTPServer(('', RUNTIME_HOST_PORT), FunctionRequestHandler)
-    print(f"Server started. Listening on port {RUNTIME_HOST_PORT}. Ready to execute requests.")
+    # Start the HTTP server. In pre-fork mode the socket is bound here and
+    # inherited by every child, and the concurrency limit is split between them.
+    workers = max(1, RUNTIME_WORKERS)
+    httpd = ConcurrencyLimitedHTTPServer(('', RUNTIME_HOST_PORT), FunctionRequestHandler,
+                                         resolve_max_concurrency() * workers)
+    print(f"Server started. Listening on port {RUNTIME_HOST_PORT} "
+          f"({workers} worker(s), max concurrency {httpd.max_concurrency}). Ready to execute requests.")
 
-    # Notify the orchestrator that we are ready (this would be a network call in a real system)
-    # For the PoC, we just print it.
-    if INSTANCE_ID:
-        print(f"INSTANCE_READY: ID={INSTANCE_ID}, PORT={RUNTIME_HOST_PORT}")
+    # Notify the orchestrator that we are ready; connections queue in the
+    # listen backlog until the workers start accepting.
+    if not notify_ready(RUNTIME_HOST_PORT, httpd.max_concurrency):
+        # Terminated while starting up; the agent forgets hosts that exit
+        httpd.server_close()
+        sys.exit(0)
 
     try:
         # Serve requests forever until interrupted
-        httpd.serve_forever()
+        if workers > 1:
+            run_prefork(httpd, workers)
+        else:
+            httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
         httpd.server_close()
-        print("Runtime host stopped.")
\ No newline at end of file
+        print("Runtime host stopped.")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
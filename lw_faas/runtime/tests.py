@@ -1,3 +1,375 @@
-from django.test import TestCase
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from packaging.requirements import Requirement
+from rest_framework.test import APIClient
+
+from orchestrator.models import FunctionInstance
+from orchestrator.tests import make_deployment, make_worker
+
+from runtime import runtime_host, zygote
+from runtime.agent import ManagedInstance, WorkerAgent
+from runtime.blobcache import BlobCache
+from runtime.envstore import EnvironmentStore, normalize_requirements, requirements_hash
+
+RUNTIME_HOST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runtime_host.py')
+ZYGOTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zygote.py')
+
+SLEEPY_HANDLER = """
+import time
+
+def handle(body, context):
+    time.sleep(body.get('sleep', 0))
+    return {'ok': True}
+"""
+
+ASYNC_HANDLER = """
+import asyncio
+
+async def handle(body, context):
+    await asyncio.sleep(body.get('sleep', 0))
+    return {'ok': True}
+"""
+
+ASYNC_GENERATOR_HANDLER = """
+import asyncio
+
+async def handle(body, context):
+    for n in range(body.get('count', 3)):
+        await asyncio.sleep(0)
+        yield {'n': n}
+"""
+
+FAILING_STREAM_HANDLER = """
+def handle(body, context):
+    yield {'n': 0}
+    open('/nonexistent/input.csv')
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def children_of(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return {int(p) for p in f.read().split()}
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting")
+        time.sleep(0.05)
+
+
+def start_runtime_host(testcase, code, **env):
+    """Serve `code` with runtime_host.py on a free port until `testcase` ends. Returns (process, port)."""
+    tmp = tempfile.TemporaryDirectory()
+    testcase.addCleanup(tmp.cleanup)
+    code_path = os.path.join(tmp.name, 'handler.py')
+    with open(code_path, 'w') as f:
+        f.write(code)
+    port = free_port()
+    env = dict(os.environ, USER_FUNCTION_PATH=code_path, RUNTIME_HOST_PORT=str(port),
+               **{k: str(v) for k, v in env.items()})
+    env.pop('INSTANCE_ID', None)
+    host = subprocess.Popen([sys.executable, RUNTIME_HOST], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop():
+        host.send_signal(signal.SIGTERM)
+        host.wait(10)
+    testcase.addCleanup(stop)
+    wait_for(lambda: serving(port))
+    return host, port
+
+
+def post(port, body, path='/', timeout=10):
+    """POST `body` as JSON to a runtime host; returns (status, headers, body)."""
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=json.dumps(body).encode(),
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def post_concurrently(port, bodies, **kwargs):
+    """post() every body at once; returns the (status, headers, body) replies in order."""
+    replies = [None] * len(bodies)
+
+    def send(i):
+        replies[i] = post(port, bodies[i], **kwargs)
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return replies
+
+
+def serving(port):
+    """True once something answers HTTP on `port` (runtime hosts have no GET route, so errors count)."""
+    try:
+        urllib.request.urlopen(urllib.request.Request(f'http://127.0.0.1:{port}/status'), timeout=1)
+    except urllib.error.HTTPError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class ConcurrencyLimitTests(SimpleTestCase):
+    def test_requests_run_concurrently_up_to_the_limit(self):
+        _, port = start_runtime_host(self, SLEEPY_HANDLER, RUNTIME_MAX_CONCURRENCY=3)
+        started = time.monotonic()
+        replies = post_concurrently(port, [{'sleep': 0.5}] * 3)
+        self.assertEqual([status for status, _, _ in replies], [200] * 3)
+        self.assertLess(time.monotonic() - started, 1.2)  # Not one after another
+
+    def test_requests_beyond_the_limit_are_rejected_as_busy(self):
+        _, port = start_runtime_host(self, SLEEPY_HANDLER, RUNTIME_MAX_CONCURRENCY=2)
+        holders = [threading.Thread(target=post, args=(port, {'sleep': 1})) for _ in range(2)]
+        for holder in holders:
+            holder.start()
+        time.sleep(0.3)
+        status, headers, body = post(port, {})
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['X-Instance-Busy'], '1')
+        self.assertEqual(json.loads(body)['max_concurrency'], 2)
+        for holder in holders:
+            holder.join()
+        self.assertEqual(post(port, {})[0], 200)  # Slots given back
+
+
+class AsyncHandlerTests(SimpleTestCase):
+    def test_awaiting_invocations_interleave_on_one_loop(self):
+        _, port = start_runtime_host(self, ASYNC_HANDLER)  # Default limit for async handlers
+        started = time.monotonic()
+        replies = post_concurrently(port, [{'sleep': 0.5}] * 40)
+        self.assertEqual([status for status, _, _ in replies], [200] * 40)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_concurrency_default_follows_the_handler_type(self):
+        async def coroutine(body, context):
+            return body
+
+        async def agen(body, context):
+            yield body
+
+        def sync(body, context):
+            return body
+        with mock.patch.object(runtime_host, 'RUNTIME_MAX_CONCURRENCY', 0):
+            for handler, expected in ((coroutine, runtime_host.DEFAULT_ASYNC_CONCURRENCY),
+                                      (agen, runtime_host.DEFAULT_ASYNC_CONCURRENCY),
+                                      (sync, runtime_host.DEFAULT_SYNC_CONCURRENCY)):
+                with mock.patch.object(runtime_host, 'user_function', handler):
+                    self.assertEqual(runtime_host.resolve_max_concurrency(), expected, handler)
+
+    def test_async_generator_handler_streams_and_batches(self):
+        _, port = start_runtime_host(self, ASYNC_GENERATOR_HANDLER)
+        status, headers, body = post(port, {'count': 2})
+        self.assertEqual((status, headers[runtime_host.STREAM_HEADER]), (200, '1'))
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{'n': 0}, {'n': 1}])
+        status, _, body = post(port, {'items': [{'count': 1}, {'count': 2}]}, path='/batch')
+        self.assertEqual(json.loads(body)['results'], [{'status_code': 200, 'body': [{'n': 0}]},
+                                                        {'status_code': 200, 'body': [{'n': 0}, {'n': 1}]}])
+
+
+class StreamingTests(SimpleTestCase):
+    def test_handler_os_error_midway_is_reported(self):
+        _, port = start_runtime_host(self, FAILING_STREAM_HANDLER)
+        with socket.create_connection(('127.0.0.1', port), timeout=10) as conn:
+            conn.sendall(b'POST / HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n\r\n{}')
+            response = b''
+            while chunk := conn.recv(65536):  # The connection is closed after a failed stream
+                response += chunk
+        self.assertIn(b'{"n": 0}', response)
+        self.assertIn(b'"type": "FileNotFoundError"', response)
+        self.assertFalse(response.endswith(b'0\r\n\r\n'))  # Left unterminated
+
+
+class ZygoteTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.socket_path = os.path.join(self.dir, 'zygote.sock')
+        env = dict(os.environ, ZYGOTE_SOCKET_PATH=self.socket_path, ZYGOTE_PRELOAD_MODULES='decimal')
+        env.pop('ORCHESTRATOR_URL', None)
+        zygote_process = subprocess.Popen([sys.executable, ZYGOTE], env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        def stop():
+            zygote_process.send_signal(signal.SIGTERM)
+            zygote_process.wait(10)
+        self.addCleanup(stop)
+        self.zygote = zygote_process
+        wait_for(lambda: os.path.exists(self.socket_path))
+
+    def test_forked_host_serves_the_function(self):
+        code_path = os.path.join(self.dir, 'handler.py')
+        with open(code_path, 'w') as f:
+            f.write(SLEEPY_HANDLER)
+        port = free_port()
+        reply = zygote.request_spawn(None, code_path, port, socket_path=self.socket_path)
+        self.addCleanup(os.kill, reply['pid'], signal.SIGTERM)
+
+        self.assertIn(reply['pid'], children_of(self.zygote.pid))  # Forked, not a new interpreter
+        wait_for(lambda: serving(port))
+        status, _, body = post(port, {})
+        self.assertEqual((status, json.loads(body)), (200, {'ok': True}))
+
+    def test_bad_spawn_request_is_refused(self):
+        with self.assertRaises(RuntimeError):
+            zygote.request_spawn(None, '', free_port(), socket_path=self.socket_path)
+
+
+class PreforkTests(SimpleTestCase):
+    def setUp(self):
+        self.host, self.port = start_runtime_host(self, SLEEPY_HANDLER, RUNTIME_WORKERS=2, RUNTIME_MAX_CONCURRENCY=2)
+        wait_for(lambda: len(children_of(self.host.pid)) == 2)
+
+    def invoke(self, body, timeout=10):
+        req = urllib.request.Request(f'http://127.0.0.1:{self.port}/', data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return None
+
+    def test_killed_children_do_not_leak_slots(self):
+        wait_for(lambda: self.invoke({}) == 200)
+        # Hold every slot of both children, then kill them mid-request
+        for _ in range(6):
+            threading.Thread(target=self.invoke, args=({'sleep': 30}, 2), daemon=True).start()
+        time.sleep(0.5)
+        killed = children_of(self.host.pid)
+        for pid in killed:
+            os.kill(pid, signal.SIGKILL)
+        wait_for(lambda: len(children_of(self.host.pid) - killed) == 2)
+
+        self.assertEqual([self.invoke({}) for _ in range(3)], [200, 200, 200])
+
+
+class RequirementsNormalizationTests(SimpleTestCase):
+    def test_equivalent_files_hash_the_same(self):
+        self.assertEqual(requirements_hash('Foo_Bar >=1, <2  # pinned\n\nrequests\n'),
+                         requirements_hash('requests\nfoo-bar<2,>=1\n'))
+
+    def test_markers_keep_their_whitespace(self):
+        text = ('foo; python_version >= "3.8" and sys_platform == "linux"\n'
+                'bar @ https://example.com/bar.whl ; os_name == "posix"\n'
+                'baz[b, a] >=1 ; extra in "x y"\n')
+        lines = normalize_requirements(text).splitlines()
+        self.assertIn('foo; python_version >= "3.8" and sys_platform == "linux"', lines)
+        for line in lines:
+            Requirement(line)  # What pip parses
+        self.assertNotEqual(requirements_hash('foo; extra in "a b"'), requirements_hash('foo; extra in "ab"'))
+
+
+class BlobCacheTests(SimpleTestCase):
+    def test_cached_reports_only_blobs(self):
+        with tempfile.TemporaryDirectory() as root:
+            digest = 'ab' + '0' * 62
+            paths = [os.path.join('ab', f'{digest}.py'), os.path.join('ab', '.fetch-x1y2'),
+                     os.path.join('bytecode', 'a3c1e0f2-5b6d-4e7f-8a9b-0c1d2e3f4a5b.cpython-311.pyc'),
+                     os.path.join('cd', f'{digest}')]  # Under the wrong prefix
+            for path in paths:
+                os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+                open(os.path.join(root, path), 'w').close()
+            self.assertEqual(BlobCache(root=root).cached(), {digest})
+
+
+def make_wheel(directory, name, version='1.0'):
+    """Write a pure-Python wheel for a package `name` whose module sets VERSION."""
+    dist_info = f'{name}-{version}.dist-info'
+    files = {
+        f'{name}/__init__.py': f'VERSION = {version!r}\n',
+        f'{dist_info}/METADATA': f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n',
+        f'{dist_info}/WHEEL': 'Wheel-Version: 1.0\nGenerator: tests\nRoot-Is-Purelib: true\nTag: py3-none-any\n',
+    }
+    files[f'{dist_info}/RECORD'] = ''.join(f'{path},,\n' for path in [*files, f'{dist_info}/RECORD'])
+    with zipfile.ZipFile(os.path.join(directory, f'{name}-{version}-py3-none-any.whl'), 'w') as wheel:
+        for path, content in files.items():
+            wheel.writestr(path, content)
+
+
+class EnvironmentGarbageCollectionTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        wheels = os.path.join(tmp.name, 'wheels')
+        os.makedirs(wheels)
+        for name in ('lwdemo', 'lwother'):
+            make_wheel(wheels, name)
+        self.store = EnvironmentStore(root=os.path.join(tmp.name, 'envs'), find_links=wheels, max_envs=1)
+        self.agent = WorkerAgent(blob_cache=BlobCache(root=os.path.join(tmp.name, 'blobs')), env_store=self.store)
+
+    def start(self, deployment_id, requirements):
+        """What WorkerAgent._start records for an instance that uses an environment."""
+        path = self.store.acquire(deployment_id, requirements)
+        instance = ManagedInstance(f'i-{deployment_id}', deployment_id, requirements, self.agent.ports.allocate())
+        self.agent.instances[instance.instance_id] = instance
+        self.agent._env_users[deployment_id] += 1
+        return instance, path
+
+    def test_environment_released_by_the_agent_is_removed(self):
+        with mock.patch('sys.stdout', io.StringIO()):
+            demo, demo_path = self.start('d1', 'lwdemo==1.0')
+            other, other_path = self.start('d2', 'lwother==1.0')
+            installed = subprocess.run([self.store.python_for(requirements_hash('lwdemo==1.0')), '-c',
+                                        'import lwdemo; print(lwdemo.VERSION)'], capture_output=True, text=True)
+            self.assertEqual(installed.stdout.strip(), '1.0', installed.stderr)
+
+            self.assertEqual(self.agent.collect_env_garbage(), [])  # Over the limit, but both are in use
+            self.agent._discard(demo)
+            self.assertEqual(self.agent.collect_env_garbage(), [requirements_hash('lwdemo==1.0')])
+        self.assertFalse(os.path.exists(demo_path))
+        self.assertTrue(os.path.exists(other_path))
+        self.assertEqual(self.agent.collect_env_garbage(), [])  # Nothing released since
+
+
+class InstanceReadyTests(TestCase):
+    def setUp(self):
+        self.instance = FunctionInstance.objects.create(deployment=make_deployment('ready'), worker=make_worker(),
+                                                        memory_mb=128, status='PENDING')
+
+    def register(self):
+        return APIClient().post('/api/runtime/instance_ready/', {'instance_id': str(self.instance.pk), 'port': 20001,
+                                                                 'max_concurrency': 4}, format='json')
+
+    def test_pending_instance_becomes_running(self):
+        self.assertEqual(self.register().status_code, 200)
+        self.instance.refresh_from_db()
+        self.assertEqual((self.instance.status, self.instance.port, self.instance.max_concurrency),
+                         ('RUNNING', 20001, 4))
+        self.assertIsNotNone(self.instance.ready_at)
+
+    def test_late_host_does_not_revive_a_retired_instance(self):
+        for retired in ('TERMINATED', 'ERROR'):
+            FunctionInstance.objects.filter(pk=self.instance.pk).update(status=retired, port=None, memory_mb=0)
+            self.assertEqual(self.register().status_code, 409)
+            self.instance.refresh_from_db()
+            self.assertEqual((self.instance.status, self.instance.port, self.instance.ready_at), (retired, None, None))
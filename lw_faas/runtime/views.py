@@ -3,7 +3,13 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 import uuid
-from orchestrator.models import WorkerNode, FunctionInstance
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from orchestrator.liveness import worker_registry
+from orchestrator.models import CompiledCode, FunctionInstance
+from orchestrator.provisioning import LIVE_STATUSES, reconcile_worker
+from orchestrator.scheduler import update_worker_cache
 
 class WorkerHeartbeatView(APIView):
     """
@@ -14,22 +20,36 @@ class WorkerHeartbeatView(APIView):
     permission_classes = []
 
     def post(self, request):
-        # Expecting: { "hostname": "worker-1", "ip_address": "192.168.1.10", "max_memory_mb": 8192, "available_memory_mb": 4096 }
+        # Expecting: { "hostname": "worker-1", "ip_address": "192.168.1.10", "max_memory_mb": 8192, "available_memory_mb": 4096,
+        #              "cached_envs": ["<requirements hash>", ...], "cached_code": ["<blob sha256>", ...],
+        #              "agent_port": 7070, "instances": [{"instance_id": "uuid", "rss_mb": 41.5, ...}, ...] }
         hostname = request.data.get('hostname')
         if not hostname:
             raise ValidationError("Missing 'hostname'.")
 
-        worker, created = WorkerNode.objects.update_or_create(
-            hostname=hostname,
-            defaults={
-                'ip_address': request.data.get('ip_address'),
-                'max_memory_mb': request.data.get('max_memory_mb', 0),
-                'available_memory_mb': request.data.get('available_memory_mb', 0),
-                'status': 'ONLINE'
-            }
+        # Kept in memory; the database is written only on changes and once per flush interval
+        worker = worker_registry.heartbeat(
+            hostname,
+            ip_address=request.data.get('ip_address'),
+            agent_port=request.data.get('agent_port'),
+            max_memory_mb=request.data.get('max_memory_mb'),
+            available_memory_mb=request.data.get('available_memory_mb'),
         )
-        # Update the 'last_heartbeat' field is handled by the model's `auto_now=True`
-        return Response({"worker_id": str(worker.id)}, status=status.HTTP_200_OK)
+        # What the worker has on disk, for placement affinity; omitted when unchanged
+        for kind, field in (('env', 'cached_envs'), ('code', 'cached_code')):
+            digests = request.data.get(field)
+            if digests is not None:
+                if not isinstance(digests, list):
+                    raise ValidationError(f"'{field}' must be a list.")
+                update_worker_cache(worker.pk, kind, digests)
+        reply = {"worker_id": str(worker.id)}
+        # Worker agents (runtime/agent.py) report their instances and stop the ones we don't expect
+        reported = request.data.get('instances')
+        if reported is not None:
+            if not isinstance(reported, list):
+                raise ValidationError("'instances' must be a list.")
+            reply['stop'] = reconcile_worker(worker, reported)
+        return Response(reply, status=status.HTTP_200_OK)
 
 class InstanceReadyView(APIView):
     """
@@ -40,18 +60,70 @@ class InstanceReadyView(APIView):
     permission_classes = []
 
     def post(self, request):
-        # Expecting: { "instance_id": "uuid", "port": 8080 }
+        # Expecting: { "instance_id": "uuid", "port": 8080, "max_concurrency": 4,
+        #              "spawn_mode": "zygote", "startup_ms": 7.5,
+        #              "code_source": "bytecode", "code_load_ms": 0.2, "cache_tag": "cpython-311" }
         instance_id = request.data.get('instance_id')
         port = request.data.get('port')
+        max_concurrency = request.data.get('max_concurrency', 1)
+        spawn_mode = request.data.get('spawn_mode') or ''
+        startup_ms = request.data.get('startup_ms')
+        code_source = request.data.get('code_source') or ''
+        code_load_ms = request.data.get('code_load_ms')
+        cache_tag = request.data.get('cache_tag')
 
         if not instance_id or not port:
             raise ValidationError("Missing 'instance_id' or 'port'.")
+        try:
+            max_concurrency = int(max_concurrency)
+        except (TypeError, ValueError):
+            raise ValidationError("'max_concurrency' must be an integer.")
+        if max_concurrency < 1:
+            raise ValidationError("'max_concurrency' must be at least 1.")
+        if spawn_mode not in ('', 'spawn', 'zygote'):
+            raise ValidationError("'spawn_mode' must be 'spawn' or 'zygote'.")
+        if code_source not in ('', 'source', 'bytecode'):
+            raise ValidationError("'code_source' must be 'source' or 'bytecode'.")
+        try:
+            startup_ms = float(startup_ms) if startup_ms is not None else None
+            code_load_ms = float(code_load_ms) if code_load_ms is not None else None
+        except (TypeError, ValueError):
+            raise ValidationError("'startup_ms' and 'code_load_ms' must be numbers.")
 
         try:
-            instance = FunctionInstance.objects.get(id=instance_id)
-            instance.port = port
-            instance.status = 'RUNNING'
-            instance.save()
+            with transaction.atomic():
+                # Only a live instance can be registered: a host that reports in after its
+                # instance was terminated, reaped or marked ERROR must not bring it back.
+                # The UPDATE comes first so a concurrent terminate waits for this (SQLite's
+                # write lock, a row lock elsewhere) instead of being overwritten by it.
+                if not FunctionInstance.objects.filter(id=instance_id, status__in=LIVE_STATUSES).update(
+                        ready_at=timezone.now()):
+                    FunctionInstance.objects.get(id=instance_id)  # DoesNotExist for unknown ids
+                    return Response({"error": "Instance is no longer live."}, status=status.HTTP_409_CONFLICT)
+                instance = FunctionInstance.objects.get(id=instance_id)
+                instance.port = port
+                instance.max_concurrency = max_concurrency
+                instance.spawn_mode = spawn_mode
+                instance.startup_ms = startup_ms
+                instance.code_source = code_source
+                instance.code_load_ms = code_load_ms
+                instance.code_load_saved_ms = self._compile_time_saved(instance, code_source, code_load_ms, cache_tag)
+                if instance.status == 'PENDING':
+                    instance.status = 'RUNNING'
+                instance.save(update_fields=['port', 'max_concurrency', 'spawn_mode', 'startup_ms', 'code_source',
+                                             'code_load_ms', 'code_load_saved_ms', 'status'])
             return Response({"status": "registered"})
-        except FunctionInstance.DoesNotExist:
-            raise ValidationError("Invalid instance_id.")
\ No newline at end of file
+        except (FunctionInstance.DoesNotExist, DjangoValidationError):
+            raise ValidationError("Invalid instance_id.")
+
+    @staticmethod
+    def _compile_time_saved(instance, code_source, code_load_ms, cache_tag):
+        """Deploy-time compile cost minus the bytecode load time, for instances that loaded bytecode."""
+        if code_source != 'bytecode' or code_load_ms is None:
+            return None
+        compile_ms = CompiledCode.objects.filter(
+            deployment_id=instance.deployment_id, cache_tag=cache_tag
+        ).values_list('compile_ms', flat=True).first()
+        if compile_ms is None:
+            return None
+        return max(compile_ms - code_load_ms, 0.0)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+AryaXAI FaaS Platform - Runtime Zygote
+Pre-imports the runtime host and a configurable set of heavy libraries once,
+then forks a fresh runtime host per function instance. A forked child only
+has to load the deployment's own code, so cold starts skip interpreter
+startup and every shared import.
+
+Protocol: one JSON request line per connection on a UNIX socket, answered
+with one JSON line.
+    {"action": "spawn", "instance_id": "...", "user_function_path": "...",
+     "handler": "handle", "port": 9001, "env": {...}, "spawn_time": 1700000000.0}
+        -> {"pid": 1234, "fork_ms": 0.8}
+    {"action": "ping"} -> {"status": "ok", "preloaded": [...], "children": 3}
+"""
+
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+
+# Configuration from Environment Variables
+ZYGOTE_SOCKET_PATH = os.getenv('ZYGOTE_SOCKET_PATH', '/tmp/lw_faas_zygote.sock')
+# Comma-separated modules imported once in the zygote, e.g. "numpy,pandas,requests"
+ZYGOTE_PRELOAD_MODULES = [m.strip() for m in os.getenv('ZYGOTE_PRELOAD_MODULES', '').split(',') if m.strip()]
+
+# Live children forked by this zygote (pid -> instance_id)
+children = {}
+
+
+def preload_modules(module_names):
+    """Import the runtime host and the configured libraries into this process."""
+    preloaded = []
+    for name in ['runtime_host'] + list(module_names):
+        try:
+            importlib.import_module(name)
+            preloaded.append(name)
+        except Exception as e:
+            print(f"WARNING: Could not preload module '{name}': {e}", file=sys.stderr)
+    return preloaded
+
+
+def reap_children(signum=None, frame=None):
+    """Collect exited children so they don't linger as zombies."""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        instance_id = children.pop(pid, None)
+        print(f"Runtime host {pid} (instance {instance_id}) exited.")
+
+
+def run_child(inherited_socks, spec):
+    """Runs in the forked child: become a runtime host for one instance."""
+    for sock in inherited_socks:
+        sock.close()
+    os.setsid()  # Own process group, so the agent can stop it independently
+    for signum in (signal.SIGCHLD, signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+
+    os.environ.update({str(k): str(v) for k, v in (spec.get('env') or {}).items()})
+    os.environ.update({
+        'USER_FUNCTION_PATH': spec['user_function_path'],
+        'FUNCTION_HANDLER_NAME': spec.get('handler') or 'handle',
+        'RUNTIME_HOST_PORT': str(spec['port']),
+        'RUNTIME_SPAWN_MODE': 'zygote',
+        'RUNTIME_SPAWN_TIME': str(spec.get('spawn_time') or time.time()),
+    })
+    if spec.get('instance_id'):
+        os.environ['INSTANCE_ID'] = str(spec['instance_id'])
+    if spec.get('bytecode_path'):
+        os.environ['USER_FUNCTION_BYTECODE_PATH'] = spec['bytecode_path']
+    else:
+        os.environ.pop('USER_FUNCTION_BYTECODE_PATH', None)
+
+    # Re-run the host's module body so it picks up this instance's configuration.
+    # Its imports are already in sys.modules, so this costs well under a millisecond.
+    runtime_host = importlib.reload(sys.modules['runtime_host'])
+    exit_code = 0
+    try:
+        runtime_host.main()
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 0
+    except BaseException as e:
+        print(f"FATAL: Runtime host crashed: {e}", file=sys.stderr)
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def handle_request(server_sock, conn, spec):
+    """Execute one protocol request and return the reply."""
+    action = spec.get('action')
+    if action == 'ping':
+        return {'status': 'ok', 'preloaded': sorted(sys.modules.keys() & set(ZYGOTE_PRELOAD_MODULES)),
+                'children': len(children)}
+    if action != 'spawn':
+        return {'error': f"Unknown action: {action}"}
+    if not spec.get('user_function_path') or not spec.get('port'):
+        return {'error': "Missing 'user_function_path' or 'port'."}
+
+    # Hold SIGCHLD until the child is recorded, so a child that dies instantly
+    # is still reaped and removed from the table.
+    fork_started = time.perf_counter()
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+    try:
+        pid = os.fork()
+        if pid == 0:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+            run_child((server_sock, conn), spec)
+        children[pid] = spec.get('instance_id')
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+    return {'pid': pid, 'fork_ms': round((time.perf_counter() - fork_started) * 1000, 3)}
+
+
+def serve(socket_path):
+    """
+    Accept spawn requests forever. The zygote stays single-threaded so it is
+    always safe to fork.
+    """
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server_sock.bind(socket_path)
+    server_sock.listen(64)
+    print(f"Zygote listening on {socket_path}")
+
+    try:
+        while True:
+            conn, _ = server_sock.accept()
+            with conn:
+                try:
+                    line = conn.makefile('rb').readline()
+                    reply = handle_request(server_sock, conn, json.loads(line or b'{}'))
+                except Exception as e:
+                    reply = {'error': str(e)}
+                conn.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+    finally:
+        server_sock.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def request_spawn(instance_id, user_function_path, port, handler='handle', env=None,
+                  socket_path=ZYGOTE_SOCKET_PATH, timeout=10, bytecode_path=None):
+    """
+    Client helper: ask a running zygote to fork a runtime host.
+    Returns the zygote's reply ({"pid": ..., "fork_ms": ...}) or raises RuntimeError.
+    """
+    spec = {
+        'action': 'spawn',
+        'instance_id': str(instance_id) if instance_id else None,
+        'user_function_path': user_function_path,
+        'bytecode_path': bytecode_path,
+        'handler': handler,
+        'port': port,
+        'env': env or {},
+        'spawn_time': time.time(),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(spec).encode('utf-8') + b'\n')
+        reply = json.loads(sock.makefile('rb').readline() or b'{}')
+    if 'error' in reply or 'pid' not in reply:
+        raise RuntimeError(f"Zygote spawn failed: {reply.get('error', reply)}")
+    return reply
+
+
+def signal_handler(signum, frame):
+    """Handle shutdown signals gracefully."""
+    print(f"\nReceived signal {signum}. Shutting down zygote.")
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGCHLD, reap_children)
+
+    # Make runtime_host importable when the zygote is started from another directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    started = time.perf_counter()
+    preloaded = preload_modules(ZYGOTE_PRELOAD_MODULES)
+    print(f"Preloaded {preloaded} in {(time.perf_counter() - started) * 1000:.1f} ms")
+    serve(ZYGOTE_SOCKET_PATH)